@@ -0,0 +1,56 @@
+import sys
+import time
+import config
+import ZODB.FileStorage
+from blockchain.storage import CompressedStorage, is_body_record, train_dictionary, load_dictionary
+
+# codecs compared, as (name, codec, use the trained dictionary)
+CODEC_RUNS = [("zlib", "zlib", False), ("zlib + dictionary", "zlib", True), ("lzma", "lzma", False)]
+
+def body_records(path):
+    """ Returns the current uncompressed transaction and block records (see is_body_record) of a database file. """
+    storage = ZODB.FileStorage.FileStorage(path, read_only=True)
+    reader = CompressedStorage(storage, dictionary=load_dictionary(config.COMPRESSION_DICTIONARY))
+    try:
+        latest = {}
+        for txn in storage.iterator():
+            for record in txn:
+                if record.data is not None:
+                    latest[record.oid] = reader.decompress(record.data)
+        return [data for data in latest.values() if is_body_record(data)]
+    finally:
+        storage.close()
+
+def measure(records, codec, level, dictionary=None):
+    """ Compresses and decompresses every record as CompressedStorage would.
+
+    Returns:
+        (float, float): Compression ratio, and decode throughput in bytes per second.
+    """
+    storage = CompressedStorage(None, codec, level, dictionary)
+    compressed = [storage.compress(data) for data in records]
+    start = time.perf_counter()
+    decoded = [storage.decompress(data) for data in compressed]
+    elapsed = time.perf_counter() - start
+    if decoded != records:
+        raise ValueError("Records did not survive " + codec)
+    size = sum(len(data) for data in records)
+    return size / sum(len(data) for data in compressed), size / elapsed if elapsed else 0.0
+
+# usage: python benchmark_compression.py [--train PATH]  (reads config.DB_PATH, which must not be open in another
+# process; --train also writes a dictionary trained on its records to PATH, for config.COMPRESSION_DICTIONARY)
+if __name__ == '__main__':
+    records = body_records(config.DB_PATH)
+    if not records:
+        sys.exit("No transaction or block records in " + config.DB_PATH)
+    # train on every other record and measure on all, so the dictionary is not fitted to exactly what it compresses
+    dictionary = train_dictionary(records[::2])
+    if "--train" in sys.argv[1:]:
+        path = sys.argv[sys.argv.index("--train") + 1]
+        with open(path, "wb") as dictionary_file:
+            dictionary_file.write(dictionary)
+        print("Wrote a", len(dictionary), "byte dictionary to", path)
+    print(len(records), "records,", sum(len(data) for data in records), "bytes uncompressed")
+    for name, codec, trained in CODEC_RUNS:
+        ratio, throughput = measure(records, codec, config.COMPRESSION_LEVEL, dictionary if trained else None)
+        print("%-18s ratio %5.2fx  decode %8.1f MB/s" % (name, ratio, throughput / 1e6))
@@ -0,0 +1,33 @@
+import gc
+import sys
+import random
+import tracemalloc
+import blockchain
+from blockchain.differential import random_blocks
+from blockchain.stress import StressBlock
+from blockchain.verdicts import tx_verdicts
+
+def build_chain(count, seed=0):
+    """ Builds an in-memory chain from count random blocks (see blockchain.differential.random_blocks). """
+    chain = blockchain.Blockchain()
+    for block in random_blocks(chain, random.Random(seed), count, StressBlock):
+        pass # (the generator adds the valid ones)
+    return chain
+
+# usage: python benchmark_memory.py [blocks]  (measures memory before building an in-memory chain, with it, and
+# after dropping it, when its interned hash keys go with it; the database is not touched)
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    build_chain(10) # (so modules imported on first use are not counted)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    chain = build_chain(count)
+    with_chain, interned = tracemalloc.get_traced_memory()[0], len(chain._v_interned)
+    blocks = len(chain.blocks)
+    del chain
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    print("before        %8.1f MB" % (before / 2 ** 20))
+    print("with chain    %8.1f MB  (%d blocks, %d interned keys)" % (with_chain / 2 ** 20, blocks, interned))
+    print("after drop    %8.1f MB  (%d verdicts cached)" % (after / 2 ** 20, len(tx_verdicts.entries)))
@@ -0,0 +1,43 @@
+import os
+import sys
+import subprocess
+import config
+
+# statements timed in a fresh interpreter each, from cheapest to the full database open
+STARTUP_STATEMENTS = [
+    ("import blockchain.util", "import blockchain, blockchain.util"),
+    ("import blockchain.chain", "import blockchain.chain"),
+    ("open chain", "import blockchain; blockchain.open_chain()"),
+]
+
+def time_statement(statement, repeat=5, cwd=None):
+    """ Times a statement in fresh interpreters (so nothing is already imported or open) and keeps the best run.
+
+    Args:
+        statement (str): Python code to time.
+        repeat (int, optional): Number of interpreters to start.
+        cwd (str, optional): Directory to run in (config.DB_PATH is relative to it); defaults to this one.
+
+    Returns:
+        (float, :obj:`list` of str): Best time in seconds, and the modules the statement left imported.
+    """
+    program = ("import sys, time\nmodules = set(sys.modules)\nstart = time.perf_counter()\n" + statement + "\n"
+               "print(time.perf_counter() - start)\nprint(' '.join(sorted(set(sys.modules) - modules)))\n")
+    best, imported = None, []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, "-c", program], cwd=cwd or os.path.dirname(os.path.abspath(__file__)),
+                                env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__))),
+                                stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout.splitlines()
+        elapsed = float(output[0])
+        if best is None or elapsed < best:
+            best, imported = elapsed, output[1].split() if len(output) > 1 else []
+    return best, imported
+
+# usage: python benchmark_startup.py [repeat]  (the database must not be open in another process)
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, statement in STARTUP_STATEMENTS:
+        elapsed, imported = time_statement(statement, repeat)
+        heavy = [module for module in ("numpy", "ecdsa", "ZODB", "BTrees") if module in imported]
+        print("%-24s %8.1f ms  (imports %s)" % (name, elapsed * 1000, ", ".join(heavy) or "no heavy modules"))
+    print("FileStorage index:", "saved" if os.path.exists(config.DB_PATH + ".index") else "missing (rebuilt by scanning " + config.DB_PATH + ")")
@@ -0,0 +1,17 @@
+import sys
+import blockchain
+from blockchain.stress import worst_case_blocks, time_validation, bound
+
+# usage: python benchmark_validation.py [depth]  (validates the worst-case blocks of blockchain.stress in memory;
+# the database is not touched)
+if __name__ == '__main__':
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    chain = blockchain.Blockchain()
+    exceeded = False
+    for name, block, inputs in worst_case_blocks(chain, depth):
+        elapsed, verdict = time_validation(chain, block)
+        exceeded = exceeded or elapsed > bound(inputs, depth)
+        print("%-18s %5d inputs %8.1f ms (bound %6.1f ms)  %s" % (name, inputs, elapsed * 1000, bound(inputs, depth) * 1000, verdict[1]))
+    if exceeded:
+        print("Validation exceeded its bound")
+        exit(1)
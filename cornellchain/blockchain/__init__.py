@@ -1,14 +1,120 @@
+import sys
+import types
+import atexit
+import logging
 import config
-from blockchain.chain import Blockchain
-import ZODB, ZODB.FileStorage
-import transaction
-
-# Setup db and make module globals available
-storage = ZODB.FileStorage.FileStorage(config.DB_PATH)
-db = ZODB.DB(storage)
-connection = db.open()
-if not hasattr(connection.root, "blockchain"):
-    connection.root.blockchain = Blockchain()
-    transaction.commit()
-
-chain = connection.root.blockchain
+
+logger = logging.getLogger(__name__)
+
+# Importing the package has no side effects: the database is opened on first use of blockchain.chain,
+# blockchain.db or blockchain.connection (or explicitly by open_chain), and the classes below are only
+# imported when first used, so scripts that just need e.g. blockchain.util start quickly.
+LAZY_CLASSES = {"Blockchain": "blockchain.chain"}
+
+# the open database, connection and chain, see open_chain (empty until then)
+opened = {}
+
+def open_chain(migrate=False):
+    """ Opens the database selected in config (see config.STORAGE) unless already open, creating the chain if the
+    database is new, and returns it.
+
+    FileStorage saves its index when closed (done at exit, see close_chain) and checks it against the data file
+    when opened, so reopening a large database does not rescan it.
+
+    Args:
+        migrate (bool, optional): Upgrade a database stored by an older version in place and pack it (neither can
+            be undone, so this is only done when asked for, by migrate_chain.py).
+
+    Returns:
+        (:obj:`Blockchain`): The chain, also available as blockchain.chain (unless a chain was assigned to
+        blockchain.chain, e.g. by a test, which is then kept and returned).
+
+    Raises:
+        ValueError: If the database holds blocks stored by an older version and migrate is False (or the
+            storage is opened read-only); it is closed again unchanged.
+    """
+    if "connection" in opened:
+        return opened["chain"]
+    import transaction
+    from blockchain.chain import Blockchain
+    from blockchain.storage import Database, open_storage
+    storage = open_storage(config.STORAGE_READ_ONLY)
+    db = Database(storage, cache_size=config.CACHE_SIZE, cache_size_bytes=config.CACHE_SIZE_BYTES)
+    if config.STORAGE_READ_ONLY:
+        # readers (e.g. explorer workers) use the connection from several threads, one at a time, so it gets a
+        # transaction manager of its own, whose begin() moves it to the latest snapshot from any of them
+        connection = db.open(transaction.TransactionManager())
+        # readers leave creating the chain to the writer; until it has, they see an empty chain
+        chain = connection.root.blockchain if hasattr(connection.root, "blockchain") else Blockchain()
+    else:
+        connection = db.open()
+        if not hasattr(connection.root, "blockchain"):
+            connection.root.blockchain = Blockchain()
+            transaction.commit()
+        chain = connection.root.blockchain
+    pending = chain.pending_migrations()
+    if pending and not migrate and not config.STORAGE_READ_ONLY and not chain.blocks:
+        chain.migrate() # nothing to lose in a chain without blocks, so it is upgraded like a new one is created
+        transaction.commit()
+    elif pending and (not migrate or config.STORAGE_READ_ONLY):
+        connection.close()
+        db.close()
+        raise ValueError("The database was stored by an older version (missing " + ", ".join(pending) + "); "
+                         "back it up and run python migrate_chain.py")
+    elif pending:
+        chain.migrate()
+        transaction.commit()
+        if storage.can_pack():
+            db.pack() # drop records the migration orphaned, e.g. per-output records
+        else:
+            logger.warning("Not packing the migrated database: the storage server cannot read compressed records; "
+                           "pack it in \"file\" mode")
+    chain.warm_cache(config.WARM_HEIGHTS)
+    opened.update(db=db, connection=connection)
+    return opened.setdefault("chain", chain)
+
+def close_chain():
+    """ Closes the database opened by open_chain, if open; the next use opens it again, seeing commits made by
+    other processes in the meantime.
+    """
+    connection, db = opened.pop("connection", None), opened.pop("db", None)
+    opened.pop("chain", None)
+    if connection is not None:
+        connection.close()
+    if db is not None:
+        db.close()
+
+atexit.register(close_chain)
+
+class ChainModule(types.ModuleType):
+    """ The blockchain package, whose chain, db and connection attributes open the database on first use. """
+
+    @property
+    def chain(self):
+        return open_chain()
+
+    @chain.setter
+    def chain(self, value):
+        # importing the blockchain.chain submodule binds it to this name as well; the attribute stays the chain
+        if not isinstance(value, types.ModuleType):
+            opened["chain"] = value
+
+    @property
+    def db(self):
+        open_chain()
+        return opened["db"]
+
+    @property
+    def connection(self):
+        open_chain()
+        return opened["connection"]
+
+sys.modules[__name__].__class__ = ChainModule
+
+def __getattr__(name):
+    if name in LAZY_CLASSES:
+        import importlib
+        value = getattr(importlib.import_module(LAZY_CLASSES[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError("module 'blockchain' has no attribute " + repr(name))
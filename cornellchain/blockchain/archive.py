@@ -0,0 +1,87 @@
+import os
+import json
+import zlib
+import persistent
+from BTrees.OOBTree import OOBTree
+from blockchain.outpoint import hash_key
+from blockchain.serialization import block_to_dict, block_from_dict
+
+class ColdArchive(persistent.Persistent):
+
+    def __init__(self, path):
+        """ Blocks moved out of the chain's indexes by Blockchain.prune, kept in an append-only file of
+        zlib-compressed records (one per block, in the wire encoding of blockchain.serialization) so they
+        can still be read back one at a time.
+
+        Only the offsets live in the database; a record is appended before the transaction that indexes it
+        commits, so an aborted prune leaves an unreferenced record behind, never a dangling offset.
+
+        Args:
+            path (str): Path of the archive file (created on first append).
+
+        Attributes:
+            blocks (:obj:`OOBTree` of (bytes to (int, int))): Maps archived block hash keys to the offset and
+                length of their records.
+            transactions (:obj:`OOBTree` of (bytes to bytes)): Maps hash keys of transactions in archived blocks
+                to the hash key of the (last archived) block holding them.
+        """
+        self.path = path
+        self.blocks = OOBTree()
+        self.transactions = OOBTree()
+
+    def __contains__(self, block_hash):
+        key = hash_key(block_hash)
+        return type(key) is bytes and key in self.blocks # (keys that are not hashes cannot be compared with the stored ones)
+
+    def has_transaction(self, tx_hash):
+        """ Returns True iff a transaction is in an archived block. """
+        key = hash_key(tx_hash)
+        return type(key) is bytes and key in self.transactions
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def append(self, block):
+        """ Archives a block (again, if it was archived before) and returns the size of its record in bytes. """
+        record = zlib.compress(json.dumps(block_to_dict(block)).encode())
+        with open(self.path, "ab") as archive_file:
+            offset = archive_file.seek(0, os.SEEK_END)
+            archive_file.write(record)
+        block_key = hash_key(block.hash)
+        self.blocks[block_key] = (offset, len(record))
+        for tx in block.transactions:
+            self.transactions[hash_key(tx.hash)] = block_key
+        return len(record)
+
+    def get_block(self, block_hash):
+        """ Reads an archived block back.
+
+        Raises:
+            KeyError: If the block is not archived.
+        """
+        if block_hash not in self:
+            raise KeyError(block_hash)
+        offset, length = self.blocks[hash_key(block_hash)]
+        with open(self.path, "rb") as archive_file:
+            archive_file.seek(offset)
+            record = archive_file.read(length)
+        return block_from_dict(json.loads(zlib.decompress(record)))
+
+    def get_transaction(self, tx_hash):
+        """ Reads an archived transaction back, from the block holding it.
+
+        Raises:
+            KeyError: If the transaction is not archived.
+        """
+        if not self.has_transaction(tx_hash):
+            raise KeyError(tx_hash)
+        key = hash_key(tx_hash)
+        for tx in self.get_block(self.transactions[key]).transactions:
+            if hash_key(tx.hash) == key:
+                return tx
+        raise KeyError(tx_hash)
+
+    def stats(self):
+        """ Returns the number of archived blocks and transactions, and the size of the archive file, as a dict. """
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {"blocks": len(self.blocks), "transactions": len(self.transactions), "bytes": size}
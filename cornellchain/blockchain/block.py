@@ -1,13 +1,17 @@
 from abc import ABC, abstractmethod # We want to make Block an abstract class; either a PoW or PoA block
-import blockchain
 from blockchain.util import sha256_2_string, encode_as_str
 import time
 import persistent
-from blockchain.util import nonempty_intersection
+from blockchain.outpoint import hash_key
+from blockchain.context import current_chain, using_chain
+from blockchain.verdicts import tx_verdicts, check_inputs, OUT_OF_RANGE
+
+# fields encoded by unsealed_header(); assigning one drops the memoized header strings
+UNSEALED_HEADER_FIELDS = frozenset(["height", "timestamp", "target", "parent_hash", "is_genesis", "merkle"])
 
 class Block(ABC, persistent.Persistent):
 
-    def __init__(self, height, transactions, parent_hash, is_genesis=False):
+    def __init__(self, height, transactions, parent_hash, is_genesis=False, chain=None):
         """ Creates a block template (unsealed).
 
         Args:
@@ -15,6 +19,8 @@ class Block(ABC, persistent.Persistent):
             transactions (:obj:`list` of :obj:`Transaction`): ordered list of transactions in the block.
             parent_hash (str): the hash of the parent block in the blockchain.
             is_genesis (bool, optional): True only if the block is a genesis block.
+            chain (:obj:`Blockchain`, optional): Chain the block will extend, e.g. to look up the parent's target
+                (defaults to the current chain, see blockchain.context).
 
         Attributes:
             parent_hash (str): the hash of the parent block in blockchain.
@@ -31,7 +37,8 @@ class Block(ABC, persistent.Persistent):
         self.height = height
         self.transactions = transactions
         self.timestamp = int(time.time())
-        self.target = self.calculate_appropriate_target()
+        with using_chain(chain):
+            self.target = self.calculate_appropriate_target()
         self.is_genesis = is_genesis
         self.merkle = self.calculate_merkle_root()
         self.seal_data = 0 # temporarily set seal_data to 0
@@ -48,7 +55,7 @@ class Block(ABC, persistent.Persistent):
             str: Merkle hash of the list of transactions in a block, uniquely identifying the list.
         """
         # Placeholder for (1c)
-        all_hashes = [sha256_2_string(str(tx)) for tx in self.transactions]
+        all_hashes = [tx.leaf_hash() for tx in self.transactions]
 
         if len(all_hashes) == 0:
             return ""
@@ -67,21 +74,39 @@ class Block(ABC, persistent.Persistent):
         return new_lst[0]
 
 
+    def __setattr__(self, name, value):
+        # header strings are memoized in volatile attributes (never stored); drop them when a field they encode changes
+        if name in UNSEALED_HEADER_FIELDS:
+            self._v_unsealed_header = self._v_header = None
+        elif name == "seal_data":
+            self._v_header = None
+        persistent.Persistent.__setattr__(self, name, value)
+
     def unsealed_header(self):
         """ Computes the header string of a block (the component that is sealed by mining).
+        Memoized until one of the header fields is assigned, so mining only re-encodes the seal.
 
         Returns:
             str: String representation of the block header without the seal.
         """
-        return encode_as_str([self.height, self.timestamp, self.target, self.parent_hash, self.is_genesis, self.merkle], sep='`')
+        unsealed_header = getattr(self, "_v_unsealed_header", None)
+        if unsealed_header is None:
+            unsealed_header = encode_as_str([self.height, self.timestamp, self.target, self.parent_hash, self.is_genesis, self.merkle], sep='`')
+            self._v_unsealed_header = unsealed_header
+        return unsealed_header
 
     def header(self):
         """ Computes the full header string of a block after mining (includes the seal).
+        Memoized until the seal (see set_seal_data) or another header field is assigned.
 
         Returns:
             str: String representation of the block header.
         """
-        return encode_as_str([self.unsealed_header(), self.seal_data], sep='`')
+        header = getattr(self, "_v_header", None)
+        if header is None:
+            header = encode_as_str([self.unsealed_header(), self.seal_data], sep='`')
+            self._v_header = header
+        return header
 
     def calculate_hash(self):
         """ Get the SHA256^2 hash of the block header.
@@ -109,17 +134,21 @@ class Block(ABC, persistent.Persistent):
         self.seal_data = seal_data
         self.hash = self.calculate_hash()
 
-    def is_valid(self):
+    def is_valid(self, chain=None):
         """ Check whether block is fully valid according to block rules.
 
         Includes checking for no double spend, that all transactions are valid, that all header fields are correctly
         computed, etc.
 
+        Args:
+            chain (:obj:`Blockchain`, optional): Chain to validate against (defaults to the current chain, see
+                blockchain.context); only read, so independent chains can be validated in parallel threads.
+
         Returns:
             bool, str: True if block is valid, False otherwise plus an error or success message.
         """
 
-        chain = blockchain.chain # This object of type Blockchain may be useful
+        chain = current_chain(chain) # This object of type Blockchain may be useful
 
         # Placeholder for (1a)
 
@@ -134,6 +163,28 @@ class Block(ABC, persistent.Persistent):
         if not self.hash == self.calculate_hash():
             return False, "Hash failed to match"
 
+        # the remaining checks depend on the header (which self.hash now identifies, the transactions included through
+        # the Merkle root, up to the count: the tree duplicates an odd last node), the classes implementing the rules and
+        # the chain, which only changes when a block is added; so a block validated again before then, e.g. when
+        # received from several peers, reuses the earlier verdict
+        verdicts = chain.get_block_verdicts()
+        key = (type(self), frozenset(type(tx) for tx in self.transactions), self.hash, len(self.transactions),
+               chain.get_block_log_length())
+        verdict = verdicts.get(key)
+        if verdict is None:
+            verdict = self.check_rules(chain)
+            verdicts.put(key, verdict)
+        return verdict
+
+    def check_rules(self, chain):
+        """ Runs the checks of is_valid that follow the Merkle root and hash checks, without consulting the verdict cache.
+
+        Args:
+            chain (:obj:`Blockchain`): Chain to validate against.
+
+        Returns:
+            bool, str: True if block is valid, False otherwise plus an error or success message.
+        """
         # Check that there are at most 900 transactions in the block [test_rejects_too_many_txs]
         # On failure: return False, "Too many transactions"
         if len(self.transactions) > 900:
@@ -150,12 +201,12 @@ class Block(ABC, persistent.Persistent):
         else:
             # Check that parent exists (you may find chain.blocks helpful) [test_nonexistent_parent]
             # On failure: return False, "Nonexistent parent"
-            if self.parent_hash not in chain.blocks.keys():
+            if self.parent_hash not in chain.headers:
                 return False, "Nonexistent parent"
 
             # Check that height is correct w.r.t. parent height [test_bad_height]
             # On failure: return False, "Invalid height"
-            parent_block = chain.blocks[self.parent_hash]
+            parent_block = chain.headers[self.parent_hash] # header only; the parent's transactions are not needed
             if self.height != (parent_block.height + 1):
                 return False, "Invalid height"
 
@@ -175,71 +226,72 @@ class Block(ABC, persistent.Persistent):
                 if not tx.is_valid():
                     return False, "Malformed transaction included"
 
+            # ancestry is walked over header records at most once, and only if a transaction was included before
+            ancestors = None
+            # whether two transactions of this block spend the same input, computed on first need
+            spends_twice = None
+            # transactions of this block by hash key (the first one wins, as a list search would)
+            block_txs = {}
+            for t in self.transactions:
+                block_txs.setdefault(hash_key(t.hash), t)
+
+            def find_transaction(tx_id):
+                """ Looks up a spent transaction on the chain, or else in this block. """
+                if tx_id in chain.all_transactions:
+                    return chain.get_transaction(tx_id)
+                return block_txs.get(tx_id)
+
             # Check that for every transaction
-            for tx in self.transactions:
-                # the transaction has not already been included on a block on the same blockchain as this block [test_double_tx_inclusion_same_chain]
-                # (or twice in this block; you will have to check this manually) [test_double_tx_inclusion_same_block]
-                # (you may find chain.get_chain_ending_with and chain.blocks_containing_tx and util.nonempty_intersection useful)
-                # On failure: return False, "Double transaction inclusion"
-                
-                # [test_double_tx_inclusion_same_block]
-                tx_hashes = [t.hash for t in self.transactions]
-                if len(set(tx_hashes)) != len(tx_hashes):
-                    return False, "Double transaction inclusion"            
+            # the transaction has not already been included on a block on the same blockchain as this block [test_double_tx_inclusion_same_chain]
+            # (or twice in this block; you will have to check this manually) [test_double_tx_inclusion_same_block]
+            # (you may find chain.get_chain_ending_with and chain.blocks_containing_tx and util.nonempty_intersection useful)
+            # On failure: return False, "Double transaction inclusion"
+
+            # [test_double_tx_inclusion_same_block] (once for the block, not once per transaction)
+            if len(set(t.hash for t in self.transactions)) != len(self.transactions):
+                return False, "Double transaction inclusion"
 
+            for tx in self.transactions:
                 # [test_double_tx_inclusion_same_chain]
-                block = self
-                while block.parent_hash != "genesis":
-                    block = chain.blocks[block.parent_hash]
-                    if tx.hash in [t.hash for t in block.transactions]:
+                including_blocks = chain.blocks_containing_tx.get(tx.hash, []) if chain.has_seen_tx(tx.hash) else []
+                if including_blocks:
+                    if ancestors is None:
+                        ancestors = set(map(hash_key, chain.get_chain_ending_with(self.parent_hash)))
+                    if any(block_key in ancestors for block_key in including_blocks):
                         return False, "Double transaction inclusion"
                 
-                # for every input ref in the tx
-                for input_ref in tx.input_refs:
-                    # (you may find the string split method for parsing the input into its components)
-                    tx_id = input_ref.split(":")[0]
-                    output_idx = int(input_ref.split(":")[1])
-                    # each input_ref is valid (aka corresponding transaction can be looked up in its holding transaction) [test_failed_input_lookup]
-                    # (you may find chain.all_transactions useful here)
-                    # On failure: return False, "Required output not found"
-                    tx_in_same_block = tx_id in tx_hashes
-
-                    if (not tx_in_same_block and tx_id not in chain.all_transactions):
+                # for every input ref in the tx (parsed once per transaction into outpoints)
+                outpoints = tx.get_outpoints()
+                # each input_ref is valid (aka corresponding transaction can be looked up in its holding transaction) [test_failed_input_lookup]
+                # every input was sent to the same user (would normally carry a signature from this user; we leave this out for simplicity) [test_user_consistency]
+                # the sum of the input values is at least the sum of the output values (no money created out of thin air) [test_no_money_creation]
+                # these depend only on the transaction and the outputs it spends, so their verdict is cached by transaction
+                # and reused by every block including it (e.g. sibling forks); see blockchain.verdicts
+                verdict = tx_verdicts.get(tx.leaf_hash())
+                if verdict is None:
+                    verdict, cacheable = check_inputs(tx, outpoints, find_transaction)
+                    if cacheable:
+                        tx_verdicts.put(tx.leaf_hash(), verdict)
+                failed_at, failure = verdict
+                for index, outpoint in enumerate(outpoints):
+                    tx_id = outpoint.tx_hash
+                    # (the cached verdict may come from another chain, or from before the spent transaction was pruned)
+                    if tx_id not in block_txs and tx_id not in chain.all_transactions:
                         return False, "Required output not found"
-                    else:
-                        """
-                        find target transaction.
-                        - from previous block: `chain.all_transactions[tx_id]`
-                        - from the same block: `[t for t in self.transactions if t.hash == tx_id][0]`
-                        """
-                        if tx_id not in chain.all_transactions.keys():
-                            target_transaction = [t for t in self.transactions if t.hash == tx_id][0]
-                        else:
-                            target_transaction = chain.all_transactions[tx_id]
-                        # output_idx overflow:
-                        output_idx_overflow = (output_idx + 1) > len(target_transaction.outputs)
-                        if output_idx_overflow:
-                            return False, "Required output not found"
-                    # every input was sent to the same user (would normally carry a signature from this user; we leave this out for simplicity) [test_user_consistency]
-                    # On failure: return False, "User inconsistencies"
-                    previous_output_transaction = target_transaction.outputs[output_idx]
-                    this_input_name = previous_output_transaction.receiver
-                    this_outputs_names = set([t.sender for t in tx.outputs])
-                    if this_input_name not in this_outputs_names or len(this_outputs_names) > 1:
-                        return False, "User inconsistencies"
-                    this_inputs_names = set([target_transaction.outputs[out_id].receiver for out_id in map(lambda x: int(x.split(":")[1]), tx.input_refs)])
-                    if len(this_inputs_names) > 1:
-                        return False, "User inconsistencies"
+                    if index == failed_at:
+                        if failure == OUT_OF_RANGE:
+                            raise IndexError(failure)
+                        return False, failure
 
                     # no input_ref has been spent in a previous block on this chain [test_doublespent_input_same_chain]
                     # (or in this block; you will have to check this manually) [test_doublespent_input_same_block]
                     # (you may find nonempty_intersection and chain.blocks_spending_input helpful here)
                     # On failure: return False, "Double-spent input"
-                    if input_ref in chain.blocks_spending_input:
+                    if chain.is_spent(outpoint):
                         """
                         double spend on same chain.
                         """
-                        having_this_tx_blocks = list(map(lambda x: chain.blocks[x], chain.blocks_spending_input[input_ref]))
+                        having_this_tx_blocks = list(map(lambda x: chain.headers[x], chain.blocks_spending_input[outpoint]))
                         max_height = max(map(lambda x: x.height, having_this_tx_blocks))
                         if self.height > max_height:
                             return False, "Double-spent input"
@@ -247,53 +299,47 @@ class Block(ABC, persistent.Persistent):
                         """
                         double spend on same block.
                         """
-                        init_input_ref = []
-                        for i in self.transactions:
-                            if nonempty_intersection(init_input_ref, i.input_refs):
-                                return False, "Double-spent input"
-                            else:
-                                init_input_ref.extend(i.input_refs)
+                        if spends_twice is None:
+                            spends_twice = self.spends_input_twice()
+                        if spends_twice:
+                            return False, "Double-spent input"
 
                     # each input_ref points to a transaction on the same blockchain as this block [test_input_txs_on_chain]
                     # (or in this block; you will have to check this manually) [test_input_txs_in_block]
                     # (you may find chain.blocks_containing_tx.get and nonempty_intersection as above helpful)
                     # On failure: return False, "Input transaction not found"
-                    if tx_id in list(map(lambda x: x.hash, self.transactions)):
+                    if tx_id in block_txs:
                         pass
-                    elif tx_id in chain.all_transactions.keys():
+                    elif tx_id in chain.all_transactions:
                         """
                         test_input_txs_on_chain
                         """
-                        contain_this_tx_blocks = list(map(lambda x: chain.blocks[x], chain.blocks_containing_tx[tx_id]))
+                        contain_this_tx_blocks = list(map(lambda x: chain.headers[x], chain.blocks_containing_tx[tx_id]))
                         max_height = max(map(lambda x: x.height, contain_this_tx_blocks))
                         if self.height <= max_height:
                             return False, "Input transaction not found"
 
-
-                # for every output in the tx
-                    # every output was sent from the same user (would normally carry a signature from this user; we leave this out for simplicity)
-                    # (this MUST be the same user as the outputs are locked to above) [test_user_consistency]
-                    # On failure: return False, "User inconsistencies"
-                # the sum of the input values is at least the sum of the output values (no money created out of thin air) [test_no_money_creation]
-                # On failure: return False, "Creating money"
-                for input_ref in tx.input_refs:
-                    tx_id = input_ref.split(":")[0]
-                    output_idx = int(input_ref.split(":")[1])
-                    if tx_id not in chain.all_transactions.keys():
-                        target_transaction = [t for t in self.transactions if t.hash == tx_id][0]
-                    else:
-                        target_transaction = chain.all_transactions[tx_id]
-                    previous_output_transaction = target_transaction.outputs[output_idx]
-                    sender_name = previous_output_transaction.receiver
-                    money_upper_bound = previous_output_transaction.amount
-                    current_transaction_outputs = tx.outputs
-                    if sum(map(lambda x: x.amount if x.sender == sender_name else 0, current_transaction_outputs)) > money_upper_bound:
-                        return False, "Creating money"
+                if failed_at == len(outpoints):
+                    return False, failure
 
 
         return True, "All checks passed"
 
 
+    def spends_input_twice(self):
+        """ Checks whether a transaction of this block spends an input already spent by an earlier one, in one pass.
+
+        Returns:
+            bool: True if some input_ref is spent by two transactions of the block.
+        """
+        spent = set()
+        for tx in self.transactions:
+            input_refs = set(tx.input_refs)
+            if not spent.isdisjoint(input_refs):
+                return True
+            spent |= input_refs
+        return False
+
     # ( these just establish methods for subclasses to implement; no need to modify )
     @abstractmethod
     def get_weight(self):
@@ -0,0 +1,76 @@
+import math
+
+class BloomFilter(object):
+
+    def __init__(self, capacity, error_rate=0.01):
+        """ Set membership filter with no false negatives: a key that was added is always reported as maybe
+        present, and a key that was not is reported absent with probability 1 - error_rate (while at most
+        capacity keys are added), so lookups of absent keys can skip the index they would miss in.
+
+        Probe positions come from the key's built-in hash, which is only stable within one process, so
+        filters are volatile and rebuilt from the indexes they front (see Blockchain.get_filters).
+
+        Args:
+            capacity (int): Number of keys the filter is sized for.
+            error_rate (float, optional): False-positive rate at capacity.
+
+        Attributes:
+            size (int): Number of bits.
+            probes (int): Number of bits set (and checked) per key.
+            count (int): Keys added.
+            checks (int): Lookups made through might_contain.
+            negatives (int): Lookups answered "absent" (index lookups saved).
+            false_positives (int): Lookups answered "maybe" for keys the index did not have, as reported
+                by the caller through record_false_positive.
+        """
+        self.capacity = max(int(capacity), 1)
+        self.error_rate = error_rate
+        # optimal sizes for n keys at rate p: m = -n ln p / (ln 2)^2 bits and k = (m / n) ln 2 probes
+        self.size = max(int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)), 64)
+        self.probes = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+        self.checks = 0
+        self.negatives = 0
+        self.false_positives = 0
+
+    def positions(self, key):
+        """ Returns the bit positions of a key (double hashing: two 32-bit halves of its 64-bit hash). """
+        value = hash(key) & 0xFFFFFFFFFFFFFFFF
+        first, step = value & 0xFFFFFFFF, (value >> 32) | 1
+        return [(first + i * step) % self.size for i in range(self.probes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def might_contain(self, key):
+        """ Returns False if key was never added, True if it may have been. """
+        self.checks += 1
+        value = hash(key) & 0xFFFFFFFFFFFFFFFF
+        position, step, size, bits = value & 0xFFFFFFFF, (value >> 32) | 1, self.size, self.bits
+        for i in range(self.probes):
+            position %= size
+            if not bits[position >> 3] & (1 << (position & 7)):
+                self.negatives += 1
+                return False
+            position += step
+        return True
+
+    def record_false_positive(self):
+        """ Counts a might_contain answer of True for a key the index then did not have. """
+        self.false_positives += 1
+
+    def is_full(self):
+        """ Returns True once more keys were added than the filter is sized for (its error rate then grows). """
+        return self.count > self.capacity
+
+    def stats(self):
+        """ Returns the counters, the observed false-positive rate among lookups of absent keys, and the
+        sizing, as a dict.
+        """
+        absent = self.negatives + self.false_positives
+        return {"keys": self.count, "capacity": self.capacity, "bytes": len(self.bits), "probes": self.probes,
+                "checks": self.checks, "saved_lookups": self.negatives, "false_positives": self.false_positives,
+                "false_positive_rate": self.false_positives / absent if absent else 0.0}
@@ -0,0 +1,99 @@
+import collections
+import threading
+
+def ghostify(obj):
+    """ Turns a loaded, unmodified ZODB object back into a ghost, releasing its state until next access.
+    Objects that are not stored in a database, already ghosts, or have unsaved changes are left alone.
+    """
+    if getattr(obj, "_p_jar", None) is not None and obj._p_changed is False:
+        obj._p_deactivate()
+
+def ghostify_transaction(tx):
+    """ Ghosts a transaction (its outputs are stored inline and go with it). """
+    ghostify(tx)
+
+def ghostify_block(block):
+    """ Ghosts a block and its transactions. """
+    if getattr(block, "_p_changed", False) is None:
+        return
+    for tx in block.transactions:
+        ghostify_transaction(tx)
+    ghostify(block)
+
+class BlockCache(object):
+
+    def __init__(self, max_blocks, max_transactions):
+        """ Least-recently-used set of loaded blocks and transactions; cold entries are ghosted to bound memory.
+        Safe to use from several threads reading the same chain.
+
+        Args:
+            max_blocks (int): Maximum number of full blocks kept loaded.
+            max_transactions (int): Maximum number of transactions kept loaded, counting those inside loaded blocks.
+
+        Attributes:
+            hits (int): Accesses to entries that were already loaded.
+            misses (int): Accesses that had to load an entry.
+            evictions (int): Entries ghosted to stay within budget.
+        """
+        self.max_blocks = max_blocks
+        self.max_transactions = max_transactions
+        self.entries = collections.OrderedDict() # key -> (object, number of transactions it holds)
+        self.loaded_blocks = 0
+        self.loaded_transactions = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def access(self, key, obj, is_block):
+        """ Records an access to a block or transaction, evicting the coldest entries if over budget.
+
+        Args:
+            key (str): Hash of the block or transaction.
+            obj (:obj:`Block` or :obj:`Transaction`): The object being accessed.
+            is_block (bool): True for blocks, False for standalone transactions.
+
+        Returns:
+            The accessed object.
+        """
+        key = ("block" if is_block else "tx", key)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return obj
+            self.misses += 1
+            cost = len(obj.transactions) if is_block else 1
+            self.entries[key] = (obj, cost)
+            self.loaded_blocks += 1 if is_block else 0
+            self.loaded_transactions += cost
+            self._evict()
+        return obj
+
+    def _evict(self):
+        while len(self.entries) > 1 and (self.loaded_blocks > self.max_blocks or self.loaded_transactions > self.max_transactions):
+            (kind, key), (obj, cost) = self.entries.popitem(last=False)
+            if kind == "block":
+                self.loaded_blocks -= 1
+                ghostify_block(obj)
+            else:
+                ghostify_transaction(obj)
+            self.loaded_transactions -= cost
+            self.evictions += 1
+
+    def clear(self):
+        """ Ghosts every tracked entry. """
+        with self.lock:
+            while self.entries:
+                (kind, key), (obj, cost) = self.entries.popitem(last=False)
+                if kind == "block":
+                    ghostify_block(obj)
+                else:
+                    ghostify_transaction(obj)
+            self.loaded_blocks = 0
+            self.loaded_transactions = 0
+
+    def stats(self):
+        """ Returns hit/miss/eviction counters and current occupancy as a dict. """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "loaded_blocks": self.loaded_blocks, "loaded_transactions": self.loaded_transactions}
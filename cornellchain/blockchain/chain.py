@@ -1,26 +1,63 @@
 import os
+import sys
 import config
-import blockchain
 from blockchain.util import encode_as_str
+from blockchain.header import BlockHeader
+from blockchain.transaction import LegacyTransactionOutput
+from blockchain.cache import BlockCache
+from blockchain.verdicts import VerdictCache, tx_verdicts
+from blockchain.utxo_index import UtxoIndex, utxo_refs
+from blockchain.archive import ColdArchive
+from blockchain.bloom import BloomFilter
+from blockchain.outpoint import HashIndex, OutPointIndex, OutPoint, hash_key, hash_hex
+import logging
 import transaction, persistent
+from BTrees.OOBTree import OOBTree
+from BTrees.IOBTree import IOBTree
+
+logger = logging.getLogger(__name__)
 
 class Blockchain(persistent.Persistent):
 
+    archive = None # for chains stored before pruning, which are created on first prune
+    pruned_height = -1
+
     def __init__(self):
         """ Create a new Blockchain object; we store 1 globally in the database.
 
+        Hashes are stored inside the indexes as 32-byte keys (see blockchain.outpoint), interned per chain so they
+        are shared between indexes (see intern_hash); every index still accepts hex hashes (and input_ref strings)
+        for lookups, and the get_* methods below return hex hashes.
+
         Attributes:
-            chain (:obj:`dict` of (int to (:obj:`list` of str))): Maps integer chain heights to list of block hashes at that height in the DB (as strings).
-            blocks (:obj:`dict` of (str to (:obj:`Block`))): Maps blockhashes to their corresponding Block objects in the DB.
-            blocks_spending_input (:obj:`dict` of (str to (:obj:`list` of str))): Maps input references as strings to all blocks in the DB that spent them as list of their hashes.
-            blocks_containing_tx (:obj:`dict` of (str to (:obj:`list` of str))): Maps transaction hashes to all blocks in the DB that spent them as list of their hashes.
-            all_transactions (:obj:`dict` of (str to :obj:`Transaction`)): Maps transaction hashes to their corresponding Transaction objects.
+            chain (:obj:`dict` of (int to (:obj:`list` of bytes))): Maps integer chain heights to list of block hash keys at that height in the DB.
+            blocks (:obj:`HashIndex` of (bytes to (:obj:`Block`))): Maps blockhashes to their corresponding Block objects in the DB.
+            headers (:obj:`HashIndex` of (bytes to (:obj:`BlockHeader`))): Maps blockhashes to header-only records of their blocks;
+                everything that walks the chain uses these, so full blocks are only loaded when transactions are needed.
+            blocks_spending_input (:obj:`OutPointIndex` of (:obj:`OutPoint` to (:obj:`list` of bytes))): Maps spent outputs to all blocks in the DB that spent them as list of their hash keys.
+            blocks_containing_tx (:obj:`HashIndex` of (bytes to (:obj:`list` of bytes))): Maps transaction hashes to all blocks in the DB that contain them as list of their hash keys.
+            all_transactions (:obj:`HashIndex` of (bytes to :obj:`Transaction`)): Maps transaction hashes to their corresponding Transaction objects.
+            inline_outputs (bool): True once every transaction output is stored inline in its transaction (see migrate_outputs).
+            total_weights_stored (bool): True once every header record carries its total weight (see store_total_weights).
+            utxos (:obj:`UtxoIndex`): Unspent outputs and balances per user on the heaviest chain, kept up to date by add_block.
+            hash_index (:obj:`OOBTree` of (bytes to str)): Every block and transaction hash key, sorted, mapped to "block" or "tx";
+                backs prefix search (see search_hashes).
+            block_log (:obj:`IOBTree` of (int to bytes)): Hash keys of all blocks in the order they were added, by sequence number,
+                so readers can ask for the blocks added since they last looked (see get_blocks_added_since).
+            archive (:obj:`ColdArchive`): Blocks moved out of the indexes above by prune (None until the first prune).
+            pruned_height (int): Height up to which best-chain block bodies have been archived by prune (-1 if none).
         """
         self.chain = {}
-        self.blocks = {}
-        self.blocks_spending_input = {}
-        self.blocks_containing_tx = {}
-        self.all_transactions = {}
+        self.blocks = HashIndex()
+        self.headers = HashIndex()
+        self.blocks_spending_input = OutPointIndex()
+        self.blocks_containing_tx = HashIndex()
+        self.all_transactions = HashIndex()
+        self.inline_outputs = True
+        self.total_weights_stored = True
+        self.utxos = UtxoIndex()
+        self.hash_index = OOBTree()
+        self.block_log = IOBTree()
 
     def add_block(self, block, save=True):
         """ Adds a block to the blockchain; the block must be valid according to all block rules.
@@ -30,33 +67,86 @@ class Blockchain(persistent.Persistent):
             save (bool, optional): Whether to commit changes to database (defaults to True)
 
         Returns:
-            bool: True on success, False otherwise.
+            bool: True on success, False otherwise (also when validation raises, which is logged).
         """
-        if block.hash in self.blocks:
+        if block.hash in self.headers: # (not self.blocks, which loses best-chain blocks whose bodies were pruned)
             return False
-        if not block.is_valid()[0]:
+        try:
+            if config.DIFFERENTIAL_SAMPLE_RATE > 0:
+                from blockchain.differential import validator # differential mode: also check against the reference
+                valid = validator.is_valid(block, self)[0]
+            else:
+                valid = block.is_valid(self)[0]
+        except (IndexError, ValueError, KeyError) as error:
+            # (the rules raise on some malformed input references, like the reference validator does)
+            logger.info("Rejected block %s: validation raised %r", block.hash, error)
             return False
+        if not valid:
+            return False
+        block_key = self.intern_hash(block.hash)
         if not block.height in self.chain:
             self.chain[block.height] = []
-        if not block.hash in self.chain[block.height]:
+        if not block_key in self.chain[block.height]:
             # add newer blocks to front so they show up first in UI
-            self.chain[block.height] = [block.hash] + self.chain[block.height]
-        if not block.hash in self.blocks:
-            self.blocks[block.hash] = block
+            self.chain[block.height] = [block_key] + self.chain[block.height]
+        if not block_key in self.headers:
+            self.blocks[block_key] = block
+            header = self.headers[block_key] = BlockHeader.from_block(block)
+            if block.is_genesis:
+                header.total_weight = header.get_weight()
+            elif block.parent_hash in self.headers:
+                header.total_weight = self.get_total_weight(block.parent_hash) + header.get_weight()
+            self.hash_index[block_key] = "block"
+            self.block_log[self.get_block_log_length()] = block_key
+            dense = getattr(self, "_v_dense", None)
+            if dense is not None:
+                if block.is_genesis or block.parent_hash in dense.ids:
+                    dense.add(block_key, self.headers[block_key], len(block.transactions))
+                else:
+                    self._v_dense = None # parent unknown; rebuilt (and the problem reported) on next use
         for tx in block.transactions:
-            self.all_transactions[tx.hash] = tx
-            if not tx.hash in self.blocks_containing_tx:
-                self.blocks_containing_tx[tx.hash] = []
-            self.blocks_containing_tx[tx.hash].append(block.hash)
-            for input_ref in tx.input_refs:
-                if not input_ref in self.blocks_spending_input:
-                    self.blocks_spending_input[input_ref] = []
-                self.blocks_spending_input[input_ref].append(block.hash)
+            tx_key = self.intern_hash(tx.hash)
+            self.all_transactions[tx_key] = tx
+            self.blocks_containing_tx.setdefault(tx_key, []).append(block_key)
+            self.hash_index[tx_key] = "tx"
+            for outpoint in tx.get_outpoints():
+                self.add_spender(outpoint, block_key)
+        filters = getattr(self, "_v_filters", None)
+        if filters is not None:
+            for tx in block.transactions:
+                filters["transactions"].add(hash_key(tx.hash))
+                for outpoint in tx.get_outpoints():
+                    filters["spent"].add(outpoint)
+        self.utxos.update(self, self.get_heaviest_chain_tip_hash())
+        if config.PRUNE_DEPTH > 0 and self.get_block_log_length() % config.PRUNE_INTERVAL == 0:
+            self.prune()
         self._p_changed = True # Marked object as changed so changes get saved to ZODB.
         if save:
             transaction.commit() # If we're going to save the block, commit the transaction.
         return True
 
+    def intern_hash(self, hex_hash):
+        """ Like outpoint.hash_key, but returns this chain's one shared instance of the key; use when storing a key.
+        The table is volatile, so it goes away with the chain (or when ZODB reloads it, after which keys are
+        shared again from then on).
+        """
+        key = hash_key(hex_hash)
+        if type(key) is str:
+            return sys.intern(key)
+        interned = getattr(self, "_v_interned", None)
+        if interned is None:
+            interned = self._v_interned = {}
+        return interned.setdefault(key, key)
+
+    def add_spender(self, outpoint, block_key):
+        """ Records in blocks_spending_input that a block spends an output; a new entry is keyed by an outpoint
+        holding the interned transaction hash.
+        """
+        spending = self.blocks_spending_input.get(outpoint)
+        if spending is None:
+            spending = self.blocks_spending_input[OutPoint(self.intern_hash(outpoint.tx_hash), outpoint.index)] = []
+        spending.append(block_key)
+
     def get_heights_with_blocks(self):
         """ Return all heights in the blockchain that contain blocks.
 
@@ -76,7 +166,99 @@ class Blockchain(persistent.Persistent):
         Returns:
             (:obj:`list` of str): list of blockhashes at given height
         """
-        return self.chain[height]
+        return [hash_hex(block_key) for block_key in self.chain[height]]
+
+    def get_blocks_containing_tx(self, tx_hash):
+        """ Return the hashes of all blocks in the DB that contain a transaction.
+
+        Args:
+            tx_hash (str): Hash of the transaction.
+
+        Returns:
+            (:obj:`list` of str): list of blockhashes, oldest first (empty if the transaction is unknown).
+        """
+        return [hash_hex(block_key) for block_key in self.blocks_containing_tx.get(tx_hash, [])]
+
+    def has_seen_tx(self, tx_hash):
+        """ Returns True iff a block in the DB (on any fork) contains a transaction, i.e. it is a key of
+        blocks_containing_tx; with config.BLOOM_FILTERS, definite negatives are answered by a filter (see
+        get_filters) without touching the index.
+
+        Args:
+            tx_hash (str): Hash of the transaction.
+        """
+        if not config.BLOOM_FILTERS:
+            return tx_hash in self.blocks_containing_tx
+        return self.filtered_lookup("transactions", self.blocks_containing_tx, hash_key(tx_hash))
+
+    def is_spent(self, input_ref):
+        """ Returns True iff a block in the DB (on any fork) spends an output, i.e. it is a key of
+        blocks_spending_input; filtered like has_seen_tx.
+
+        Args:
+            input_ref (str or :obj:`OutPoint`): The output, as "tx_hash:index" or parsed.
+        """
+        if not config.BLOOM_FILTERS:
+            return input_ref in self.blocks_spending_input
+        return self.filtered_lookup("spent", self.blocks_spending_input, OutPoint.parse(input_ref))
+
+    def filtered_lookup(self, name, index, key):
+        """ Looks a normalized key up in index behind the filter of get_filters()[name], counting false positives. """
+        bloom = self.get_filters()[name]
+        if not bloom.might_contain(key):
+            return False
+        if key in index:
+            return True
+        bloom.record_false_positive()
+        return False
+
+    def get_block_log_length(self):
+        """ Returns the number of blocks added so far, i.e. the sequence number the next block will get. """
+        return self.block_log.maxKey() + 1 if self.block_log else 0
+
+    def get_blocks_added_since(self, sequence):
+        """ Return the blocks added to the DB from a position in block_log on.
+
+        Args:
+            sequence (int): Sequence number of the first block wanted (e.g. an earlier get_block_log_length()).
+
+        Returns:
+            (:obj:`list` of (int, str)): (sequence number, blockhash) pairs in the order the blocks were added.
+        """
+        return [(block_sequence, hash_hex(block_key)) for block_sequence, block_key in self.block_log.items(max(sequence, 0))]
+
+    def search_hashes(self, prefix, limit=20):
+        """ Finds blocks and transactions whose hash starts with a hex prefix, by a range scan of hash_index,
+        so the cost is O(log n + results) however many hashes the chain holds.
+
+        Args:
+            prefix (str): Start of a hex hash (any case).
+            limit (int, optional): Maximum number of results.
+
+        Returns:
+            (:obj:`list` of (str, str)): (kind, hash) pairs in hash order, kind being "block" or "tx";
+            empty if prefix is not hex.
+        """
+        prefix = prefix.lower()
+        if len(prefix) > 64 or any(digit not in "0123456789abcdef" for digit in prefix):
+            return []
+        low = bytes.fromhex((prefix + "0" * 64)[:64])
+        high = bytes.fromhex((prefix + "f" * 64)[:64])
+        results = []
+        for key, kind in self.hash_index.items(low, high):
+            if len(results) == limit:
+                break
+            results.append((kind, hash_hex(key)))
+        return results
+
+    def get_total_weight(self, block_hash):
+        """ Returns the total weight of the chain ending with a block: the one add_block stored in its header record,
+        or for header records stored before that was kept, the sum over the header records of its chain.
+        """
+        total_weight = self.headers[block_hash].total_weight
+        if total_weight is not None:
+            return total_weight
+        return sum(self.headers[ancestor].get_weight() for ancestor in self.get_chain_ending_with(block_hash))
 
     def get_chain_ending_with(self, block_hash):
         """ Return a list of blockhashes in the chain ending with the provided hash, following parent pointers until genesis
@@ -91,14 +273,14 @@ class Blockchain(persistent.Persistent):
         # (hint): you may find the is_genesis flag helpful in this method
         # as well as the self.blocks data structure
         lst = []
-        if block_hash not in self.blocks.keys():
+        if block_hash not in self.headers:
             return []
-        block = self.blocks[block_hash]
-        while not block.is_genesis:
-            lst.append(block.hash)
-            parent_hash = block.parent_hash
-            block = self.blocks[parent_hash]
-        lst.append(block.hash)
+        header = self.headers[block_hash]
+        while not header.is_genesis:
+            lst.append(header.hash)
+            parent_hash = header.parent_hash
+            header = self.headers[parent_hash]
+        lst.append(header.hash)
         # Placeholder for (1a)
         return lst
 
@@ -109,15 +291,8 @@ class Blockchain(persistent.Persistent):
         Returns:
             (obj:`dict` of (str to int)): List mapping every blockhash to its total accumulated weight in the blockchain
         """
-        block_hashes_to_total_weights = {}
-        for height in self.get_heights_with_blocks():
-            for block_hash in self.get_blockhashes_at_height(height):
-                # dynamic programming; store map of blocks to weights and populate in increasing height order
-                block = self.blocks[block_hash]
-                block_hashes_to_total_weights[block_hash] = block.get_weight()
-                if not block.is_genesis:
-                    block_hashes_to_total_weights[block_hash] += block_hashes_to_total_weights[block.parent_hash]
-        return block_hashes_to_total_weights
+        dense = self.get_dense_index()
+        return dict(zip(dense.hashes(range(len(dense))), dense.cumulative_weights().tolist()))
 
     def get_heaviest_chain_tip(self):
         """ Find the chain tip with the most accumulated total work.
@@ -126,18 +301,447 @@ class Blockchain(persistent.Persistent):
         to assume anything about the weight function other than that it will
         return an int.
 
+        Ties go to the lowest height, then to the block added last.
+
         Returns:
             (:obj:`Block`): block with the maximum total weight in db.
         """
+        heaviest_hash = self.get_heaviest_chain_tip_hash()
+        if heaviest_hash is None:
+            return None
+        return self.get_block(heaviest_hash) # only the winning block is loaded in full
+
+    def get_heaviest_chain_tip_hash(self):
+        """ Like get_heaviest_chain_tip, but returns only the hash of the tip (None for an empty chain) without loading it. """
+        dense = self.get_dense_index()
+        heaviest_id = dense.heaviest_tip()
+        return None if heaviest_id is None else hash_hex(dense.keys[heaviest_id])
+
+    def get_indexed_tip_hash(self):
+        """ Returns the hash of the heaviest chain tip as of the last add_block, i.e. the tip utxos is at (None for an
+        empty chain). Unlike get_heaviest_chain_tip_hash, this reads a stored field instead of building the dense
+        index, so readers that open the chain for each request (e.g. the explorer) can afford it.
+        """
+        return None if self.utxos.tip is None else hash_hex(self.utxos.tip)
+
+    def is_on_best_chain(self, block_hash):
+        """ Returns True iff a block is on the chain ending in get_indexed_tip_hash(), by one lookup in utxos.heights. """
+        header = self.headers.get(block_hash)
+        return header is not None and self.utxos.heights.get(header.height) == hash_key(block_hash)
+
+    def get_balance(self, user):
+        """ Returns the total amount of a user's unspent outputs on the heaviest chain. """
+        return self.utxos.get_balance(user)
+
+    def get_user_utxos(self, user, tip_hash=None):
+        """ Returns a user's unspent outputs on the heaviest chain, or on the chain ending in tip_hash.
+
+        Args:
+            user (str): The user.
+            tip_hash (str, optional): Tip of the chain to query; defaults to the heaviest chain.
+
+        Returns:
+            (:obj:`list` of (str, int)): (input_ref, amount) pairs, input_ref being "tx_hash:output_index".
+        """
+        return utxo_refs(self.utxos.get_utxos(self, user, tip_hash))
+
+    def get_dense_index(self):
+        """ Returns the NumPy column index over all blocks (see blockchain.dense_index), building it from the
+        header records on first use. The index is volatile: it is kept up to date by add_block and dropped
+        whenever ZODB reloads this object, e.g. after another process commits.
+
+        Returns:
+            (:obj:`DenseIndex`): The index for this chain.
+        """
+        dense = getattr(self, "_v_dense", None)
+        if dense is None:
+            from blockchain.dense_index import DenseIndex # deferred: NumPy is slow to import and most scripts never need it
+            dense = DenseIndex.from_chain(self)
+            self._v_dense = dense
+        return dense
+
+    def pending_migrations(self):
+        """ Returns what migrate would bring up to date, without changing anything.
+
+        Returns:
+            (:obj:`list` of str): Names of the missing parts; empty if the chain is up to date.
+        """
+        pending = [("header records", not hasattr(self, "headers")),
+                   ("binary-keyed indexes", not isinstance(self.blocks, HashIndex)),
+                   ("inline outputs", not getattr(self, "inline_outputs", False)),
+                   ("total weights", not getattr(self, "total_weights_stored", False)),
+                   ("user UTXO index", not hasattr(self, "utxos")),
+                   ("best-chain heights", not hasattr(getattr(self, "utxos", None), "heights")),
+                   ("hash search index", not hasattr(self, "hash_index")),
+                   ("block log", not hasattr(self, "block_log"))]
+        return [name for name, missing in pending if missing]
+
+    def migrate(self):
+        """ Brings a Blockchain stored by an older version up to date (header records, binary-keyed indexes, inline outputs,
+        total weights, user UTXO index and its best-chain heights, hash search index, block log).
+
+        Returns:
+            bool: True if anything changed and should be committed.
+        """
+        changed = False
+        if not hasattr(self, "headers"):
+            self.build_headers()
+            changed = True
+        if not isinstance(self.blocks, HashIndex):
+            self.rebuild_indexes()
+            changed = True
+        if not getattr(self, "inline_outputs", False):
+            self.migrate_outputs()
+            changed = True
+        if not getattr(self, "total_weights_stored", False):
+            self.store_total_weights()
+            changed = True
+        if not hasattr(self, "utxos"):
+            self.utxos = UtxoIndex()
+            self.utxos.update(self, self.get_heaviest_chain_tip_hash())
+            changed = True
+        if not hasattr(self.utxos, "heights"):
+            self.utxos.build_heights(self)
+            changed = True
+        if not hasattr(self, "hash_index"):
+            self.build_hash_index()
+            changed = True
+        if not hasattr(self, "block_log"):
+            # the order blocks were added in was not recorded; oldest first within each height is the best guess
+            self.block_log = IOBTree()
+            for height in self.get_heights_with_blocks():
+                for block_key in reversed(self.chain[height]):
+                    self.block_log[self.get_block_log_length()] = block_key
+            changed = True
+        return changed
+
+    def build_hash_index(self):
+        """ (Re)builds hash_index from the block and transaction indexes.
+
+        Returns:
+            int: Number of hashes indexed.
+        """
+        self.hash_index = OOBTree()
+        for block_key in self.blocks:
+            self.hash_index[block_key] = "block"
+        for tx_key in self.all_transactions:
+            self.hash_index[tx_key] = "tx"
+        return len(self.hash_index)
+
+    def rebuild_indexes(self):
+        """ Rebuilds every index from self.blocks, keyed by interned binary hashes and :obj:`OutPoint` objects.
+        Used to migrate chains stored with hex-string keys; block order within each height is preserved.
+        """
+        old_chain, old_blocks, old_headers = self.chain, self.blocks, getattr(self, "headers", {})
+        self.chain = {}
+        self.blocks = HashIndex()
+        self.headers = HashIndex()
+        self.blocks_spending_input = OutPointIndex()
+        self.blocks_containing_tx = HashIndex()
+        self.all_transactions = HashIndex()
+        for height in sorted(old_chain):
+            block_keys = [self.intern_hash(block_hash) for block_hash in old_chain[height]]
+            self.chain[height] = block_keys
+            # re-index oldest first, so every per-key list keeps its original order
+            for block_hash in reversed(old_chain[height]):
+                block = old_blocks[block_hash]
+                block_key = self.intern_hash(block_hash)
+                self.blocks[block_key] = block
+                self.headers[block_key] = old_headers[block_hash] if block_hash in old_headers else BlockHeader.from_block(block)
+                for tx in block.transactions:
+                    tx_key = self.intern_hash(tx.hash)
+                    self.all_transactions[tx_key] = tx
+                    self.blocks_containing_tx.setdefault(tx_key, []).append(block_key)
+                    for outpoint in tx.get_outpoints():
+                        self.add_spender(outpoint, block_key)
+        self._v_filters = None
+        self._p_changed = True
+
+    def migrate_outputs(self):
+        """ Replaces outputs stored as separate database records (:obj:`LegacyTransactionOutput`) with inline
+        :obj:`TransactionOutput` tuples; hashes are unchanged since both have the same representation.
+        The old records are only removed from disk once the database is packed.
+
+        Returns:
+            int: Number of transactions rewritten.
+        """
+        rewritten = 0
+        for block in self.blocks.values():
+            for tx in block.transactions:
+                if any(isinstance(output, LegacyTransactionOutput) for output in tx.outputs):
+                    tx.outputs = [output.to_output() if isinstance(output, LegacyTransactionOutput) else output for output in tx.outputs]
+                    rewritten += 1
+        self.inline_outputs = True
+        return rewritten
+
+    def get_cache(self):
+        """ Returns the LRU cache bounding how many full blocks and transactions this process keeps loaded.
+        The cache is volatile (never stored in the database) and sized from config.MAX_LOADED_BLOCKS and
+        config.MAX_LOADED_TRANSACTIONS.
+
+        Returns:
+            (:obj:`BlockCache`): The cache for this chain.
+        """
+        cache = getattr(self, "_v_cache", None)
+        if cache is None:
+            cache = BlockCache(config.MAX_LOADED_BLOCKS, config.MAX_LOADED_TRANSACTIONS)
+            self._v_cache = cache
+        return cache
+
+    def get_block_verdicts(self):
+        """ Returns the cache of block validation verdicts for this chain (see Block.is_valid), volatile like
+        get_cache and sized from config.BLOCK_VERDICT_CACHE_SIZE.
+
+        Returns:
+            (:obj:`VerdictCache`): The cache for this chain.
+        """
+        verdicts = getattr(self, "_v_verdicts", None)
+        if verdicts is None:
+            verdicts = VerdictCache(config.BLOCK_VERDICT_CACHE_SIZE)
+            self._v_verdicts = verdicts
+        return verdicts
+
+    def get_filters(self):
+        """ Returns the Bloom filters over the keys of blocks_containing_tx ("transactions") and
+        blocks_spending_input ("spent") used by has_seen_tx and is_spent, as a dict. They are volatile like
+        get_cache: built from the indexes on first use, sized config.BLOOM_HEADROOM times the index (at least
+        config.BLOOM_MIN_KEYS keys) for config.BLOOM_ERROR_RATE, and kept up to date by add_block. A filter
+        is rebuilt, keeping its counters, once it holds more keys than it was sized for; prune drops them,
+        since keys cannot be removed from a Bloom filter.
+
+        Returns:
+            (:obj:`dict` of (str to :obj:`BloomFilter`)): The filters for this chain.
+        """
+        filters = getattr(self, "_v_filters", None)
+        if filters is None or any(bloom.is_full() for bloom in filters.values()):
+            previous = filters or {}
+            filters = {"transactions": self.build_filter(self.blocks_containing_tx, previous.get("transactions")),
+                       "spent": self.build_filter(self.blocks_spending_input, previous.get("spent"))}
+            self._v_filters = filters
+        return filters
 
-        block_hashes_to_total_weights = self.get_all_block_weights()
-        heaviest_block = None
-        for block_hash in block_hashes_to_total_weights:
-            block = self.blocks[block_hash]
-            weight_in_block = block_hashes_to_total_weights[block_hash]
-            if heaviest_block == None or weight_in_block > heaviest_weight:
-                heaviest_block = block
-                heaviest_weight = weight_in_block
+    def build_filter(self, index, previous=None):
+        """ Builds a Bloom filter over an index's keys, sized from its current size (see get_filters),
+        carrying over the lookup counters of the filter it replaces, if any.
 
-        return heaviest_block
+        Returns:
+            (:obj:`BloomFilter`): The filter.
+        """
+        bloom = BloomFilter(max(config.BLOOM_MIN_KEYS, int(len(index) * config.BLOOM_HEADROOM)), config.BLOOM_ERROR_RATE)
+        for key in index:
+            bloom.add(key)
+        if previous is not None:
+            bloom.checks, bloom.negatives, bloom.false_positives = previous.checks, previous.negatives, previous.false_positives
+        return bloom
+
+    def get_filter_stats(self):
+        """ Returns the statistics of both filters (see get_filters and BloomFilter.stats), as a dict with
+        "transactions" and "spent" entries.
+        """
+        return {name: bloom.stats() for name, bloom in self.get_filters().items()}
+
+    def get_validation_stats(self):
+        """ Returns the hit/miss statistics of the transaction verdict cache (shared by all chains in the process)
+        and of this chain's block verdict cache, as a dict with "transactions" and "blocks" entries.
+        """
+        return {"transactions": tx_verdicts.stats(), "blocks": self.get_block_verdicts().stats()}
+
+    def get_block(self, block_hash):
+        """ Loads a full block by hash, ghosting the least recently used blocks if over the memory budget.
+        Blocks moved to the archive by prune are read back from it (uncached).
+
+        Args:
+            block_hash (str): Hash of the desired block.
+
+        Returns:
+            (:obj:`Block`): The block.
+
+        Raises:
+            KeyError: If there is no such block.
+        """
+        if block_hash not in self.blocks and self.archive is not None and block_hash in self.archive:
+            return self.archive.get_block(block_hash)
+        return self.get_cache().access(hash_key(block_hash), self.blocks[block_hash], True)
+
+    def get_transaction(self, tx_hash):
+        """ Loads a transaction by hash, subject to the same memory budget as get_block.
+
+        Args:
+            tx_hash (str): Hash of the desired transaction.
+
+        Returns:
+            (:obj:`Transaction`): The transaction.
+
+        Raises:
+            KeyError: If there is no such transaction.
+        """
+        if tx_hash not in self.all_transactions and self.archive is not None and self.archive.has_transaction(tx_hash):
+            return self.archive.get_transaction(tx_hash)
+        return self.get_cache().access(hash_key(tx_hash), self.all_transactions[tx_hash], False)
+
+    def get_archive(self):
+        """ Returns the cold archive of pruned blocks, creating it at config.ARCHIVE_PATH on first use. """
+        if self.archive is None:
+            self.archive = ColdArchive(config.ARCHIVE_PATH)
+        return self.archive
+
+    def prune(self, depth=None, transactions=None):
+        """ Moves stale forks, and optionally the bodies of deep best-chain blocks, to the cold archive
+        (see get_archive), so the indexes only grow with the chain that matters. Both stay readable
+        through get_block and get_transaction. Run by add_block every config.PRUNE_INTERVAL blocks when
+        config.PRUNE_DEPTH is positive; the space is returned to disk when the database is packed.
+
+        A fork is stale when none of its blocks is within depth blocks of the heaviest tip's height. Its
+        blocks leave every index: they no longer count towards chain weight, cannot be extended, and can
+        be added again like any new block.
+
+        Best-chain block bodies are only pruned from heights the fork pruning has also covered. The header
+        stays, as do the block's entries in the spend and containment indexes, so double spends and double
+        inclusions are still caught; of its transactions, only those with outputs in the UTXO set (see
+        utxos) stay in all_transactions, since only those can still be spent on the best chain.
+        Spending one of the others fails validation with "Required output not found".
+
+        Args:
+            depth (int, optional): Minimum distance below the heaviest tip; defaults to config.PRUNE_DEPTH.
+            transactions (bool, optional): Whether to prune best-chain bodies too; defaults to
+                config.PRUNE_TRANSACTIONS.
+
+        Returns:
+            (int, int): Number of fork blocks archived, and of best-chain blocks whose bodies were.
+        """
+        import numpy as np # deferred like the dense index, which is built on it
+        depth = config.PRUNE_DEPTH if depth is None else depth
+        transactions = config.PRUNE_TRANSACTIONS if transactions is None else transactions
+        dense = self.get_dense_index()
+        tip_id = dense.heaviest_tip()
+        if tip_id is None:
+            return 0, 0
+        threshold = int(dense.height[tip_id]) - depth
+        on_best = dense.best_chain_mask()
+        heights = dense.height[:len(dense)]
+        # fork blocks above the threshold are live, and so are their ancestors off the best chain
+        live = on_best.copy()
+        for block_id in np.flatnonzero(~on_best & (heights > threshold)).tolist():
+            while block_id >= 0 and not live[block_id]:
+                live[block_id] = True
+                block_id = int(dense.parent[block_id])
+        stale = [dense.keys[block_id] for block_id in np.flatnonzero(~live).tolist()]
+        for block_key in stale:
+            self.get_archive().append(self.get_block(block_key))
+            self.unindex_block(block_key)
+        deep = []
+        if transactions and threshold > self.pruned_height:
+            deep = [dense.keys[block_id] for block_id in np.flatnonzero(on_best & (heights > self.pruned_height) & (heights <= threshold)).tolist()]
+            for block_key in deep:
+                self.prune_body(block_key)
+            self.pruned_height = threshold
+        if stale:
+            self._v_dense = None # rebuilt without the pruned blocks on next use
+            self._v_filters = None # likewise
+            self.get_block_verdicts().clear() # blocks on pruned forks no longer have a parent
+        self._p_changed = True
+        return len(stale), len(deep)
+
+    def unindex_block(self, block_key):
+        """ Removes a block from every index, and its transactions unless another block still contains them
+        (block_log keeps its history). Used by prune; the block's descendants must be removed too.
+        """
+        block = self.get_block(block_key)
+        self.chain[block.height] = [other for other in self.chain[block.height] if other != block_key]
+        if not self.chain[block.height]:
+            del self.chain[block.height]
+        self.blocks.pop(block_key, None) # (gone already if its body was pruned while it was on the best chain)
+        del self.headers[block_key]
+        del self.hash_index[block_key]
+        for tx in block.transactions:
+            containing = [other for other in self.blocks_containing_tx[tx.hash] if other != block_key]
+            if containing:
+                self.blocks_containing_tx[tx.hash] = containing
+            elif tx.hash in self.blocks_containing_tx:
+                del self.blocks_containing_tx[tx.hash]
+                del self.all_transactions[tx.hash]
+                del self.hash_index[hash_key(tx.hash)]
+            for outpoint in tx.get_outpoints():
+                spending = [other for other in self.blocks_spending_input.get(outpoint, []) if other != block_key]
+                if spending:
+                    self.blocks_spending_input[outpoint] = spending
+                else:
+                    self.blocks_spending_input.pop(outpoint, None)
+
+    def prune_body(self, block_key):
+        """ Archives a best-chain block and drops it from blocks, keeping its header and index entries. Its
+        transactions, and those it spends from, leave all_transactions if pruned and spent (see drop_if_spent).
+        Used by prune.
+        """
+        block = self.blocks[block_key]
+        self.get_archive().append(block)
+        del self.blocks[block_key]
+        for tx in block.transactions:
+            self.drop_if_spent(tx)
+            for outpoint in tx.get_outpoints():
+                if outpoint.tx_hash in self.all_transactions:
+                    self.drop_if_spent(self.get_transaction(outpoint.tx_hash))
+
+    def drop_if_spent(self, tx):
+        """ Removes a transaction from all_transactions if no block holding it is left in blocks and none of
+        its outputs is in the UTXO set. Used by prune_body.
+        """
+        tx_key = hash_key(tx.hash)
+        if any(block_key in self.blocks for block_key in self.blocks_containing_tx.get(tx_key, [])):
+            return
+        if any((tx_key, index) in self.utxos.by_user.get(output.receiver, {}) for index, output in enumerate(tx.outputs)):
+            return
+        del self.all_transactions[tx_key]
+
+    def warm_cache(self, num_heights):
+        """ Loads every block in the most recent num_heights heights, where reads usually concentrate.
+
+        Args:
+            num_heights (int): Number of heights (counting down from the highest) to load.
+
+        Returns:
+            int: Number of blocks loaded.
+        """
+        loaded = 0
+        for height in self.get_heights_with_blocks()[-num_heights:] if num_heights > 0 else []:
+            for block_hash in self.get_blockhashes_at_height(height):
+                self.get_block(block_hash)
+                loaded += 1
+        return loaded
+
+    def store_total_weights(self):
+        """ Stores the total weight of every block in its header record, parents first (database migration).
+
+        Returns:
+            int: Number of header records updated.
+        """
+        updated = 0
+        for height in self.get_heights_with_blocks():
+            for block_key in self.chain[height]:
+                header = self.headers[block_key]
+                if header.is_genesis:
+                    header.total_weight = header.get_weight()
+                elif header.parent_hash in self.headers and self.headers[header.parent_hash].total_weight is not None:
+                    header.total_weight = self.headers[header.parent_hash].total_weight + header.get_weight()
+                else:
+                    continue
+                updated += 1
+        self.total_weights_stored = True
+        return updated
+
+    def build_headers(self):
+        """ Creates header records for blocks stored before headers were kept separately (database migration).
+
+        Returns:
+            int: Number of headers created.
+        """
+        if not hasattr(self, "headers"):
+            self.headers = HashIndex()
+        created = 0
+        for block_hash, block in self.blocks.items():
+            if block_hash not in self.headers:
+                self.headers[block_hash] = BlockHeader.from_block(block)
+                created += 1
+        self._p_changed = True
+        return created
 
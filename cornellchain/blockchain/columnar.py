@@ -0,0 +1,298 @@
+import os
+import json
+import struct
+import numpy as np
+from blockchain.outpoint import hash_key, hash_hex
+from blockchain.dense_index import path_sums, INT64_WEIGHT_LIMIT
+
+# Every table is a set of .npy files (one per column, <table>.<column>.npy) that can be memory-mapped;
+# hashes are raw 32-byte values (V32, which unlike S32 keeps trailing zero bytes) and strings (user names,
+# input refs that are not transaction hashes) are dictionary-encoded as int32 ids.
+# Block weights can exceed 64 bits (a PoW weight is 2^256 / target), so they are stored as unsigned 256-bit
+# big-endian integers, also as V32 (see ColumnarChain.weights).
+# Transactions are listed once per block including them, so a transaction on two forks has two rows.
+SCHEMA = {
+    "blocks": [("hash", "V32"), ("parent", "<i8"), ("height", "<i8"), ("timestamp", "<i8"),
+               ("weight", "V32"), ("tx_start", "<i8"), ("tx_count", "<i8")],
+    "txs": [("hash", "V32"), ("block", "<i8"), ("input_start", "<i8"), ("input_count", "<i8"),
+            ("output_start", "<i8"), ("output_count", "<i8")],
+    "inputs": [("tx", "<i8"), ("ref_tx", "V32"), ("ref_label", "<i4"), ("ref_index", "<i8")],
+    "outputs": [("tx", "<i8"), ("sender", "<i4"), ("receiver", "<i4"), ("amount", "<i8")],
+}
+# version of the layout above, kept in meta.json (exports without one stored weights and amounts as floats)
+FORMAT = 2
+
+# .npy headers are written at a fixed size, so a column's row count can be rewritten in place as it grows
+HEADER_SIZE = 128
+
+def column_path(directory, table, column):
+    return os.path.join(directory, table + "." + column + ".npy")
+
+def npy_header(dtype, rows):
+    """ Returns a version 1.0 .npy header of exactly HEADER_SIZE bytes for a 1-d array. """
+    magic = np.lib.format.magic(1, 0)
+    text = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (np.lib.format.dtype_to_descr(np.dtype(dtype)), rows)
+    text = text.ljust(HEADER_SIZE - len(magic) - 2 - 1) + "\n"
+    return magic + struct.pack("<H", len(text)) + text.encode("latin1")
+
+def append_column(path, dtype, rows, values):
+    """ Appends values to a column file holding rows committed rows, discarding anything written after them
+    (e.g. by an interrupted export).
+
+    Args:
+        path (str): Path of the .npy file; created if missing.
+        dtype (str): NumPy dtype of the column.
+        rows (int): Number of committed rows in the file.
+        values (:obj:`list`): Values to append.
+
+    Returns:
+        int: The new number of rows.
+    """
+    data = np.asarray(values, dtype=dtype)
+    with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+        f.truncate(HEADER_SIZE + rows * data.itemsize)
+        f.seek(HEADER_SIZE + rows * data.itemsize)
+        f.write(data.tobytes())
+        f.seek(0)
+        f.write(npy_header(dtype, rows + len(data)))
+    return rows + len(data)
+
+def write_json(path, value):
+    """ Writes a JSON file atomically (readers see the old or the new version, never a partial one). """
+    with open(path + ".tmp", "w") as f:
+        json.dump(value, f)
+    os.replace(path + ".tmp", path)
+
+def read_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+def read_meta(directory):
+    """ Reads an export's committed row counts and block_log position.
+
+    Raises:
+        ValueError: If the export was written in an older format (delete it and export again).
+    """
+    meta = read_json(os.path.join(directory, "meta.json"), {"rows": {table: 0 for table in SCHEMA}, "format": FORMAT})
+    if meta.get("format", 1) != FORMAT and any(meta["rows"].values()):
+        raise ValueError("The export in " + directory + " has an older format; delete it and export again")
+    return meta
+
+class ColumnarExporter(object):
+
+    def __init__(self, directory):
+        """ Streams a chain's blocks, transactions, inputs and outputs into columnar files, appending only
+        blocks not exported yet, so it can be rerun as the chain grows.
+
+        Row counts are committed to meta.json after the columns are written, so an interrupted export
+        leaves the previous export intact. So is the position reached in the chain's block_log, from which the
+        next export continues.
+
+        Args:
+            directory (str): Directory holding the export; created if missing.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta = read_meta(directory)
+        self.rows = meta["rows"]
+        self.log_position = meta.get("log_position", 0) # (exports written before it was kept start from the beginning)
+        self.strings = read_json(os.path.join(directory, "dictionary.json"), [])
+        self.string_ids = {string: i for i, string in enumerate(self.strings)}
+        self.pending = {table: {column: [] for column, dtype in SCHEMA[table]} for table in SCHEMA}
+        self.block_rows = {}
+        if self.rows["blocks"]:
+            exported = ColumnarChain(directory)
+            self.block_rows = {block_hash: row for row, block_hash in enumerate(exported.blocks["hash"].tolist())}
+
+    def string_id(self, string):
+        """ Returns the dictionary id of a string, adding it if new. """
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(string)
+            self.string_ids[string] = string_id
+        return string_id
+
+    def next_row(self, table):
+        return self.rows[table] + len(self.pending[table][SCHEMA[table][0][0]])
+
+    def add_block(self, block, block_key):
+        """ Queues the rows for one block; its parent must already be exported or queued. """
+        row = self.next_row("blocks")
+        pending = self.pending["blocks"]
+        pending["hash"].append(block_key)
+        pending["parent"].append(-1 if block.is_genesis else self.block_rows[hash_key(block.parent_hash)])
+        pending["height"].append(block.height)
+        pending["timestamp"].append(block.timestamp)
+        pending["weight"].append(block.get_weight().to_bytes(32, "big"))
+        pending["tx_start"].append(self.next_row("txs"))
+        pending["tx_count"].append(len(block.transactions))
+        self.block_rows[block_key] = row
+        for tx in block.transactions:
+            tx_row = self.next_row("txs")
+            pending = self.pending["txs"]
+            pending["hash"].append(hash_key(tx.hash))
+            pending["block"].append(row)
+            pending["input_start"].append(self.next_row("inputs"))
+            pending["input_count"].append(len(tx.input_refs))
+            pending["output_start"].append(self.next_row("outputs"))
+            pending["output_count"].append(len(tx.outputs))
+            pending = self.pending["inputs"]
+            for outpoint in tx.get_outpoints():
+                is_hash = type(outpoint.tx_hash) is bytes
+                pending["tx"].append(tx_row)
+                pending["ref_tx"].append(outpoint.tx_hash if is_hash else bytes(32))
+                pending["ref_label"].append(-1 if is_hash else self.string_id(outpoint.tx_hash))
+                pending["ref_index"].append(outpoint.index)
+            pending = self.pending["outputs"]
+            for output in tx.outputs:
+                pending["tx"].append(tx_row)
+                pending["sender"].append(self.string_id(output.sender))
+                pending["receiver"].append(self.string_id(output.receiver))
+                pending["amount"].append(output.amount)
+
+    def flush(self):
+        """ Writes all queued rows and commits them. """
+        write_json(os.path.join(self.directory, "dictionary.json"), self.strings)
+        for table, columns in SCHEMA.items():
+            for column, dtype in columns:
+                append_column(column_path(self.directory, table, column), dtype, self.rows[table], self.pending[table][column])
+        for table in SCHEMA:
+            self.rows[table] = self.next_row(table)
+            self.pending[table] = {column: [] for column, dtype in SCHEMA[table]}
+        write_json(os.path.join(self.directory, "meta.json"), {"rows": self.rows, "log_position": self.log_position, "format": FORMAT})
+
+    def export(self, chain, batch_size=100000):
+        """ Exports every block added to the chain since the last export (in the order of its block_log, so parents
+        come first), skipping blocks already exported, e.g. pruned blocks that were added again. Blocks pruned
+        after they were added are exported too (from the archive), so the export keeps every fork.
+
+        Args:
+            chain (:obj:`Blockchain`): Chain to export.
+            batch_size (int, optional): Number of output rows to buffer in memory between writes.
+
+        Returns:
+            int: Number of blocks exported.
+        """
+        exported = 0
+        for sequence, block_key in chain.block_log.items(self.log_position):
+            if block_key not in self.block_rows:
+                self.add_block(chain.get_block(hash_hex(block_key)), block_key)
+                exported += 1
+            self.log_position = sequence + 1
+            if len(self.pending["outputs"]["tx"]) >= batch_size:
+                self.flush()
+        self.flush()
+        return exported
+
+def export_chain(chain, directory, batch_size=100000):
+    """ Exports (or brings up to date) a columnar copy of a chain; see :obj:`ColumnarExporter`.
+
+    Returns:
+        int: Number of blocks exported.
+    """
+    return ColumnarExporter(directory).export(chain, batch_size)
+
+class ColumnarChain(object):
+
+    def __init__(self, directory):
+        """ Read-only, memory-mapped view of a columnar export, with helpers for common analytics queries.
+
+        Args:
+            directory (str): Directory written by :obj:`ColumnarExporter`.
+
+        Attributes:
+            blocks, txs, inputs, outputs (:obj:`dict` of (str to :obj:`numpy.ndarray`)): Columns of each table.
+            strings (:obj:`list` of str): Dictionary of user names and non-hash input refs, indexed by id.
+        """
+        rows = read_meta(directory)["rows"]
+        self.strings = read_json(os.path.join(directory, "dictionary.json"), [])
+        self.string_ids = {string: i for i, string in enumerate(self.strings)}
+        for table, columns in SCHEMA.items():
+            arrays = {}
+            for column, dtype in columns:
+                path = column_path(directory, table, column)
+                if rows[table] == 0 or not os.path.exists(path):
+                    arrays[column] = np.zeros(0, dtype=dtype)
+                else:
+                    arrays[column] = np.load(path, mmap_mode="r")[:rows[table]]
+            setattr(self, table, arrays)
+
+    def string_id(self, string):
+        """ Returns the dictionary id of a string (e.g. a user name), or -1 if it never occurs. """
+        return self.string_ids.get(string, -1)
+
+    def volume_per_user(self, role="receiver"):
+        """ Sums output amounts per user, over every exported block (use best_chain to restrict).
+
+        Args:
+            role (str, optional): "receiver" for amounts received, "sender" for amounts sent.
+
+        Returns:
+            (:obj:`dict` of (str to int)): Maps user names to their total.
+        """
+        totals = np.zeros(len(self.strings), dtype=np.int64)
+        np.add.at(totals, self.outputs[role], self.outputs["amount"])
+        names = np.unique(self.outputs[role])
+        return {self.strings[name]: int(totals[name]) for name in names}
+
+    def outputs_of(self, name, role="receiver"):
+        """ Returns the row numbers of the outputs a user received (or sent). """
+        return np.flatnonzero(self.outputs[role] == self.string_id(name))
+
+    def blocks_per_height(self):
+        """ Returns an array holding the number of exported blocks at each height. """
+        return np.bincount(self.blocks["height"])
+
+    def weights(self):
+        """ Returns the weight of every block row: an int64 array, or an array of Python ints (dtype object) if
+        the weights or their sum might not fit in int64.
+        """
+        raw = np.asarray(self.blocks["weight"]).view(np.uint8).reshape(-1, 32)
+        if raw[:, :24].any() or (raw[:, 24] >= 128).any(): # (a weight of 2^63 or more)
+            return np.array([int.from_bytes(weight, "big") for weight in self.blocks["weight"].tolist()], dtype=object)
+        weights = raw[:, 24:].copy().view(">u8").ravel().astype(np.int64)
+        if len(weights) and int(weights.max()) * len(weights) >= INT64_WEIGHT_LIMIT:
+            return weights.astype(object)
+        return weights
+
+    def best_chain(self, tip_hash=None):
+        """ Marks the blocks on the chain ending in tip_hash.
+
+        Args:
+            tip_hash (str, optional): Hex hash of the tip; defaults to the block with the most cumulative
+                weight (the first exported of those, if several tie).
+
+        Returns:
+            (:obj:`numpy.ndarray` of bool): True for every block row on that chain.
+        """
+        parents = np.asarray(self.blocks["parent"])
+        mask = np.zeros(len(parents), dtype=bool)
+        if not len(parents):
+            return mask
+        if tip_hash is None:
+            row = int(np.argmax(path_sums(self.weights(), parents)))
+        else:
+            row = int(np.flatnonzero(self.blocks["hash"] == np.void(hash_key(tip_hash)))[0])
+        while row >= 0:
+            mask[row] = True
+            row = int(parents[row])
+        return mask
+
+    def fork_stats(self, tip_hash=None):
+        """ Summarizes forking in the export.
+
+        Returns:
+            (:obj:`dict` of (str to int)): Number of blocks, heights, heights with more than one block,
+            and blocks off the best chain (see best_chain).
+        """
+        per_height = self.blocks_per_height()
+        return {"blocks": int(len(self.blocks["height"])), "heights": int(np.count_nonzero(per_height)),
+                "forked_heights": int(np.count_nonzero(per_height > 1)),
+                "stale_blocks": int(np.count_nonzero(~self.best_chain(tip_hash)))}
+
+    def block_hashes(self, rows):
+        """ Returns the hex hashes of the given block rows. """
+        return [hash_hex(block_hash) for block_hash in self.blocks["hash"][rows].tolist()]
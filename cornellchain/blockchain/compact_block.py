@@ -0,0 +1,166 @@
+import os
+import hashlib
+from blockchain.serialization import header_to_dict, tx_to_dict, tx_from_dict, block_from_header
+
+SHORT_ID_BYTES = 6
+# heights below a compact block whose blocks (e.g. a fork the sender mined on) are searched for its transactions
+RECENT_FORK_DEPTH = 6
+
+def short_id(salt, tx_hash):
+    """ Salted short transaction ID; a fresh salt per block keeps collisions from being precomputed.
+
+    Args:
+        salt (bytes): Per-block salt (key of the keyed BLAKE2b hash).
+        tx_hash (str): Full transaction hash.
+
+    Returns:
+        str: Hex-encoded SHORT_ID_BYTES-byte short ID.
+    """
+    return hashlib.blake2b(tx_hash.encode("utf-8"), key=salt, digest_size=SHORT_ID_BYTES).hexdigest()
+
+class CompactBlock(object):
+
+    def __init__(self, header, salt, short_ids, prefilled):
+        """ A block header plus short IDs of its transactions, with full data only for a few of them.
+
+        Args:
+            header (dict): Header of the block, as encoded by serialization.header_to_dict.
+            salt (bytes): Salt used for every short ID in this block.
+            short_ids (:obj:`list` of str): Short ID of every transaction in block order (None where prefilled).
+            prefilled (:obj:`dict` of (int to dict)): Maps transaction index to the encoded transaction.
+        """
+        self.header = header
+        self.salt = salt
+        self.short_ids = short_ids
+        self.prefilled = prefilled
+
+    @classmethod
+    def from_block(cls, block, peer_has=None, salt=None):
+        """ Builds a compact encoding of a block for a particular peer.
+
+        Args:
+            block (:obj:`Block`): Block to encode.
+            peer_has (:obj:`set` of str, optional): Hashes of transactions the peer is predicted to have already;
+                every other transaction is sent in full. Defaults to predicting the peer has none of them.
+            salt (bytes, optional): Salt for the short IDs; random by default.
+
+        Returns:
+            :obj:`CompactBlock`: The compact encoding.
+        """
+        salt = salt if salt is not None else os.urandom(16)
+        peer_has = peer_has if peer_has is not None else set()
+        short_ids, prefilled = [], {}
+        for index, tx in enumerate(block.transactions):
+            if tx.hash in peer_has:
+                short_ids.append(short_id(salt, tx.hash))
+            else:
+                short_ids.append(None)
+                prefilled[index] = tx_to_dict(tx)
+        return cls(header_to_dict(block), salt, short_ids, prefilled)
+
+    def to_dict(self):
+        return {"header": self.header, "salt": self.salt.hex(), "short_ids": self.short_ids,
+                "prefilled": [[index, tx] for index, tx in sorted(self.prefilled.items())]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["header"], bytes.fromhex(data["salt"]), data["short_ids"],
+                   {index: tx for index, tx in data["prefilled"]})
+
+def recent_transactions(chain, height):
+    """ Yields the transactions of every block from RECENT_FORK_DEPTH heights below height up to height itself. """
+    for recent_height in range(max(0, height - RECENT_FORK_DEPTH), height + 1):
+        if recent_height in chain.chain:
+            for block_hash in chain.get_blockhashes_at_height(recent_height):
+                for tx in chain.get_block(block_hash).transactions:
+                    yield tx
+
+def reconstruct(compact, chain, mempool=None):
+    """ Fills in a compact block from the transactions we are likely to have: the mempool, and only if short IDs
+    remain unresolved, the blocks at the last RECENT_FORK_DEPTH heights (transactions confirmed on a recent sibling
+    fork), so the work is proportional to those rather than to every transaction in the chain. Anything else is
+    left missing, to be fetched with getblocktxn. Short IDs matching more than one local transaction are treated as
+    missing rather than guessed.
+
+    Args:
+        compact (:obj:`CompactBlock`): Received compact block.
+        chain (:obj:`Blockchain`): Local chain.
+        mempool (:obj:`dict` of (str to :obj:`Transaction`), optional): Local unconfirmed transactions.
+
+    Returns:
+        :obj:`PartialBlock`: The block with any transactions we lack left as gaps.
+
+    Raises:
+        ValueError: If a prefilled transaction's index is not a position in the block.
+    """
+    transactions = [None] * len(compact.short_ids)
+    for index in compact.prefilled:
+        if type(index) is not int or not 0 <= index < len(transactions):
+            raise ValueError("Prefilled transaction index out of range: " + repr(index))
+    for index, data in compact.prefilled.items():
+        transactions[index] = tx_from_dict(data)
+    wanted = {}
+    for index, sid in enumerate(compact.short_ids):
+        if sid is not None:
+            wanted.setdefault(sid, []).append(index)
+    pools = [lambda: (mempool or {}).values(), lambda: recent_transactions(chain, compact.header["height"])]
+    for pool in pools:
+        if not wanted:
+            break
+        matches = {}
+        for tx in pool():
+            sid = short_id(compact.salt, tx.hash)
+            if sid in wanted:
+                matches.setdefault(sid, {})[tx.hash] = tx # (a transaction may be in several recent blocks)
+        for sid, txs in matches.items():
+            if len(txs) == 1 and len(wanted[sid]) == 1:
+                transactions[wanted.pop(sid)[0]] = list(txs.values())[0]
+    return PartialBlock(compact.header, transactions)
+
+class PartialBlock(object):
+
+    def __init__(self, header, transactions):
+        """ A block under reconstruction.
+
+        Args:
+            header (dict): Encoded header of the block.
+            transactions (list): Transactions in block order, None for those still missing.
+        """
+        self.header = header
+        self.transactions = transactions
+
+    def missing_indexes(self):
+        """ Returns the positions of transactions that must still be requested from the peer. """
+        return [index for index, tx in enumerate(self.transactions) if tx is None]
+
+    def fill(self, indexes, transactions):
+        """ Fills gaps with transactions received from the peer.
+
+        Args:
+            indexes (:obj:`list` of int): Positions being filled (as returned by missing_indexes).
+            transactions (:obj:`list` of :obj:`Transaction`): Transactions for those positions.
+
+        Raises:
+            ValueError: If an index is not a position in the block.
+        """
+        if any(type(index) is not int or not 0 <= index < len(self.transactions) for index in indexes):
+            raise ValueError("Transaction index out of range")
+        for index, tx in zip(indexes, transactions):
+            self.transactions[index] = tx
+
+    def to_block(self):
+        """ Assembles the full block, checking it against the header's Merkle root.
+
+        Returns:
+            :obj:`Block`: The reconstructed block.
+
+        Raises:
+            ValueError: If transactions are missing, or they do not match the Merkle root (e.g. a short ID
+                collision picked the wrong transaction); the caller should fall back to the full block.
+        """
+        if self.missing_indexes():
+            raise ValueError("Transactions still missing")
+        block = block_from_header(self.header, list(self.transactions))
+        if block.calculate_merkle_root() != block.merkle:
+            raise ValueError("Merkle root failed to match")
+        return block
@@ -0,0 +1,39 @@
+import threading
+import contextlib
+
+# the chain made current in each thread by using_chain
+_local = threading.local()
+
+def current_chain(chain=None):
+    """ Resolves the chain that blocks are built and validated against.
+
+    Args:
+        chain (:obj:`Blockchain`, optional): An explicitly passed chain; always wins.
+
+    Returns:
+        (:obj:`Blockchain`): chain if given, else the chain made current in this thread by using_chain,
+        else the global blockchain.chain (the database chain; kept as the default for backward compatibility).
+    """
+    if chain is not None:
+        return chain
+    chain = getattr(_local, "chain", None)
+    if chain is not None:
+        return chain
+    import blockchain
+    return blockchain.chain
+
+@contextlib.contextmanager
+def using_chain(chain):
+    """ Makes chain the default for building and validating blocks in the current thread only, so threads can
+    work on independent chains at the same time. Contexts nest; passing None leaves the default unchanged.
+
+    Args:
+        chain (:obj:`Blockchain`): The chain to use.
+    """
+    previous = getattr(_local, "chain", None)
+    if chain is not None:
+        _local.chain = chain
+    try:
+        yield chain
+    finally:
+        _local.chain = previous
@@ -0,0 +1,176 @@
+import numpy as np
+from blockchain.outpoint import HashIndex, hash_key, hash_hex
+
+# while the sum of all weights stays below this, weights and their running sums fit in int64
+INT64_WEIGHT_LIMIT = 2 ** 63
+
+def path_sums(values, parents):
+    """ Sums values along every node's path to its root in a forest, by pointer jumping
+    (O(n log depth) vectorized work instead of a Python loop per block).
+
+    Args:
+        values (:obj:`numpy.ndarray`): Value of each node.
+        parents (:obj:`numpy.ndarray` of int): Parent id of each node, or -1 for roots.
+
+    Returns:
+        (:obj:`numpy.ndarray`): For each node, the sum of values from the node up to and including its root.
+    """
+    sums = values.copy()
+    up = parents.copy()
+    active = np.flatnonzero(up >= 0)
+    while active.size:
+        # right-hand sides are evaluated before assignment, so each round jumps synchronously
+        sums[active] += sums[up[active]]
+        up[active] = up[up[active]]
+        active = active[up[active] >= 0]
+    return sums
+
+class DenseIndex(object):
+
+    def __init__(self, capacity=1024):
+        """ Column arrays over every block in a chain, addressed by small integer ids (in order of addition)
+        so questions about the whole block tree become vectorized NumPy operations.
+
+        Args:
+            capacity (int, optional): Initial number of rows; arrays double in size as blocks are added.
+
+        Attributes:
+            ids (:obj:`HashIndex` of (bytes to int)): Maps block hashes to their ids.
+            keys (:obj:`list` of bytes): Block hash key of each id.
+            parent (:obj:`numpy.ndarray` of int64): Parent id of each block, -1 for genesis blocks.
+            height (:obj:`numpy.ndarray` of int64): Height of each block.
+            timestamp (:obj:`numpy.ndarray` of int64): Timestamp of each block.
+            weight (:obj:`numpy.ndarray`): Consensus weight of each block; int64, or exact Python ints
+                (object dtype) once weights get too large to sum in int64.
+            tx_count (:obj:`numpy.ndarray` of int64): Number of transactions in each block.
+            cumulative (:obj:`numpy.ndarray`): Total weight from genesis up to and including each block
+                (same dtype as weight); maintained as blocks are added, since parents always come first.
+        """
+        self.ids = HashIndex()
+        self.keys = []
+        self.parent = np.empty(capacity, dtype=np.int64)
+        self.height = np.empty(capacity, dtype=np.int64)
+        self.timestamp = np.empty(capacity, dtype=np.int64)
+        self.weight = np.empty(capacity, dtype=np.int64)
+        self.tx_count = np.empty(capacity, dtype=np.int64)
+        self.cumulative = np.empty(capacity, dtype=np.int64)
+        self.total_weight = 0
+
+    @classmethod
+    def from_chain(cls, chain):
+        """ Builds the index for every block in a chain from its header records.
+
+        Args:
+            chain (:obj:`Blockchain`): The chain to index.
+
+        Returns:
+            (:obj:`DenseIndex`): The index.
+        """
+        index = cls(capacity=max(1024, len(chain.headers)))
+        for height in chain.get_heights_with_blocks():
+            # oldest first, so ids within a height follow the order blocks were added in
+            for block_key in reversed(chain.chain[height]):
+                header = chain.headers[block_key]
+                tx_count = header.tx_count
+                if tx_count is None: # header stored before transaction counts were kept
+                    tx_count = len(chain.blocks[block_key].transactions)
+                index.add(block_key, header, tx_count)
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _grow(self):
+        for name in ["parent", "height", "timestamp", "weight", "tx_count", "cumulative"]:
+            old = getattr(self, name)
+            new = np.empty(2 * len(old), dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def add(self, block_key, header, tx_count):
+        """ Appends a block; its parent, unless it is a genesis block, must already be indexed.
+
+        Args:
+            block_key (bytes): Hash key of the block.
+            header (:obj:`BlockHeader` or :obj:`Block`): Header fields of the block.
+            tx_count (int): Number of transactions in the block.
+
+        Returns:
+            int: Id of the block.
+        """
+        block_id = len(self.keys)
+        if block_id == len(self.parent):
+            self._grow()
+        weight = header.get_weight()
+        self.total_weight += weight
+        if self.total_weight >= INT64_WEIGHT_LIMIT and self.weight.dtype != object:
+            self.weight = self.weight.astype(object)
+            self.cumulative = self.cumulative.astype(object)
+        parent_id = -1 if header.is_genesis else self.ids[header.parent_hash]
+        self.ids[block_key] = block_id
+        self.keys.append(hash_key(block_key)) # (the chain's interned key)
+        self.parent[block_id] = parent_id
+        self.height[block_id] = header.height
+        self.timestamp[block_id] = header.timestamp
+        self.weight[block_id] = weight
+        self.tx_count[block_id] = tx_count
+        self.cumulative[block_id] = weight if parent_id < 0 else self.cumulative[parent_id] + weight
+        return block_id
+
+    def hashes(self, ids):
+        """ Returns the hex hashes of the blocks with the given ids. """
+        return [hash_hex(self.keys[block_id]) for block_id in ids]
+
+    def columns(self):
+        """ Returns views of the filled part of every column, as a dict of column name to array. """
+        n = len(self.keys)
+        return {"parent": self.parent[:n], "height": self.height[:n], "timestamp": self.timestamp[:n],
+                "weight": self.weight[:n], "tx_count": self.tx_count[:n], "cumulative": self.cumulative[:n]}
+
+    def cumulative_weights(self):
+        """ Returns the total weight of every block's chain, from genesis up to and including the block, by id. """
+        return self.cumulative[:len(self.keys)]
+
+    def tips(self):
+        """ Returns the ids of all blocks without children. """
+        n = len(self.keys)
+        has_child = np.zeros(n, dtype=bool)
+        parents = self.parent[:n]
+        has_child[parents[parents >= 0]] = True
+        return np.flatnonzero(~has_child)
+
+    def heaviest_tip(self):
+        """ Returns the id of the block with the most accumulated weight, or None for an empty index.
+        Ties go to the lowest height and then to the most recently added block, like Blockchain.get_heaviest_chain_tip.
+        """
+        if not self.keys:
+            return None
+        weights = self.cumulative_weights()
+        candidates = np.flatnonzero(weights == weights.max())
+        heights = self.height[candidates]
+        return int(candidates[heights == heights.min()].max())
+
+    def best_chain_mask(self):
+        """ Returns a boolean array marking the blocks on the chain ending in the heaviest tip. """
+        mask = np.zeros(len(self.keys), dtype=bool)
+        block_id = self.heaviest_tip()
+        while block_id is not None and block_id >= 0:
+            mask[block_id] = True
+            block_id = int(self.parent[block_id])
+        return mask
+
+    def fork_depths(self):
+        """ Returns, for every tip, how many of its blocks are off the best chain (0 for the heaviest tip).
+
+        Returns:
+            (:obj:`dict` of (int to int)): Maps tip ids to the length of their fork.
+        """
+        n = len(self.keys)
+        on_best = self.best_chain_mask()
+        off_best = (~on_best).astype(np.int64)
+        depths = path_sums(off_best, np.where(on_best, -1, self.parent[:n]))
+        return {int(tip): int(depths[tip]) for tip in self.tips()}
+
+    def blocks_per_height(self):
+        """ Returns an array holding the number of blocks at each height, starting from 0. """
+        return np.bincount(self.height[:len(self.keys)])
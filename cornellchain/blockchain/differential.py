@@ -0,0 +1,265 @@
+import time
+import random
+import logging
+import config
+from blockchain.util import nonempty_intersection
+from blockchain.transaction import Transaction, TransactionOutput
+
+logger = logging.getLogger(__name__)
+
+def reference_is_valid(block, chain):
+    """ The original, unoptimized Block.is_valid: every rule spelled out with list searches and full-block walks,
+    kept as the reference the optimized validator (Block.is_valid, with its indexes and verdict caches) must agree
+    with, verdict and message.
+
+    Args:
+        block (:obj:`Block`): Block to validate.
+        chain (:obj:`Blockchain`): Chain to validate against.
+
+    Returns:
+        bool, str: True if block is valid, False otherwise plus an error or success message.
+    """
+    self = block
+    if not self.merkle == self.calculate_merkle_root():
+        return False, "Merkle root failed to match"
+    if not self.hash == self.calculate_hash():
+        return False, "Hash failed to match"
+    if len(self.transactions) > 900:
+        return False, "Too many transactions"
+    if self.is_genesis:
+        if self.height != 0 or self.parent_hash != 'genesis' or  self.hash != self.calculate_hash():
+            return False, "Invalid genesis"
+    else:
+        if self.parent_hash not in chain.blocks:
+            return False, "Nonexistent parent"
+        parent_block = chain.blocks[self.parent_hash]
+        if self.height != (parent_block.height + 1):
+            return False, "Invalid height"
+        if self.timestamp < parent_block.timestamp:
+            return False, "Invalid timestamp"
+        if not self.seal_is_valid():
+            return False, "Invalid seal"
+        for tx in self.transactions:
+            if not tx.is_valid():
+                return False, "Malformed transaction included"
+
+        for tx in self.transactions:
+            tx_hashes = [t.hash for t in self.transactions]
+            if len(set(tx_hashes)) != len(tx_hashes):
+                return False, "Double transaction inclusion"
+            ancestor = self
+            while ancestor.parent_hash != "genesis":
+                ancestor = chain.blocks[ancestor.parent_hash]
+                if tx.hash in [t.hash for t in ancestor.transactions]:
+                    return False, "Double transaction inclusion"
+
+            for input_ref in tx.input_refs:
+                tx_id = input_ref.split(":")[0]
+                output_idx = int(input_ref.split(":")[1])
+                if tx_id not in tx_hashes and tx_id not in chain.all_transactions:
+                    return False, "Required output not found"
+                if tx_id not in chain.all_transactions:
+                    target_transaction = [t for t in self.transactions if t.hash == tx_id][0]
+                else:
+                    target_transaction = chain.all_transactions[tx_id]
+                if (output_idx + 1) > len(target_transaction.outputs):
+                    return False, "Required output not found"
+
+                this_input_name = target_transaction.outputs[output_idx].receiver
+                this_outputs_names = set([t.sender for t in tx.outputs])
+                if this_input_name not in this_outputs_names or len(this_outputs_names) > 1:
+                    return False, "User inconsistencies"
+                this_inputs_names = set([target_transaction.outputs[int(ref.split(":")[1])].receiver for ref in tx.input_refs])
+                if len(this_inputs_names) > 1:
+                    return False, "User inconsistencies"
+
+                if input_ref in chain.blocks_spending_input:
+                    max_height = max(chain.blocks[spender].height for spender in chain.blocks_spending_input[input_ref])
+                    if self.height > max_height:
+                        return False, "Double-spent input"
+                else:
+                    init_input_ref = []
+                    for i in self.transactions:
+                        if nonempty_intersection(init_input_ref, i.input_refs):
+                            return False, "Double-spent input"
+                        init_input_ref.extend(i.input_refs)
+
+                if tx_id in [t.hash for t in self.transactions]:
+                    pass
+                elif tx_id in chain.all_transactions:
+                    max_height = max(chain.blocks[container].height for container in chain.blocks_containing_tx[tx_id])
+                    if self.height <= max_height:
+                        return False, "Input transaction not found"
+
+            for input_ref in tx.input_refs:
+                tx_id = input_ref.split(":")[0]
+                output_idx = int(input_ref.split(":")[1])
+                if tx_id not in chain.all_transactions:
+                    target_transaction = [t for t in self.transactions if t.hash == tx_id][0]
+                else:
+                    target_transaction = chain.all_transactions[tx_id]
+                spent = target_transaction.outputs[output_idx]
+                if sum(map(lambda x: x.amount if x.sender == spent.receiver else 0, tx.outputs)) > spent.amount:
+                    return False, "Creating money"
+
+    return True, "All checks passed"
+
+def outcome(validate):
+    """ Calls validate(), returning (verdict, None), or (None, exception) if it raised. """
+    try:
+        return validate(), None
+    except Exception as error:
+        return None, error
+
+def describe(verdict, error):
+    """ Returns a comparable form of a validator's outcome: the verdict, or the type of exception it raised. """
+    return tuple(verdict) if error is None else ("raised", type(error).__name__)
+
+class DifferentialValidator(object):
+
+    def __init__(self, sample_rate=1.0, reference=reference_is_valid, rng=None):
+        """ Validates blocks with the optimized validator (Block.is_valid) and, for a sample of them, with the
+        reference too, logging every block on which their verdicts or messages differ.
+
+        Args:
+            sample_rate (float, optional): Fraction of blocks also checked against the reference (1 checks all).
+            reference (function, optional): Reference validator, called as reference(block, chain).
+            rng (:obj:`random.Random`, optional): Source of the sampling decisions.
+
+        Attributes:
+            checked (int): Blocks validated by both.
+            mismatches (:obj:`list` of (str, tuple, tuple)): Block hash, optimized and reference outcomes (see describe)
+                of every disagreement.
+            fast_seconds (float): Time spent in the optimized validator on checked blocks.
+            reference_seconds (float): Time spent in the reference on checked blocks.
+        """
+        self.sample_rate = sample_rate
+        self.reference = reference
+        self.rng = rng or random.Random()
+        self.checked = 0
+        self.mismatches = []
+        self.fast_seconds = 0.0
+        self.reference_seconds = 0.0
+
+    def is_valid(self, block, chain):
+        """ Validates a block like block.is_valid(chain), which gives the verdict returned; when sampled, the
+        reference validates it too and any disagreement is logged.
+
+        Returns:
+            bool, str: The optimized validator's verdict.
+        """
+        if self.rng.random() >= self.sample_rate:
+            return block.is_valid(chain)
+        start = time.perf_counter()
+        verdict, error = outcome(lambda: block.is_valid(chain))
+        self.fast_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        expected, expected_error = outcome(lambda: self.reference(block, chain))
+        self.reference_seconds += time.perf_counter() - start
+        self.checked += 1
+        # validators that raise must raise alike (the rules crash on some malformed input references)
+        found, wanted = describe(verdict, error), describe(expected, expected_error)
+        if found != wanted:
+            self.mismatches.append((block.hash, found, wanted))
+            logger.warning("Validator mismatch on block %s: optimized %r, reference %r", block.hash, found, wanted)
+        if error is not None:
+            raise error
+        return verdict
+
+    def speedup(self):
+        """ Returns how many times faster the optimized validator was than the reference on the checked blocks. """
+        return self.reference_seconds / self.fast_seconds if self.fast_seconds else 0.0
+
+    def stats(self):
+        """ Returns the counters and the speedup as a dict. """
+        return {"checked": self.checked, "mismatches": len(self.mismatches), "fast_seconds": self.fast_seconds,
+                "reference_seconds": self.reference_seconds, "speedup": self.speedup()}
+
+# used by Blockchain.add_block when config.DIFFERENTIAL_SAMPLE_RATE is positive
+validator = DifferentialValidator(config.DIFFERENTIAL_SAMPLE_RATE)
+
+USERS = ["Alice", "Bob", "Carol", "Dave"]
+
+# ways random_blocks breaks a rule, in at most one transaction of about half the blocks
+MUTATIONS = ["replay", "other user", "missing output", "spend twice", "create money", "stale parent"]
+
+def random_blocks(chain, rng, count, block_class):
+    """ Generates candidate blocks for differential testing and adds the valid ones to chain: blocks extend the
+    heaviest tip or fork from a random block, and their transactions spend outputs from anywhere in the chain or
+    earlier in the same block, and about half the blocks break a rule (see MUTATIONS).
+
+    Args:
+        chain (:obj:`Blockchain`): Empty chain to build on (blocks are added without committing).
+        rng (:obj:`random.Random`): Source of all random choices, so a seed reproduces the run.
+        count (int): Number of candidate blocks to generate after the genesis block.
+        block_class (type): Block class to create; its seal is not checked, see blockchain.stress.StressBlock.
+
+    Yields:
+        (:obj:`Block`): Each candidate, before it is added; the caller validates it (e.g. with a
+        DifferentialValidator, which may raise like Block.is_valid), then the generator adds it if accepted.
+    """
+    funding = [Transaction([], [TransactionOutput("Genesis", user, 100) for i in range(3)]) for user in USERS]
+    genesis = block_class(0, funding, "genesis", is_genesis=True)
+    yield genesis
+    chain.add_block(genesis, save=False)
+    # outputs not yet spent by an accepted block, as (input ref, receiver, amount); spent ones stay in everything
+    unspent = [(tx.hash + ":" + str(index), output.receiver, output.amount) for tx in funding for index, output in enumerate(tx.outputs)]
+    everything = list(unspent)
+    txs = list(funding)
+    for i in range(count):
+        if rng.random() < 0.7:
+            parent = chain.get_heaviest_chain_tip()
+        else:
+            parent = chain.get_block(rng.choice(list(chain.blocks.hex_keys()))) # fork
+        mutation = rng.choice(MUTATIONS) if rng.random() < 0.5 else None
+        available = list(unspent)
+        block_txs, block_outputs = [], []
+        for j in range(rng.randint(1, 6)):
+            sender = rng.choice(USERS)
+            own = [output for output in available if output[1] == sender]
+            earlier = [output for output in block_outputs if output[1] == sender and output in available]
+            if earlier and rng.random() < 0.5:
+                own = earlier # in-block dependency
+            if not own:
+                continue
+            if rng.random() < 0.8:
+                # (the rules read every input's receiver from the first input's transaction, so mixed inputs mostly fail)
+                source = rng.choice(own)[0].split(":")[0]
+                own = [output for output in own if output[0].startswith(source + ":")]
+            inputs = rng.sample(own, min(len(own), rng.randint(1, 3)))
+            for spent in inputs:
+                available.remove(spent)
+            limit = min(amount for ref, receiver, amount in inputs)
+            sent = rng.randint(0, limit)
+            tx = Transaction([ref for ref, receiver, amount in inputs], [TransactionOutput(sender, rng.choice(USERS), sent), TransactionOutput(sender, sender, limit - sent)])
+            block_txs.append(tx)
+            outputs = [(tx.hash + ":" + str(index), output.receiver, output.amount) for index, output in enumerate(tx.outputs)]
+            block_outputs.extend(outputs)
+            available.extend(outputs)
+        if mutation and block_txs:
+            block_txs[-1] = mutate(block_txs[-1], mutation, rng, everything, txs)
+        if mutation == "stale parent" and parent.height > 0:
+            parent = chain.get_block(parent.parent_hash)
+        block = block_class(parent.height + 1, block_txs, parent.hash)
+        yield block
+        if chain.add_block(block, save=False): # (which rejects blocks the rules raise on)
+            block_outputs = [(tx.hash + ":" + str(index), output.receiver, output.amount) for tx in block_txs for index, output in enumerate(tx.outputs)]
+            spent = set(ref for tx in block_txs for ref in tx.input_refs)
+            unspent = [output for output in unspent + block_outputs if output[0] not in spent]
+            everything.extend(block_outputs)
+            txs.extend(block_txs)
+
+def mutate(tx, mutation, rng, outputs, txs):
+    """ Returns tx broken as mutation says (the block-level "stale parent" leaves it alone). """
+    refs = list(tx.input_refs)
+    if mutation == "replay":
+        return rng.choice(txs)
+    if mutation == "other user":
+        refs.append(rng.choice(outputs)[0])
+    elif mutation == "missing output":
+        refs.append(refs[0].split(":")[0] + ":" + str(rng.randint(2, 9)))
+    elif mutation == "spend twice":
+        refs.append(rng.choice(outputs)[0] if rng.random() < 0.5 else refs[0])
+    elif mutation == "create money":
+        return Transaction(refs, [TransactionOutput(output.sender, output.receiver, output.amount + 1) for output in tx.outputs])
+    return Transaction(refs, tx.outputs)
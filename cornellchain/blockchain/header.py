@@ -0,0 +1,84 @@
+import persistent
+from blockchain.block import Block
+from blockchain.serialization import BLOCK_TYPES
+
+class BlockHeader(persistent.Persistent):
+
+    tx_count = None # for header records stored before transaction counts were kept
+    total_weight = None # set by Blockchain.add_block; None for header records stored before it was kept
+
+    def __init__(self, block_class, height, timestamp, target, parent_hash, is_genesis, merkle, seal_data, weight=None, tx_count=None):
+        """ The header fields of a block without its transactions; enough to check linkage, seal and weight.
+
+        The chain keeps one of these per block as its own small database record, so walking ancestry or
+        summing weights never loads full blocks and their transactions.
+
+        Args:
+            block_class (type): Class of the block this header belongs to (decides seal and weight rules).
+            height (int): height of the block in the chain.
+            timestamp (int): Unix timestamp of the block.
+            target (int): Target value for the block's seal.
+            parent_hash (str): the hash of the parent block in the blockchain.
+            is_genesis (bool): True only if the block is a genesis block.
+            merkle (str): Merkle hash of the block's transactions.
+            seal_data (int): Seal data for the block.
+            weight (int, optional): Consensus weight of the block; computed from the fields above if not given.
+            tx_count (int, optional): Number of transactions in the block, if known.
+
+        Attributes:
+            hash (str): Hex-encoded SHA256^2 hash of the header, computed from the fields above.
+            total_weight (int): Total weight of the chain ending with the block, stored by the chain that holds
+                the header (see Blockchain.get_total_weight); None if not known.
+        """
+        self.block_class = block_class
+        self.height = height
+        self.timestamp = timestamp
+        self.target = target
+        self.parent_hash = parent_hash
+        self.is_genesis = is_genesis
+        self.merkle = merkle
+        self.seal_data = seal_data
+        self.hash = self.calculate_hash()
+        self.weight = weight if weight is not None else self.shell().get_weight()
+        self.tx_count = tx_count
+
+    @classmethod
+    def from_block(cls, block):
+        """ Returns the header of a full block. """
+        return cls(type(block), block.height, block.timestamp, block.target, block.parent_hash,
+                   block.is_genesis, block.merkle, block.seal_data, block.get_weight(), len(block.transactions))
+
+    @classmethod
+    def from_dict(cls, data):
+        """ Decodes a header encoded by serialization.header_to_dict; the hash is recomputed, not trusted.
+
+        Raises:
+            ValueError: If the block type is not registered.
+        """
+        block_class = BLOCK_TYPES.get(data["type"])
+        if block_class is None:
+            raise ValueError("Unknown block type " + str(data["type"]))
+        return cls(block_class, data["height"], data["timestamp"], data["target"], data["parent_hash"],
+                   data["is_genesis"], data["merkle"], data["seal_data"])
+
+    # the header encodings (and their memoization) are exactly those of a full block
+    __setattr__ = Block.__setattr__
+    unsealed_header = Block.unsealed_header
+    header = Block.header
+    calculate_hash = Block.calculate_hash
+
+    def shell(self):
+        """ Builds a block of the right type carrying only this header, so seal and weight rules can be reused. """
+        block = self.block_class.__new__(self.block_class)
+        for name in ["height", "timestamp", "target", "parent_hash", "is_genesis", "merkle", "seal_data", "hash"]:
+            setattr(block, name, getattr(self, name))
+        block.transactions = []
+        return block
+
+    def seal_is_valid(self):
+        """ Returns True iff the seal is valid under the rules of the header's block type. """
+        return self.shell().seal_is_valid()
+
+    def get_weight(self):
+        """ Returns the consensus weight of the block under the rules of the header's block type. """
+        return self.weight
@@ -0,0 +1,424 @@
+import time
+import asyncio
+import logging
+import collections
+import config
+import blockchain
+from concurrent.futures import ThreadPoolExecutor
+from blockchain.protocol import read_message, write_message
+from blockchain.serialization import block_to_dict, block_from_dict, tx_to_dict, tx_from_dict
+from blockchain.sync import best_chain_hashes, headers_after
+from blockchain.compact_block import CompactBlock, reconstruct
+
+logger = logging.getLogger(__name__)
+
+# errors raised while handling a malformed message or invalid data from a peer, which then gets disconnected
+PROTOCOL_ERRORS = (KeyError, TypeError, ValueError, AttributeError, IndexError)
+
+class Peer(object):
+
+    def __init__(self, reader, writer):
+        """ One TCP connection to another node.
+
+        Args:
+            reader (:obj:`asyncio.StreamReader`): Incoming side of the connection.
+            writer (:obj:`asyncio.StreamWriter`): Outgoing side of the connection.
+
+        Attributes:
+            known_inventory (:obj:`set` of (str, str)): (kind, hash) items the peer is known to have, never re-announced to it.
+            pending (:obj:`list` of (str, str)): Items we want from this peer but have not requested yet.
+            in_flight (:obj:`OrderedDict` of ((str, str) to float)): Items requested from this peer whose response has
+                not arrived, with the times they were requested, oldest first.
+            timer (:obj:`asyncio.TimerHandle`): Checks the oldest request for a timeout (None if nothing is in flight).
+        """
+        self.reader = reader
+        self.writer = writer
+        self.known_inventory = set()
+        self.pending = []
+        self.in_flight = collections.OrderedDict()
+        self.timer = None
+        self.task = None
+
+    def send(self, message):
+        write_message(self.writer, message)
+
+class Node(object):
+
+    def __init__(self, chain=None, host=None, port=0, max_in_flight=16, save=False, compact=True):
+        """ An asyncio gossip node; announces blocks and transactions to peers by hash and fetches what it lacks.
+
+        All access to the chain happens on a single worker thread, so block validation never blocks the
+        event loop and ZODB objects are never touched from two threads at once.
+
+        Args:
+            chain (:obj:`Blockchain`, optional): Chain to serve and extend (defaults to the global blockchain.chain).
+            host (str, optional): Interface to listen on (defaults to config.NODE_HOST).
+            port (int, optional): Port to listen on; 0 picks a free port.
+            max_in_flight (int, optional): Maximum outstanding data requests per peer (pipeline depth).
+            save (bool, optional): Whether accepted blocks are committed to the database.
+            compact (bool, optional): Whether newly announced blocks are fetched as compact blocks (see blockchain.compact_block).
+
+        Attributes:
+            mempool (:obj:`OrderedDict` of (str to :obj:`Transaction`)): Valid transactions heard about but not yet in
+                a block, oldest first; at most config.NODE_MAX_MEMPOOL are kept.
+            orphans (:obj:`dict` of (str to (:obj:`list` of :obj:`Block`))): Maps missing parent hashes to received blocks waiting for them.
+            orphan_hashes (:obj:`OrderedDict` of (str to (str, float))): Parent hash and arrival time of every orphan, by
+                hash, oldest first; at most config.NODE_MAX_ORPHANS are kept, for config.NODE_ORPHAN_SECONDS.
+            peers (:obj:`list` of :obj:`Peer`): Open connections.
+            requested (:obj:`set` of (str, str)): Items pending or in flight from some peer; a request unanswered
+                for config.NODE_REQUEST_SECONDS is sent to another peer that announced the item.
+            partial_blocks (:obj:`OrderedDict` of (str to (:obj:`PartialBlock`, float))): Compact blocks waiting for
+                missing transactions and their arrival times, oldest first; bounded like the orphans (by
+                config.NODE_MAX_PARTIAL_BLOCKS).
+            compact_stats (:obj:`dict` of (str to int)): Counts of compact blocks reconstructed from local data,
+                completed after a round trip, and abandoned for the full block.
+        """
+        self.chain = chain if chain is not None else blockchain.chain
+        self.host = host if host is not None else config.NODE_HOST
+        self.port = port
+        self.max_in_flight = max_in_flight
+        self.save = save
+        self.compact = compact
+        self.mempool = collections.OrderedDict()
+        self.orphans = {}
+        self.orphan_hashes = collections.OrderedDict()
+        self.peers = []
+        self.requested = set()
+        self.partial_blocks = collections.OrderedDict()
+        self.compact_stats = {"reconstructed": 0, "round_trips": 0, "failed": 0}
+        self.server = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self):
+        """ Starts listening for peers; self.port holds the bound port afterwards. """
+        self.server = await asyncio.start_server(self._accept, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """ Closes the listening socket and every peer connection. """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for peer in list(self.peers):
+            peer.writer.close()
+            if peer.task is not None:
+                peer.task.cancel()
+            if peer.timer is not None:
+                peer.timer.cancel()
+        self.peers = []
+        # (waits for a chain access still running on the worker thread without blocking the event loop)
+        await asyncio.get_event_loop().run_in_executor(None, self.executor.shutdown)
+
+    async def connect(self, host, port):
+        """ Opens an outgoing connection to another node.
+
+        Returns:
+            :obj:`Peer`: The new peer.
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        return await self._add_peer(reader, writer)
+
+    async def _accept(self, reader, writer):
+        await self._add_peer(reader, writer)
+
+    async def _add_peer(self, reader, writer):
+        peer = Peer(reader, writer)
+        self.peers.append(peer)
+        peer.task = asyncio.ensure_future(self._serve(peer))
+        # greet the peer with our best chain so it can catch up from it
+        hashes = await self._call(best_chain_hashes, self.chain)
+        if hashes:
+            self._send_inv(peer, [("block", block_hash) for block_hash in hashes])
+            await peer.writer.drain()
+        return peer
+
+    async def _call(self, function, *args):
+        """ Runs a chain access on the worker thread. """
+        return await asyncio.get_event_loop().run_in_executor(self.executor, function, *args)
+
+    async def submit_block(self, block):
+        """ Adds a locally produced block to the chain and announces it to every peer.
+
+        Returns:
+            bool: True if the block was accepted.
+        """
+        accepted = await self._call(self._connect_block, block)
+        if accepted:
+            await self._announce(("block", block.hash))
+        return accepted
+
+    async def submit_tx(self, tx):
+        """ Adds a locally produced transaction to the mempool and announces it to every peer.
+
+        Returns:
+            bool: True if the transaction was new and well-formed.
+        """
+        accepted = await self._call(self._accept_tx, tx)
+        if accepted:
+            await self._announce(("tx", tx.hash))
+        return accepted
+
+    async def _announce(self, item, source=None):
+        for peer in self.peers:
+            if peer is not source and item not in peer.known_inventory:
+                self._send_inv(peer, [item])
+                await peer.writer.drain()
+
+    def _send_inv(self, peer, items):
+        peer.known_inventory.update(items)
+        peer.send({"type": "inv", "items": [list(item) for item in items]})
+
+    async def _serve(self, peer):
+        try:
+            while True:
+                message = await read_message(peer.reader)
+                await self._handle(peer, message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except PROTOCOL_ERRORS as error:
+            logger.warning("Disconnecting peer %s after protocol error: %r", peer.writer.get_extra_info("peername"), error)
+        finally:
+            if peer in self.peers:
+                self.peers.remove(peer)
+            # (so other peers are asked for what this one was to send)
+            for item in list(peer.in_flight) + peer.pending:
+                self.requested.discard(self._request_key(item))
+            if peer.timer is not None:
+                peer.timer.cancel()
+            peer.writer.close()
+
+    async def _handle(self, peer, message):
+        kind = message["type"]
+        if kind == "inv":
+            items = [tuple(item) for item in message["items"]]
+            peer.known_inventory.update(items)
+            wanted = await self._call(self._missing, items)
+            for item in wanted:
+                if item not in self.requested:
+                    self.requested.add(item)
+                    # a single new block is most likely a fresh tip whose transactions we have already seen
+                    if self.compact and item[0] == "block" and len(items) == 1:
+                        item = ("cmpctblock", item[1])
+                    peer.pending.append(item)
+            await self._fill_pipeline(peer)
+        elif kind == "getdata":
+            for item in message["items"]:
+                peer.send(await self._call(self._lookup, tuple(item), peer))
+                await peer.writer.drain()
+        elif kind == "getheaders":
+            headers = await self._call(headers_after, self.chain, message["locator"])
+            peer.send({"type": "headers", "headers": headers})
+            await peer.writer.drain()
+        elif kind == "block":
+            block = block_from_dict(message["block"])
+            self._received(peer, ("block", block.hash))
+            await self._receive_block(peer, block)
+            await self._fill_pipeline(peer)
+        elif kind == "cmpctblock":
+            compact = CompactBlock.from_dict(message["block"])
+            self._received(peer, ("cmpctblock", compact.header["hash"]))
+            partial = await self._call(reconstruct, compact, self.chain, self.mempool)
+            missing = partial.missing_indexes()
+            if missing:
+                self.partial_blocks[compact.header["hash"]] = partial, time.monotonic()
+                expire(self.partial_blocks, config.NODE_MAX_PARTIAL_BLOCKS, lambda entry: entry[1])
+                peer.send({"type": "getblocktxn", "hash": compact.header["hash"], "indexes": missing})
+                await peer.writer.drain()
+            else:
+                self.compact_stats["reconstructed"] += 1
+                await self._complete_compact(peer, partial)
+        elif kind == "getblocktxn":
+            peer.send(await self._call(self._lookup_block_txs, message["hash"], message["indexes"]))
+            await peer.writer.drain()
+        elif kind == "blocktxn":
+            partial = self.partial_blocks.pop(message["hash"], (None, None))[0]
+            if partial is not None:
+                self.compact_stats["round_trips"] += 1
+                partial.fill(message["indexes"], [tx_from_dict(tx) for tx in message["transactions"]])
+                await self._complete_compact(peer, partial)
+        elif kind == "tx":
+            tx = tx_from_dict(message["tx"])
+            self._received(peer, ("tx", tx.hash))
+            if await self._call(self._accept_tx, tx):
+                await self._announce(("tx", tx.hash), source=peer)
+            await self._fill_pipeline(peer)
+        elif kind == "notfound":
+            for item in message["items"]:
+                self._received(peer, tuple(item))
+            await self._fill_pipeline(peer)
+
+    def _received(self, peer, item):
+        peer.in_flight.pop(item, None)
+        self.requested.discard(self._request_key(item))
+        peer.known_inventory.add(self._request_key(item))
+
+    def _request_key(self, item):
+        # compact and full requests for a block are deduplicated together
+        return ("block", item[1]) if item[0] == "cmpctblock" else item
+
+    async def _complete_compact(self, peer, partial):
+        """ Connects a fully reconstructed compact block, falling back to the full block if it does not check out. """
+        try:
+            block = partial.to_block()
+        except ValueError:
+            block = None
+        if block is None or block.hash != partial.header["hash"]:
+            self.compact_stats["failed"] += 1
+            item = ("block", partial.header["hash"])
+            self.requested.add(item)
+            peer.pending.insert(0, item)
+        else:
+            await self._receive_block(peer, block)
+        await self._fill_pipeline(peer)
+
+    async def _fill_pipeline(self, peer):
+        """ Keeps up to max_in_flight requests outstanding without waiting for earlier responses. """
+        if self._send_requests(peer):
+            await peer.writer.drain()
+
+    def _send_requests(self, peer):
+        """ Requests pending items from peer while fewer than max_in_flight are outstanding.
+
+        Returns:
+            bool: True if a request was sent.
+        """
+        free = self.max_in_flight - len(peer.in_flight)
+        if free <= 0 or not peer.pending:
+            return False
+        batch, peer.pending = peer.pending[:free], peer.pending[free:]
+        now = time.monotonic()
+        for item in batch:
+            peer.in_flight[item] = now
+        peer.send({"type": "getdata", "items": [list(item) for item in batch]})
+        if peer.timer is None:
+            self._schedule_timeout(peer)
+        return True
+
+    def _schedule_timeout(self, peer):
+        oldest = next(iter(peer.in_flight.values()))
+        delay = oldest + config.NODE_REQUEST_SECONDS - time.monotonic()
+        peer.timer = asyncio.get_event_loop().call_later(max(delay, 0), self._requests_timed_out, peer)
+
+    def _requests_timed_out(self, peer):
+        """ Gives up on peer's requests older than config.NODE_REQUEST_SECONDS, freeing their pipeline slots and
+        asking another peer that announced each item (if any; otherwise the item is fetched on its next announcement).
+        """
+        peer.timer = None
+        if peer not in self.peers:
+            return
+        cutoff = time.monotonic() - config.NODE_REQUEST_SECONDS
+        while peer.in_flight and next(iter(peer.in_flight.values())) <= cutoff:
+            item = peer.in_flight.popitem(last=False)[0]
+            key = self._request_key(item)
+            self.requested.discard(key)
+            for other in self.peers:
+                if other is not peer and key in other.known_inventory:
+                    self.requested.add(key)
+                    other.pending.append(key)
+                    self._send_requests(other)
+                    break
+        self._send_requests(peer)
+        if peer.in_flight and peer.timer is None:
+            self._schedule_timeout(peer)
+
+    async def _receive_block(self, peer, block):
+        """ Connects a block received from peer, keeping it as an orphan (and fetching its parent) if the parent is
+        missing; an invalid block is a protocol error (raises ValueError).
+        """
+        if await self._call(self._connect_block, block):
+            await self._announce(("block", block.hash), source=peer)
+            for child in self.orphans.pop(block.hash, []):
+                del self.orphan_hashes[child.hash]
+                try:
+                    await self._receive_block(peer, child)
+                except ValueError as error: # (the child may have come from another peer, so peer is not blamed)
+                    logger.warning("Dropped orphan block: %s", error)
+        elif await self._call(self._is_orphan, block):
+            if block.hash in self.orphan_hashes:
+                return
+            self.orphans.setdefault(block.parent_hash, []).append(block)
+            self.orphan_hashes[block.hash] = block.parent_hash, time.monotonic()
+            for orphan_hash, (parent_hash, received) in expire(self.orphan_hashes, config.NODE_MAX_ORPHANS, lambda entry: entry[1]):
+                siblings = self.orphans[parent_hash]
+                siblings[:] = [sibling for sibling in siblings if sibling.hash != orphan_hash]
+                if not siblings:
+                    del self.orphans[parent_hash]
+            parent = ("block", block.parent_hash)
+            if parent not in self.requested:
+                self.requested.add(parent)
+                peer.pending.insert(0, parent)
+        elif not await self._call(self._is_known, block.hash):
+            raise ValueError("Invalid block " + block.hash)
+
+    # ( the methods below run on the worker thread )
+
+    def _missing(self, items):
+        missing = []
+        for kind, item_hash in items:
+            if kind == "block" and item_hash not in self.chain.headers and item_hash not in self.orphan_hashes:
+                missing.append((kind, item_hash))
+            elif kind == "tx" and item_hash not in self.mempool and not self.chain.has_seen_tx(item_hash):
+                missing.append((kind, item_hash))
+        return missing
+
+    def _lookup(self, item, peer):
+        kind, item_hash = item
+        if kind == "block" and item_hash in self.chain.headers:
+            return {"type": "block", "block": block_to_dict(self.chain.get_block(item_hash))}
+        if kind == "cmpctblock" and item_hash in self.chain.headers:
+            # send in full only the transactions the peer has not announced or been told about
+            peer_has = set(tx_hash for known_kind, tx_hash in peer.known_inventory if known_kind == "tx")
+            compact = CompactBlock.from_block(self.chain.get_block(item_hash), peer_has)
+            return {"type": "cmpctblock", "block": compact.to_dict()}
+        if kind == "tx":
+            tx = self.mempool.get(item_hash, self.chain.all_transactions.get(item_hash))
+            if tx is not None:
+                return {"type": "tx", "tx": tx_to_dict(tx)}
+        return {"type": "notfound", "items": [list(item)]}
+
+    def _lookup_block_txs(self, block_hash, indexes):
+        transactions = self.chain.get_block(block_hash).transactions
+        return {"type": "blocktxn", "hash": block_hash, "indexes": indexes,
+                "transactions": [tx_to_dict(transactions[index]) for index in indexes]}
+
+    def _is_orphan(self, block):
+        return not block.is_genesis and block.parent_hash not in self.chain.headers
+
+    def _is_known(self, block_hash):
+        return block_hash in self.chain.headers
+
+    def _connect_block(self, block):
+        if self._is_orphan(block):
+            return False
+        if not self.chain.add_block(block, save=self.save):
+            return False
+        for tx in block.transactions:
+            self.mempool.pop(tx.hash, None)
+        return True
+
+    def _accept_tx(self, tx):
+        if tx.hash in self.mempool or self.chain.has_seen_tx(tx.hash) or not tx.is_valid():
+            return False
+        self.mempool[tx.hash] = tx
+        # (the oldest transactions are dropped first)
+        while len(self.mempool) > config.NODE_MAX_MEMPOOL:
+            self.mempool.popitem(last=False)
+        return True
+
+def expire(table, limit, received):
+    """ Drops the oldest entries of an OrderedDict (in insertion order) beyond limit entries, or older than
+    config.NODE_ORPHAN_SECONDS.
+
+    Args:
+        table (:obj:`OrderedDict`): Entries, oldest first.
+        limit (int): Number of entries to keep at most.
+        received (function): Returns the arrival time (time.monotonic) of an entry's value.
+
+    Returns:
+        (:obj:`list` of (object, object)): The dropped keys and values.
+    """
+    dropped = []
+    cutoff = time.monotonic() - config.NODE_ORPHAN_SECONDS
+    while table and (len(table) > limit or received(next(iter(table.values()))) < cutoff):
+        dropped.append(table.popitem(last=False))
+    return dropped
@@ -0,0 +1,127 @@
+def hash_key(hex_hash):
+    """ Converts a hex hash to the compact key used inside the chain's indexes (without interning it, see
+    Blockchain.intern_hash).
+
+    Args:
+        hex_hash (str or bytes): Hex-encoded SHA256^2 hash, or a key already.
+
+    Returns:
+        bytes or str: The 32 raw hash bytes; strings that are not 64-digit hex (e.g. made-up
+        references in tests) are returned unchanged.
+    """
+    if type(hex_hash) is bytes:
+        return hex_hash
+    if len(hex_hash) == 64:
+        try:
+            return bytes.fromhex(hex_hash)
+        except ValueError:
+            pass
+    return hex_hash
+
+def hash_hex(key):
+    """ Converts an index key back to the hex hash used at the API and UI edge. """
+    if type(key) is bytes:
+        return key.hex()
+    return key
+
+class OutPoint(object):
+    """ A reference to one output of a transaction; the parsed form of an input_ref string "tx_hash:index". """
+
+    __slots__ = ("tx_hash", "index")
+
+    def __init__(self, tx_hash, index):
+        """
+        Args:
+            tx_hash (bytes or str): Key of the transaction holding the output (see hash_key).
+            index (int): Position of the output in that transaction's outputs.
+        """
+        self.tx_hash = tx_hash
+        self.index = index
+
+    @classmethod
+    def parse(cls, input_ref):
+        """ Parses an input_ref string of the form "tx_hash:index".
+
+        Raises:
+            ValueError: If the index is not an integer.
+        """
+        if isinstance(input_ref, OutPoint):
+            return input_ref
+        tx_hash, index = input_ref.split(":")[:2]
+        return cls(hash_key(tx_hash), int(index))
+
+    def tx_hex(self):
+        """ Returns the hex hash of the referenced transaction. """
+        return hash_hex(self.tx_hash)
+
+    def __eq__(self, other):
+        return isinstance(other, OutPoint) and self.index == other.index and self.tx_hash == other.tx_hash
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.tx_hash, self.index))
+
+    def __reduce__(self):
+        return (OutPoint, (self.tx_hash, self.index))
+
+    def __str__(self):
+        return self.tx_hex() + ":" + str(self.index)
+
+    def __repr__(self):
+        return "OutPoint(" + str(self) + ")"
+
+class HashIndex(dict):
+    """ A dict keyed by binary hashes (interned by the chain that fills it, see Blockchain.intern_hash) that still
+    accepts hex hashes everywhere a key is expected.
+    """
+
+    def __getitem__(self, key):
+        return dict.__getitem__(self, hash_key(key))
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, hash_key(key), value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, hash_key(key))
+
+    def __contains__(self, key):
+        return dict.__contains__(self, hash_key(key))
+
+    def get(self, key, default=None):
+        return dict.get(self, hash_key(key), default)
+
+    def pop(self, key, *default):
+        return dict.pop(self, hash_key(key), *default)
+
+    def setdefault(self, key, default=None):
+        return dict.setdefault(self, hash_key(key), default)
+
+    def hex_keys(self):
+        """ Returns the keys as hex hashes. """
+        return [hash_hex(key) for key in self]
+
+class OutPointIndex(dict):
+    """ A dict keyed by :obj:`OutPoint` that also accepts "tx_hash:index" strings as keys. """
+
+    def __getitem__(self, key):
+        return dict.__getitem__(self, OutPoint.parse(key))
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, OutPoint.parse(key), value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, OutPoint.parse(key))
+
+    def __contains__(self, key):
+        return dict.__contains__(self, OutPoint.parse(key))
+
+    def get(self, key, default=None):
+        return dict.get(self, OutPoint.parse(key), default)
+
+    def pop(self, key, *default):
+        return dict.pop(self, OutPoint.parse(key), *default)
+
+    def setdefault(self, key, default=None):
+        return dict.setdefault(self, OutPoint.parse(key), default)
@@ -1,10 +1,6 @@
-
-import blockchain
 from blockchain.block import Block
 import config
 import binascii
-import ecdsa
-from ecdsa import SigningKey, VerifyingKey
 
 class PoABlock(Block):
     """ Extends Block, adding proof-of-work primitives. """
@@ -20,6 +16,9 @@ class PoABlock(Block):
         if self.seal_data == 0:
             return False
 
+        import ecdsa # deferred: only PoA chains need it, and it is slow to import
+        from ecdsa import VerifyingKey
+
         # Decode signature to bytes, verify it
         signature = binascii.unhexlify(hex(self.seal_data)[2:].zfill(96))
         pk = VerifyingKey.from_string(self.get_public_key())
@@ -50,6 +49,7 @@ class PoABlock(Block):
         # (if seal is invalid, repeat)
 
         # Placeholder for (1b)
+        from ecdsa import SigningKey
         signed_key = SigningKey.from_string(self.get_private_key())
         new_seal_data = signed_key.sign(self.unsealed_header().encode("utf8"))
         while not self.seal_is_valid():
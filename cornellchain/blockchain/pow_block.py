@@ -1,5 +1,5 @@
-import blockchain
 from blockchain.block import Block
+from blockchain.context import current_chain
 from blockchain.util import nonempty_intersection
 
 class PoWBlock(Block):
@@ -40,7 +40,8 @@ class PoWBlock(Block):
         """ For simplicity, we will just keep a constant target / difficulty
         for now; in real cryptocurrencies, the target adjusts based on some
         formula based on the parent's target, and the difference in timestamps
-        between blocks  indicating mining is too slow or quick. """
+        between blocks  indicating mining is too slow or quick.
+        The parent is looked up in the current chain (see blockchain.context). """
         if self.parent_hash == "genesis":
             return int(2 ** 248)
-        return blockchain.chain.blocks[self.parent_hash].target
+        return current_chain().headers[self.parent_hash].target
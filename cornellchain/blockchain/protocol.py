@@ -0,0 +1,67 @@
+import json
+import struct
+
+# Every message is a 4-byte big-endian length followed by that many bytes of UTF-8 JSON
+HEADER = struct.Struct(">I")
+MAX_MESSAGE_SIZE = 32 * 1024 * 1024
+
+def encode_message(message):
+    """ Frames a message (a JSON-compatible dict with a "type" key) for the wire.
+
+    Args:
+        message (dict): Message to encode.
+
+    Returns:
+        bytes: Length-prefixed encoding of the message.
+    """
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return HEADER.pack(len(payload)) + payload
+
+def decode_payload(payload):
+    """ Decodes the body of a framed message. """
+    return json.loads(payload.decode("utf-8"))
+
+def check_length(length):
+    """ Rejects frames larger than MAX_MESSAGE_SIZE. """
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError("Message of " + str(length) + " bytes exceeds limit")
+    return length
+
+async def read_message(reader):
+    """ Reads one message from an asyncio stream.
+
+    Args:
+        reader (:obj:`asyncio.StreamReader`): Stream to read from.
+
+    Returns:
+        dict: The decoded message.
+
+    Raises:
+        asyncio.IncompleteReadError: If the stream closes mid-message.
+    """
+    length = check_length(HEADER.unpack(await reader.readexactly(HEADER.size))[0])
+    return decode_payload(await reader.readexactly(length))
+
+def write_message(writer, message):
+    """ Queues one message on an asyncio stream (the caller should drain the writer). """
+    writer.write(encode_message(message))
+
+def recv_exactly(sock, size):
+    """ Reads exactly size bytes from a blocking socket. """
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+def send_message(sock, message):
+    """ Sends one message over a blocking socket. """
+    sock.sendall(encode_message(message))
+
+def recv_message(sock):
+    """ Reads one message from a blocking socket. """
+    length = check_length(HEADER.unpack(recv_exactly(sock, HEADER.size))[0])
+    return decode_payload(recv_exactly(sock, length))
@@ -0,0 +1,119 @@
+from blockchain.transaction import Transaction, TransactionOutput
+from blockchain.pow_block import PoWBlock
+from blockchain.poa_block import PoABlock
+from blockchain.test_block import TestBlock
+
+# Block classes that may be reconstructed from the wire, by class name
+BLOCK_TYPES = {}
+
+def register_block_type(block_class):
+    """ Allows blocks of the given class to be decoded by block_from_dict.
+
+    Args:
+        block_class (type): Concrete subclass of :obj:`Block`.
+
+    Returns:
+        type: block_class, so this can be used as a class decorator.
+    """
+    BLOCK_TYPES[block_class.__name__] = block_class
+    return block_class
+
+for _block_class in [PoWBlock, PoABlock, TestBlock]:
+    register_block_type(_block_class)
+
+def tx_to_dict(tx):
+    """ Encodes a transaction as a JSON-compatible dict.
+
+    Args:
+        tx (:obj:`Transaction`): Transaction to encode.
+
+    Returns:
+        dict: Encoded transaction; its hash is recomputed on decode.
+    """
+    return {"input_refs": list(tx.input_refs),
+            "outputs": [[out.sender, out.receiver, out.amount] for out in tx.outputs]}
+
+def tx_from_dict(data):
+    """ Decodes a transaction encoded by tx_to_dict.
+
+    Args:
+        data (dict): Encoded transaction.
+
+    Returns:
+        :obj:`Transaction`: The decoded transaction.
+    """
+    outputs = [TransactionOutput(sender, receiver, amount) for sender, receiver, amount in data["outputs"]]
+    return Transaction(list(data["input_refs"]), outputs)
+
+def header_to_dict(block):
+    """ Encodes only the header fields of a block (everything except its transactions).
+
+    Args:
+        block (:obj:`Block` or :obj:`BlockHeader`): Block (or stored header of a block) to encode.
+
+    Returns:
+        dict: Encoded header, including the block's class name and hash.
+    """
+    block_class = getattr(block, "block_class", type(block))
+    return {"type": block_class.__name__, "height": block.height, "timestamp": block.timestamp,
+            "target": block.target, "parent_hash": block.parent_hash, "is_genesis": block.is_genesis,
+            "merkle": block.merkle, "seal_data": block.seal_data, "hash": block.hash}
+
+def block_to_dict(block):
+    """ Encodes a block and all of its transactions as a JSON-compatible dict.
+
+    Args:
+        block (:obj:`Block`): Block to encode.
+
+    Returns:
+        dict: Encoded block.
+    """
+    data = header_to_dict(block)
+    data["transactions"] = [tx_to_dict(tx) for tx in block.transactions]
+    return data
+
+def block_from_header(header, transactions):
+    """ Builds a block from an encoded header and already decoded transactions.
+
+    The block is rebuilt field by field rather than through its constructor, so
+    the timestamp and target are taken from the header instead of being recomputed.
+    The hash is always recomputed from the header fields.
+
+    Args:
+        header (dict): Encoded header, as returned by header_to_dict.
+        transactions (:obj:`list` of :obj:`Transaction`): The block's transactions.
+
+    Returns:
+        :obj:`Block`: The block.
+
+    Raises:
+        ValueError: If the block type is not registered.
+    """
+    block_class = BLOCK_TYPES.get(header["type"])
+    if block_class is None:
+        raise ValueError("Unknown block type " + str(header["type"]))
+    block = block_class.__new__(block_class)
+    block.height = header["height"]
+    block.timestamp = header["timestamp"]
+    block.target = header["target"]
+    block.parent_hash = header["parent_hash"]
+    block.is_genesis = header["is_genesis"]
+    block.merkle = header["merkle"]
+    block.seal_data = header["seal_data"]
+    block.transactions = transactions
+    block.hash = block.calculate_hash()
+    return block
+
+def block_from_dict(data):
+    """ Decodes a block encoded by block_to_dict (see block_from_header).
+
+    Args:
+        data (dict): Encoded block.
+
+    Returns:
+        :obj:`Block`: The decoded block.
+
+    Raises:
+        ValueError: If the block type is not registered.
+    """
+    return block_from_header(data, [tx_from_dict(tx) for tx in data["transactions"]])
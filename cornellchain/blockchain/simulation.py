@@ -0,0 +1,247 @@
+import time
+import heapq
+import random
+import blockchain
+from blockchain.stress import StressBlock, MAX_OUTPUTS
+from blockchain.transaction import Transaction, TransactionOutput
+
+# owner of every simulated output
+USER = "Simulated user"
+
+class SimulatedBlock(StressBlock):
+    """ Block with a trivial seal: the simulator draws mining times instead of hashing, so every seal is valid and
+    every block weighs 1. The seal data is a serial number, which keeps the hashes of otherwise equal blocks apart.
+    """
+
+class SimulatedNode(object):
+
+    def __init__(self, node_id, share):
+        """ A node of the simulated network, with its own :obj:`Blockchain` in memory.
+
+        Args:
+            node_id (int): Position of the node in Simulation.nodes.
+            share (float): Fraction of the network's hash rate it mines with (0 for nodes that only relay).
+
+        Attributes:
+            chain (:obj:`Blockchain`): The node's chain; holds every block the node has validated.
+            tip (str): Hash of the heaviest tip as of the last validation that finished; mined on.
+            peers (:obj:`list` of (:obj:`SimulatedNode`, float)): Linked nodes and the one-way latency to each.
+            busy_until (float): Time the node finishes validating the blocks it has received (it validates one at a time).
+            seen (set of str): Hashes of blocks received, so each is validated once.
+            orphans (:obj:`dict` of (str to :obj:`list` of :obj:`Block`)): Blocks received before their parent, by parent hash.
+            accepted (:obj:`dict` of (str to float)): Time each valid block finished validating on this node.
+        """
+        self.node_id = node_id
+        self.share = share
+        self.chain = blockchain.Blockchain()
+        self.tip = None
+        self.peers = []
+        self.busy_until = 0.0
+        self.seen = set()
+        self.orphans = {}
+        self.accepted = {}
+
+class Simulation(object):
+
+    def __init__(self, num_nodes=20, shares=None, interval=600.0, latency=2.0, degree=4, txs_per_block=10,
+                 validation_scale=1.0, confirmations=6, seed=0):
+        """ Discrete-event simulation of a proof-of-work network: miners find blocks at exponentially distributed
+        intervals in proportion to their hash rate, and blocks spread over links with fixed latencies, each node
+        validating them one at a time with the real Block.is_valid against its own :obj:`Blockchain` before mining
+        on them or relaying them. Nothing is hashed or stored, so hours of network time run in seconds.
+
+        A block's validation time is measured once, as its miner validates it (no verdict is cached yet), and
+        charged (times validation_scale) to every node that validates it.
+
+        Args:
+            num_nodes (int, optional): Number of nodes.
+            shares (:obj:`list` of float, optional): Hash rate of each node, normalized to sum to 1 (default equal;
+                give 0 for nodes that do not mine).
+            interval (float, optional): Mean seconds between blocks, network-wide.
+            latency (float, optional): Mean one-way link latency in seconds; each link gets a fixed latency drawn
+                uniformly from half to one and a half times this.
+            degree (int, optional): Random links each node opens, on top of a ring linking all nodes.
+            txs_per_block (int, optional): Transactions per block, each moving one unspent output on the miner's chain
+                (outputs spent on another fork are skipped, since the rules reject them; ten per transaction slot are
+                created at genesis, so losses to orphaned blocks rarely leave blocks short).
+            validation_scale (float, optional): Factor applied to measured validation times, e.g. to model slower nodes.
+            confirmations (int, optional): Depth at which a block counts as final (see report).
+            seed (int, optional): Seed of every random choice, so a run can be reproduced (exactly with a validation_scale
+                of 0; otherwise timings vary with the measured validation times).
+
+        Attributes:
+            nodes (:obj:`list` of :obj:`SimulatedNode`): The nodes.
+            now (float): Current simulated time in seconds.
+            mined (:obj:`dict` of (str to (float, int))): Time each block was mined and its height, by hash.
+            validation_cost (:obj:`dict` of (str to float)): Measured validation seconds of each block, by hash.
+            ingested (int): Blocks added to some node's chain.
+            ingested_txs (int): Transactions in them.
+            ingest_seconds (float): Wall-clock time spent adding them.
+        """
+        self.rng = random.Random(seed)
+        shares = shares if shares is not None else [1.0] * num_nodes
+        total = float(sum(shares))
+        self.nodes = [SimulatedNode(node_id, share / total) for node_id, share in enumerate(shares)]
+        self.miners = [node for node in self.nodes if node.share > 0]
+        self.interval = interval
+        self.txs_per_block = txs_per_block
+        self.validation_scale = validation_scale
+        self.confirmations = confirmations
+        self.now = 0.0
+        self.events = [] # heap of (time, sequence, action, arguments)
+        self.sequence = 0
+        self.mined = {}
+        self.validation_cost = {}
+        self.ingested = self.ingested_txs = 0
+        self.ingest_seconds = 0.0
+        self.link(latency, degree)
+        self.genesis = self.create_genesis()
+        for node in self.nodes:
+            self.add(node, self.genesis)
+            node.tip = self.genesis.hash
+            node.seen.add(self.genesis.hash)
+
+    def link(self, latency, degree):
+        """ Connects every node to the next (a ring, so the network is connected) and to degree random others. """
+        count = len(self.nodes)
+        pairs = set()
+        for node_id in range(count):
+            if count > 1:
+                pairs.add(tuple(sorted((node_id, (node_id + 1) % count))))
+            for peer_id in self.rng.sample(range(count), min(degree, count)):
+                if peer_id != node_id:
+                    pairs.add(tuple(sorted((node_id, peer_id))))
+        for first, second in sorted(pairs):
+            delay = latency * self.rng.uniform(0.5, 1.5)
+            self.nodes[first].peers.append((self.nodes[second], delay))
+            self.nodes[second].peers.append((self.nodes[first], delay))
+
+    def create_genesis(self):
+        """ Creates the genesis block, holding the outputs the simulated transactions spend (see txs_per_block). """
+        count = max(1, -(-self.txs_per_block * 10 // MAX_OUTPUTS))
+        funding = [Transaction([], [TransactionOutput("Genesis " + str(i), USER, 1) for j in range(MAX_OUTPUTS)]) for i in range(count)]
+        genesis = SimulatedBlock(0, funding, "genesis", is_genesis=True)
+        genesis.timestamp = 0
+        genesis.set_seal_data(0)
+        return genesis
+
+    def schedule(self, delay, action, *arguments):
+        self.sequence += 1
+        heapq.heappush(self.events, (self.now + delay, self.sequence, action, arguments))
+
+    def add(self, node, block):
+        """ Adds a block to a node's chain, timing it for the ingest throughput; returns whether it was valid. """
+        start = time.perf_counter()
+        added = node.chain.add_block(block, save=False)
+        self.ingest_seconds += time.perf_counter() - start
+        if added:
+            self.ingested += 1
+            self.ingested_txs += len(block.transactions)
+        return added
+
+    def run(self, hours):
+        """ Advances the simulation by hours of simulated time.
+
+        Returns:
+            (dict): The report, see report.
+        """
+        end = self.now + hours * 3600
+        if self.miners and not any(action == self.mine for when, sequence, action, arguments in self.events):
+            self.schedule(self.rng.expovariate(1.0 / self.interval), self.mine)
+        while self.events and self.events[0][0] <= end:
+            self.now, sequence, action, arguments = heapq.heappop(self.events)
+            action(*arguments)
+        self.now = end
+        return self.report()
+
+    def mine(self):
+        """ Event: a block is found, by a miner picked in proportion to hash rate, on that miner's tip. """
+        miner = self.rng.choices(self.miners, [node.share for node in self.miners])[0]
+        parent = miner.chain.headers[miner.tip]
+        refs = [ref for ref, amount in miner.chain.get_user_utxos(USER, miner.tip) if not miner.chain.is_spent(ref)]
+        txs = [Transaction([ref], [TransactionOutput(USER, USER, 1)]) for ref in refs[:self.txs_per_block]]
+        block = SimulatedBlock(parent.height + 1, txs, parent.hash, chain=miner.chain)
+        block.timestamp = int(self.now)
+        block.set_seal_data(len(self.mined) + 1)
+        start = time.perf_counter()
+        valid, message = block.is_valid(miner.chain)
+        self.validation_cost[block.hash] = time.perf_counter() - start
+        if not valid:
+            raise ValueError("Simulated block rejected: " + message)
+        self.mined[block.hash] = self.now, block.height
+        miner.seen.add(block.hash)
+        self.add(miner, block)
+        self.accept(miner, block, miner.chain.get_heaviest_chain_tip_hash(), None)
+        self.schedule(self.rng.expovariate(1.0 / self.interval), self.mine)
+
+    def receive(self, node, block, sender):
+        """ Event: a block arrives at a node over a link; it is validated once the node is done with earlier ones. """
+        if block.hash in node.seen:
+            return
+        node.seen.add(block.hash)
+        if block.parent_hash not in node.chain.headers:
+            node.orphans.setdefault(block.parent_hash, []).append((block, sender))
+            return
+        self.validate(node, block, sender)
+
+    def validate(self, node, block, sender):
+        """ Adds a block to a node's chain and schedules the end of its validation, when the node starts mining on
+        the new tip and relays the block (the chain already holds it; events before then see node.tip only).
+        """
+        start = max(self.now, node.busy_until)
+        node.busy_until = start + self.validation_cost[block.hash] * self.validation_scale
+        if self.add(node, block):
+            self.schedule(node.busy_until - self.now, self.accept, node, block, node.chain.get_heaviest_chain_tip_hash(), sender)
+
+    def accept(self, node, block, tip, sender):
+        """ Event: a node has validated a block. """
+        node.accepted[block.hash] = self.now
+        node.tip = tip
+        for peer, delay in node.peers:
+            if peer is not sender:
+                self.schedule(delay, self.receive, peer, block, node)
+        for orphan, orphan_sender in node.orphans.pop(block.hash, []):
+            self.validate(node, orphan, orphan_sender)
+
+    def report(self):
+        """ Summarizes the run so far, from the chain of the node with the most validated blocks.
+
+        Blocks count as final once confirmations blocks are built on them, and only blocks at heights that are
+        final are counted towards the orphan rate, since later ones may still be reorganized.
+
+        Returns:
+            (dict): "node_hours" simulated; "blocks" mined; "orphan_rate", the fraction of final-height blocks off
+            the best chain; median and 90th percentile "finality_seconds" (from mining a best-chain block until
+            every node has validated the block confirmations above it) and "propagation_seconds" (until every node
+            has validated it); "ingest_blocks_per_second" and "ingest_txs_per_second", the wall-clock rate at
+            which nodes added blocks to their chains; and "validation_seconds", the mean measured validation time.
+        """
+        observer = max(self.nodes, key=lambda node: len(node.accepted))
+        best = observer.chain.get_chain_ending_with(observer.chain.get_heaviest_chain_tip_hash())
+        best.reverse()
+        final_height = len(best) - 1 - self.confirmations
+        on_best = set(best)
+        settled = [block_hash for block_hash, (mined, height) in self.mined.items() if height <= final_height]
+        finality, propagation = [], []
+        for height in range(1, len(best)):
+            block_hash = best[height]
+            times = [node.accepted.get(block_hash) for node in self.nodes]
+            if None not in times:
+                propagation.append(max(times) - self.mined[block_hash][0])
+            if height + self.confirmations < len(best):
+                final = [node.accepted.get(best[height + self.confirmations]) for node in self.nodes]
+                if None not in final:
+                    finality.append(max(final) - self.mined[block_hash][0])
+        return {"node_hours": len(self.nodes) * self.now / 3600, "blocks": len(self.mined),
+                "orphan_rate": sum(1 for block_hash in settled if block_hash not in on_best) / len(settled) if settled else 0.0,
+                "finality_seconds": percentiles(finality), "propagation_seconds": percentiles(propagation),
+                "ingest_blocks_per_second": self.ingested / self.ingest_seconds if self.ingest_seconds else 0.0,
+                "ingest_txs_per_second": self.ingested_txs / self.ingest_seconds if self.ingest_seconds else 0.0,
+                "validation_seconds": sum(self.validation_cost.values()) / len(self.validation_cost) if self.validation_cost else 0.0}
+
+def percentiles(values):
+    """ Returns the median and 90th percentile of values as a (float, float) pair, or (None, None) if empty. """
+    if not values:
+        return None, None
+    values = sorted(values)
+    return values[len(values) // 2], values[min(len(values) - 1, int(len(values) * 0.9))]
@@ -0,0 +1,249 @@
+import re
+import time
+import zlib
+import lzma
+import collections
+import config
+import ZODB, ZODB.broken, ZODB.FileStorage, ZODB.utils
+from blockchain.transaction import Transaction, LegacyTransactionOutput
+from blockchain.serialization import BLOCK_TYPES
+
+# classes stored under a name that now refers to something else, (module, name) -> class to load
+LEGACY_CLASSES = {("blockchain.transaction", "TransactionOutput"): LegacyTransactionOutput}
+
+class Database(ZODB.DB):
+    """ ZODB database holding the blockchain; loads objects stored by older versions as their legacy classes
+    (see LEGACY_CLASSES), so Blockchain.migrate can convert them.
+    """
+
+    def classFactory(self, connection, modulename, globalname):
+        if (modulename, globalname) in LEGACY_CLASSES:
+            return LEGACY_CLASSES[(modulename, globalname)]
+        return ZODB.broken.find_global(modulename, globalname)
+
+# prefixes of compressed records; uncompressed ZODB records start with a pickle opcode, never with "."
+ZLIB_PREFIX = b".z"
+LZMA_PREFIX = b".x"
+DICTIONARY_PREFIX = b".d" # followed by the CRC-32 of the dictionary, as 4 big-endian bytes
+
+CODECS = [None, "zlib", "lzma"]
+
+def is_body_record(data):
+    """ Returns True iff a database record holds a transaction or a block (of a type in serialization.BLOCK_TYPES),
+    i.e. what CompressedStorage compresses; headers, indexes and everything else stay as they are.
+    """
+    module, name = ZODB.utils.get_pickle_metadata(data)
+    if (module, name) == (Transaction.__module__, Transaction.__name__):
+        return True
+    block_class = BLOCK_TYPES.get(name)
+    return block_class is not None and block_class.__module__ == module
+
+def load_dictionary(path):
+    """ Reads a preset dictionary written by train_dictionary; returns None if path is None. """
+    if path is None:
+        return None
+    with open(path, "rb") as dictionary_file:
+        return dictionary_file.read()
+
+def train_dictionary(records, size=32 * 1024, min_share=0.02):
+    """ Builds a zlib preset dictionary from sample records: the strings (class and attribute names, user names,
+    common hash prefixes) found in at least min_share of them, most frequent last, since zlib finds recent bytes
+    cheapest, after one whole sample for the pickle structure around them.
+
+    Args:
+        records (:obj:`list` of bytes): Uncompressed sample records (see is_body_record).
+        size (int, optional): Maximum dictionary size; zlib only looks back 32 KiB.
+        min_share (float, optional): Fraction of the samples a string must occur in.
+
+    Returns:
+        bytes: The dictionary.
+    """
+    counts = collections.Counter()
+    for record in records:
+        strings = re.findall(rb"[\x20-\x7e]{3,}", record)
+        # hex hashes are random, apart from the leading zeros of proof-of-work block hashes
+        counts.update(set(string[:16] if len(string) == 64 else string for string in strings))
+    common = [string for string, count in counts.most_common() if count >= min_share * len(records)]
+    dictionary = (records[0] if records else b"") + b"".join(reversed(common))
+    return dictionary[-size:]
+
+class CompressedStorage(object):
+
+    def __init__(self, base, codec=None, level=6, dictionary=None, remote=False):
+        """ Wraps a storage, compressing transaction and block records as they are stored and decompressing
+        them as they are loaded (ZODB's storage wrapper protocol, which FileStorage also uses to pack and to
+        resolve conflicts). Objects are loaded on first access, so a block's transactions are only decompressed
+        when they are used; headers and indexes are not compressed at all. Records are decoded by their prefix,
+        so records written with any codec, or none, can always be read.
+
+        Args:
+            base: The storage holding the records (a FileStorage, or a ZEO client, in which case the records
+                travel and are stored compressed, and the server cannot pack them).
+            codec (str, optional): Compression for new records: None, "zlib" or "lzma" (see CODECS).
+            level (int, optional): Compression level (zlib 0-9, lzma preset 0-9).
+            dictionary (bytes, optional): zlib preset dictionary (see train_dictionary), used with "zlib".
+            remote (bool, optional): Whether base is a ZEO client, which packs on the server (see can_pack).
+
+        Attributes:
+            compressed_records (int): Records compressed when stored.
+            stored_bytes (int): Their total size before compression.
+            compressed_bytes (int): Their total size after compression.
+            decoded_records (int): Compressed records loaded.
+            decoded_bytes (int): Their total size after decompression.
+            decode_seconds (float): Time spent decompressing them.
+        """
+        if codec not in CODECS:
+            raise ValueError("Unknown codec " + repr(codec) + " in config.COMPRESSION")
+        self.base = base
+        self.codec = codec
+        self.level = level
+        self.dictionary = dictionary
+        self.dictionary_id = zlib.crc32(dictionary).to_bytes(4, "big") if dictionary is not None else None
+        self.remote = remote
+        self.db = None
+        self.compressed_records = self.stored_bytes = self.compressed_bytes = 0
+        self.decoded_records = self.decoded_bytes = 0
+        self.decode_seconds = 0.0
+
+    def __getattr__(self, name):
+        return getattr(self.base, name)
+
+    def __len__(self):
+        return len(self.base)
+
+    def compress(self, data):
+        """ Returns a record as it should be stored. """
+        if self.codec is None or not data or data[:1] == b"." or not is_body_record(data):
+            return data
+        if self.codec == "lzma":
+            packed = LZMA_PREFIX + lzma.compress(data, preset=self.level)
+        elif self.dictionary is not None:
+            compressor = zlib.compressobj(self.level, zdict=self.dictionary)
+            packed = DICTIONARY_PREFIX + self.dictionary_id + compressor.compress(data) + compressor.flush()
+        else:
+            packed = ZLIB_PREFIX + zlib.compress(data, self.level)
+        if len(packed) >= len(data):
+            return data
+        self.compressed_records += 1
+        self.stored_bytes += len(data)
+        self.compressed_bytes += len(packed)
+        return packed
+
+    def decompress(self, data):
+        """ Returns a stored record as it was before compression.
+
+        Raises:
+            ValueError: If the record was compressed with a dictionary other than this storage's.
+        """
+        if not data or data[:1] != b".":
+            return data
+        start = time.perf_counter()
+        prefix = data[:2]
+        if prefix == ZLIB_PREFIX:
+            data = zlib.decompress(data[2:])
+        elif prefix == LZMA_PREFIX:
+            data = lzma.decompress(data[2:])
+        elif prefix == DICTIONARY_PREFIX:
+            if data[2:6] != self.dictionary_id:
+                raise ValueError("Record compressed with another dictionary than config.COMPRESSION_DICTIONARY")
+            decompressor = zlib.decompressobj(zdict=self.dictionary)
+            data = decompressor.decompress(data[6:]) + decompressor.flush()
+        else:
+            raise ValueError("Unknown record prefix " + repr(prefix))
+        self.decoded_records += 1
+        self.decoded_bytes += len(data)
+        self.decode_seconds += time.perf_counter() - start
+        return data
+
+    def stats(self):
+        """ Returns the counters above, the compression ratio (uncompressed / compressed size of the records
+        compressed so far) and the decode throughput in bytes per second, as a dict.
+        """
+        return {"compressed_records": self.compressed_records, "stored_bytes": self.stored_bytes,
+                "compressed_bytes": self.compressed_bytes,
+                "ratio": self.stored_bytes / self.compressed_bytes if self.compressed_bytes else 0.0,
+                "decoded_records": self.decoded_records, "decoded_bytes": self.decoded_bytes,
+                "decode_bytes_per_second": self.decoded_bytes / self.decode_seconds if self.decode_seconds else 0.0}
+
+    # storage methods that handle record data (everything else is the base storage's)
+
+    def load(self, oid, version=""):
+        data, serial = self.base.load(oid, version)
+        return self.decompress(data), serial
+
+    def loadBefore(self, oid, tid):
+        found = self.base.loadBefore(oid, tid)
+        if found is None:
+            return None
+        data, start, end = found
+        return self.decompress(data), start, end
+
+    def loadSerial(self, oid, serial):
+        return self.decompress(self.base.loadSerial(oid, serial))
+
+    def store(self, oid, serial, data, version, transaction):
+        return self.base.store(oid, serial, self.compress(data), version, transaction)
+
+    def restore(self, oid, serial, data, version, prev_txn, transaction):
+        return self.base.restore(oid, serial, self.compress(data) if data is not None else None, version, prev_txn, transaction)
+
+    def can_pack(self):
+        """ Returns False iff this is a ZEO client compressing records: the storage server packs with its own
+        reference finder, which cannot read compressed records, so it would fail, or drop objects only they refer to.
+        """
+        return not (self.remote and self.codec is not None)
+
+    def pack(self, pack_time, referencesf, gc=None):
+        """
+        Raises:
+            ValueError: If the storage server would have to read compressed records (see can_pack).
+        """
+        if not self.can_pack():
+            raise ValueError("The storage server cannot pack compressed records; pack the database in \"file\" mode")
+        return self.base.pack(pack_time, lambda data, oids=None: referencesf(self.decompress(data), oids), gc)
+
+    # the storage wrapper protocol, for the database above and the base storage below
+
+    def registerDB(self, db):
+        self.db = db
+        self.base.registerDB(self)
+
+    def invalidate(self, transaction_id, oids):
+        self.db.invalidate(transaction_id, oids)
+
+    def invalidateCache(self):
+        self.db.invalidateCache()
+
+    def references(self, record, oids=None):
+        return self.db.references(self.decompress(record), oids)
+
+    def transform_record_data(self, data):
+        return self.compress(self.db.transform_record_data(data))
+
+    def untransform_record_data(self, data):
+        return self.db.untransform_record_data(self.decompress(data))
+
+def open_storage(read_only=False):
+    """ Opens the storage selected by config.STORAGE: the FileStorage at config.DB_PATH, which only one process
+    can have open at a time, or a client of the ZEO storage server at config.ZEO_HOST/ZEO_PORT
+    (see run_storage_server.py), which any number of processes can share.
+
+    Args:
+        read_only (bool, optional): Open without write access (ZEO clients only; a FileStorage is always opened
+            read-write, since a read-only one would not see later commits).
+
+    Either is wrapped in a :obj:`CompressedStorage` compressing block bodies as config.COMPRESSION says.
+
+    Returns:
+        The storage, to open a :obj:`Database` on.
+    """
+    if config.STORAGE == "zeo":
+        import ZEO # only needed in storage server mode
+        # the client cache lives in memory; every commit is pushed to all clients as invalidations
+        base = ZEO.client((config.ZEO_HOST, config.ZEO_PORT), read_only=read_only, wait_timeout=config.ZEO_WAIT_TIMEOUT)
+    elif config.STORAGE == "file":
+        base = ZODB.FileStorage.FileStorage(config.DB_PATH)
+    else:
+        raise ValueError("Unknown storage " + repr(config.STORAGE) + " in config.STORAGE")
+    return CompressedStorage(base, config.COMPRESSION, config.COMPRESSION_LEVEL, load_dictionary(config.COMPRESSION_DICTIONARY),
+                             remote=config.STORAGE == "zeo")
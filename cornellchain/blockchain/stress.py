@@ -0,0 +1,119 @@
+import time
+from blockchain.pow_block import PoWBlock
+from blockchain.transaction import Transaction, TransactionOutput
+from blockchain.verdicts import tx_verdicts
+
+# benchmark_validation.py holds Block.is_valid to at most this long per input spent by the block, plus per block of
+# the chain it extends (the ancestry walk for double transaction inclusion, done at most once per block); about 5x
+# and 50x what a full 900-transaction block takes on a laptop (the tests check how the time scales instead)
+MAX_SECONDS_PER_INPUT = 0.0001
+MAX_SECONDS_PER_ANCESTOR = 0.00005
+
+# largest blocks the rules allow (see Block.is_valid and Transaction.is_valid)
+MAX_TXS = 900
+MAX_INPUTS = 9
+MAX_OUTPUTS = 9
+
+ATTACKER = "Mallory"
+
+class StressBlock(PoWBlock):
+    """ PoW block that is never mined: the stress corpus measures validation, so every rule but the seal is checked. """
+
+    def seal_is_valid(self):
+        return True
+
+    def calculate_appropriate_target(self):
+        return int(2 ** 256)
+
+def funding_block(num_outputs):
+    """ Creates a genesis block paying the attacker num_outputs outputs of 1, up to MAX_TXS * MAX_OUTPUTS.
+
+    Returns:
+        (:obj:`StressBlock`, :obj:`list` of str): The block, and the input references of its outputs.
+    """
+    txs, refs = [], []
+    for first in range(0, num_outputs, MAX_OUTPUTS):
+        # (senders numbered so the transactions differ)
+        tx = Transaction([], [TransactionOutput("Genesis " + str(first), ATTACKER, 1) for i in range(min(MAX_OUTPUTS, num_outputs - first))])
+        txs.append(tx)
+        refs.extend(tx.hash + ":" + str(index) for index in range(len(tx.outputs)))
+    return StressBlock(0, txs, "genesis", is_genesis=True), refs
+
+def extend(chain, parent, length):
+    """ Adds length empty blocks on top of parent; returns the last one. """
+    for i in range(length):
+        block = StressBlock(parent.height + 1, [], parent.hash)
+        if not chain.add_block(block, save=False):
+            raise ValueError("Stress block rejected: " + block.is_valid(chain)[1])
+        parent = block
+    return parent
+
+def wide_block(parent, refs):
+    """ MAX_TXS transactions spending MAX_INPUTS outputs each, from refs (outputs already on the chain). """
+    txs = []
+    for first in range(0, min(len(refs), MAX_TXS * MAX_INPUTS), MAX_INPUTS):
+        inputs = refs[first:first + MAX_INPUTS]
+        txs.append(Transaction(inputs, [TransactionOutput(ATTACKER, ATTACKER, 1)]))
+    return StressBlock(parent.height + 1, txs, parent.hash)
+
+def dependency_chain_block(parent, ref, num_txs=MAX_TXS):
+    """ num_txs transactions, each spending the output of the one before it in the same block. """
+    txs = []
+    for i in range(num_txs):
+        tx = Transaction([ref], [TransactionOutput(ATTACKER, ATTACKER, 1)])
+        txs.append(tx)
+        ref = tx.hash + ":0"
+    return StressBlock(parent.height + 1, txs, parent.hash)
+
+def late_double_spend_block(parent, refs, num_txs=MAX_TXS):
+    """ A wide block of num_txs transactions whose last transaction spends an input of the first again. """
+    block = wide_block(parent, refs[:(num_txs - 1) * MAX_INPUTS])
+    txs = block.transactions + [Transaction([refs[0]], [TransactionOutput(ATTACKER, ATTACKER, 1)])]
+    return StressBlock(parent.height + 1, txs, parent.hash)
+
+def worst_case_blocks(chain, depth=1000, num_txs=MAX_TXS):
+    """ Sets up chain (a new, empty Blockchain) and returns the worst-case blocks to validate against it:
+    a chain depth blocks deep, with a transaction on a stale fork at its base that the deep blocks replay.
+
+    Args:
+        chain (:obj:`Blockchain`): Empty chain to build on (blocks are added without committing).
+        depth (int, optional): Number of blocks between genesis and the tip the worst-case blocks extend.
+        num_txs (int, optional): Number of transactions in each block (the largest allowed by default).
+
+    Returns:
+        (:obj:`list` of (str, :obj:`Block`, int)): Name, block and number of inputs it spends, for each case.
+    """
+    genesis, refs = funding_block(MAX_TXS * MAX_OUTPUTS)
+    if not chain.add_block(genesis, save=False):
+        raise ValueError("Stress genesis rejected")
+    refs, (chained, replayed_ref) = refs[:-2], refs[-2:]
+    replayed = Transaction([replayed_ref], [TransactionOutput(ATTACKER, ATTACKER, 1)])
+    if not chain.add_block(StressBlock(1, [replayed], genesis.hash), save=False):
+        raise ValueError("Stress fork rejected")
+    tip = extend(chain, genesis, depth)
+    cases = [
+        ("wide", wide_block(tip, refs[:num_txs * MAX_INPUTS])),
+        ("dependency chain", dependency_chain_block(tip, chained, num_txs)),
+        ("late double spend", late_double_spend_block(tip, refs, num_txs)),
+        ("deep replay", StressBlock(tip.height + 1, wide_block(tip, refs[:(num_txs - 1) * MAX_INPUTS]).transactions + [replayed], tip.hash)),
+    ]
+    return [(name, block, sum(len(tx.input_refs) for tx in block.transactions)) for name, block in cases]
+
+def time_validation(chain, block, clock=time.perf_counter):
+    """ Validates a block with empty verdict caches, so nothing is reused from earlier runs.
+
+    Args:
+        clock (function): Clock to time with; time.process_time leaves out time other processes got.
+
+    Returns:
+        (float, (bool, str)): Seconds taken, and the verdict.
+    """
+    tx_verdicts.clear()
+    chain.get_block_verdicts().clear()
+    start = clock()
+    verdict = block.is_valid(chain)
+    return clock() - start, verdict
+
+def bound(inputs, depth):
+    """ Returns the longest validation of a block spending inputs outputs, depth blocks above genesis, may take. """
+    return MAX_SECONDS_PER_INPUT * inputs + MAX_SECONDS_PER_ANCESTOR * depth
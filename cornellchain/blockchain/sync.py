@@ -0,0 +1,252 @@
+import types
+import socket
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from blockchain.context import using_chain
+from blockchain.header import BlockHeader
+from blockchain.protocol import send_message, recv_message
+from blockchain.serialization import header_to_dict, block_to_dict, block_from_dict
+
+MAX_HEADERS = 2000
+
+def best_chain_hashes(chain):
+    """ Returns the hashes of the heaviest chain, oldest first (empty for an empty chain). """
+    tip = chain.get_heaviest_chain_tip()
+    if tip is None:
+        return []
+    hashes = chain.get_chain_ending_with(tip.hash)
+    hashes.reverse()
+    return hashes
+
+def chain_locator(chain):
+    """ Summarizes the local best chain for a peer: the last 10 hashes, then exponentially sparser ones back to genesis.
+
+    Returns:
+        (:obj:`list` of str): Block hashes, newest first.
+    """
+    hashes = best_chain_hashes(chain)
+    locator = []
+    index, step = len(hashes) - 1, 1
+    while index > 0:
+        locator.append(hashes[index])
+        if len(locator) >= 10:
+            step *= 2
+        index -= step
+    if hashes:
+        locator.append(hashes[0])
+    return locator
+
+def headers_after(chain, locator, limit=MAX_HEADERS):
+    """ Answers a header request: the best chain headers following the newest locator hash we share.
+
+    Args:
+        chain (:obj:`Blockchain`): Chain to serve headers from.
+        locator (:obj:`list` of str): Locator of the requesting peer (see chain_locator).
+        limit (int, optional): Maximum number of headers to return.
+
+    Returns:
+        (:obj:`list` of dict): Encoded headers, oldest first.
+    """
+    hashes = best_chain_hashes(chain)
+    positions = {block_hash: i for i, block_hash in enumerate(hashes)}
+    start = 0
+    for block_hash in locator:
+        if block_hash in positions:
+            start = positions[block_hash] + 1
+            break
+    return [header_to_dict(chain.headers[block_hash]) for block_hash in hashes[start:start + limit]]
+
+class LocalBlockSource(object):
+
+    def __init__(self, chain, limit=MAX_HEADERS):
+        """ Serves headers and blocks from a chain in this process, encoded exactly as on the wire, at most limit
+        headers per request.
+        """
+        self.chain = chain
+        self.limit = limit
+
+    def get_headers(self, locator):
+        return headers_after(self.chain, locator, self.limit)
+
+    def get_blocks(self, block_hashes):
+        return [block_to_dict(self.chain.get_block(block_hash)) for block_hash in block_hashes]
+
+class SocketBlockSource(object):
+
+    def __init__(self, host, port, timeout=30):
+        """ Serves headers and blocks from a gossip node (see blockchain.node) over a blocking localhost socket.
+
+        Requests on one source are serialized; parallelism comes from syncing against several sources.
+        """
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.sock.close()
+
+    def _receive(self, kinds):
+        # the node also gossips inventory to us; skip anything that is not a response
+        while True:
+            message = recv_message(self.sock)
+            if message["type"] in kinds:
+                return message
+
+    def get_headers(self, locator):
+        with self.lock:
+            send_message(self.sock, {"type": "getheaders", "locator": locator})
+            return self._receive(["headers"])["headers"]
+
+    def get_blocks(self, block_hashes):
+        with self.lock:
+            send_message(self.sock, {"type": "getdata", "items": [["block", block_hash] for block_hash in block_hashes]})
+            blocks = []
+            for i in range(len(block_hashes)):
+                message = self._receive(["block", "notfound"])
+                if message["type"] == "notfound":
+                    raise LookupError("Source is missing block " + message["items"][0][1])
+                blocks.append(message["block"])
+            return blocks
+
+class HeadersFirstSync(object):
+
+    def __init__(self, chain, sources, window=16, windows_ahead=4, save=False):
+        """ Syncs a chain by validating header chains first, then downloading bodies of the heaviest one in parallel.
+
+        Args:
+            chain (:obj:`Blockchain`): Chain to extend.
+            sources (list): Block sources (objects with get_headers(locator) and get_blocks(hashes)).
+            window (int, optional): Number of blocks fetched per request.
+            windows_ahead (int, optional): Number of windows downloaded ahead of the one being connected.
+            save (bool, optional): Whether connected blocks are committed to the database.
+        """
+        self.chain = chain
+        self.sources = sources
+        self.window = window
+        self.windows_ahead = windows_ahead
+        self.save = save
+
+    def validate_headers(self, headers):
+        """ Checks that headers form a chain extending our own: hashes, linkage, heights, timestamps, targets and seals.
+
+        Args:
+            headers (:obj:`list` of :obj:`BlockHeader`): Headers, oldest first.
+
+        Returns:
+            bool, str, int: Validity, an error or success message, and the total weight of the chain they end.
+        """
+        if not headers:
+            return False, "No headers", 0
+        first = headers[0]
+        if first.is_genesis:
+            parent, weight = None, 0
+        elif first.parent_hash in self.chain.headers:
+            parent = self.chain.headers[first.parent_hash]
+            weight = self.chain.get_total_weight(parent.hash) # (kept in the parent's header record)
+        else:
+            return False, "Nonexistent parent", 0
+        # targets are worked out from the parent's, which is either in our chain or earlier in headers
+        checked = {}
+        parents = types.SimpleNamespace(headers=collections.ChainMap(checked, self.chain.headers))
+        for header in headers:
+            with using_chain(parents):
+                if header.target != header.shell().calculate_appropriate_target():
+                    return False, "Invalid target", 0
+            if header.is_genesis:
+                if parent is not None or header.height != 0 or header.parent_hash != "genesis":
+                    return False, "Invalid genesis", 0
+            else:
+                if parent is None or header.parent_hash != parent.hash:
+                    return False, "Nonexistent parent", 0
+                if header.height != parent.height + 1:
+                    return False, "Invalid height", 0
+                if header.timestamp < parent.timestamp:
+                    return False, "Invalid timestamp", 0
+                if not header.seal_is_valid():
+                    return False, "Invalid seal", 0
+            weight += header.get_weight()
+            parent = checked[header.hash] = header
+        return True, "All checks passed", weight
+
+    def download_headers(self, source, locator):
+        """ Downloads a source's headers following our chain, repeating the request from the last header received
+        until the source has no more (sources answer at most MAX_HEADERS at a time).
+
+        Returns:
+            (:obj:`list` of :obj:`BlockHeader`): The headers not yet in our chain, oldest first.
+        """
+        headers, request = [], locator
+        while True:
+            batch = [BlockHeader.from_dict(data) for data in source.get_headers(request)]
+            batch = [header for header in batch if header.hash not in self.chain.headers]
+            if not batch or (headers and batch[-1].hash == headers[-1].hash):
+                return headers
+            headers.extend(batch)
+            request = [batch[-1].hash] + locator
+
+    def best_header_chain(self):
+        """ Downloads and validates the complete header chain of every source, keeping the heaviest.
+
+        Returns:
+            (:obj:`list` of :obj:`BlockHeader`), (:obj:`list` of sources): Headers of the heaviest chain not yet
+            in our chain (oldest first), and the sources serving it; empty lists if nothing beats our tip.
+        """
+        locator = chain_locator(self.chain)
+        tip = self.chain.get_heaviest_chain_tip()
+        best_weight = self.chain.get_all_block_weights()[tip.hash] if tip is not None else 0
+        best, best_sources = [], []
+        for source in self.sources:
+            headers = self.download_headers(source, locator)
+            if not headers:
+                continue
+            valid, message, weight = self.validate_headers(headers)
+            if not valid:
+                continue
+            if weight > best_weight:
+                best, best_sources, best_weight = headers, [source], weight
+            elif best and weight == best_weight and headers[-1].hash == best[-1].hash:
+                best_sources.append(source)
+        return best, best_sources
+
+    def _fetch(self, headers, sources, window_number):
+        """ Downloads one window of bodies, rotating through sources until one returns matching blocks. """
+        errors = []
+        for attempt in range(len(sources)):
+            source = sources[(window_number + attempt) % len(sources)]
+            try:
+                blocks = [block_from_dict(data) for data in source.get_blocks([header.hash for header in headers])]
+            except (LookupError, ConnectionError, OSError, ValueError, KeyError) as error:
+                errors.append(error)
+                continue
+            if [block.hash for block in blocks] == [header.hash for header in headers]:
+                return blocks
+        raise LookupError("No source returned window " + str(window_number) + ": " + str(errors))
+
+    def sync(self):
+        """ Runs a full headers-first sync against all sources.
+
+        Returns:
+            int: Number of blocks connected to the chain.
+        """
+        headers, sources = self.best_header_chain()
+        if not headers:
+            return 0
+        windows = [headers[i:i + self.window] for i in range(0, len(headers), self.window)]
+        connected = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(len(sources), self.windows_ahead))) as executor:
+            futures = {}
+            for window_number in range(min(self.windows_ahead, len(windows))):
+                futures[window_number] = executor.submit(self._fetch, windows[window_number], sources, window_number)
+            for window_number in range(len(windows)):
+                blocks = futures.pop(window_number).result()
+                next_window = window_number + self.windows_ahead
+                if next_window < len(windows):
+                    futures[next_window] = executor.submit(self._fetch, windows[next_window], sources, next_window)
+                # bodies arrive in parallel but are connected strictly in chain order
+                for block in blocks:
+                    if not self.chain.add_block(block, save=self.save):
+                        for future in futures.values():
+                            future.cancel()
+                        return connected
+                    connected += 1
+        return connected
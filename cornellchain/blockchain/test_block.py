@@ -5,6 +5,6 @@ class TestBlock(PoWBlock):
         use if you need to to test e.g. block validity features.
     """
 
-    def is_valid(self):
+    def is_valid(self, chain=None):
         return True, "TEST BLOCK"
 
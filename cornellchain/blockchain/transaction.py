@@ -1,24 +1,59 @@
 from blockchain.util import encode_as_str, sha256_2_string
+from blockchain.outpoint import OutPoint
 import persistent
+import operator
 
-class TransactionOutput(persistent.Persistent):
+class TransactionOutput(tuple):
+    """ Class representing a transaction output in the UTXO model.
+    Outputs are immutable (sender, receiver, amount) tuples stored inline in their transaction's database record.
 
-    def __init__(self, sender, receiver, amount):
-        """ Class representing a transaction output in the UTXO model.
+    Args:
+        sender (str): Account sending (creating) the output.
+        receiver (str): Account receiving (and later potentially spending) the output.
+        amount (int): Amount being transferred.
+    """
 
-        Args:
-            sender (str): Account sending (creating) the output.
-            receiver (str): Account receiving (and later potentially spending) the output.
-            amount (int): Amount being transferred.
-        """
+    __slots__ = ()
+
+    def __new__(cls, sender, receiver, amount):
+        return tuple.__new__(cls, (sender, receiver, amount))
+
+    sender = property(operator.itemgetter(0), doc="str: Account sending (creating) the output.")
+    receiver = property(operator.itemgetter(1), doc="str: Account receiving the output.")
+    amount = property(operator.itemgetter(2), doc="int: Amount being transferred.")
+
+    def __reduce__(self):
+        # pickled under a different global than the legacy persistent class, see blockchain.storage.Database
+        return (_load_output, tuple(self))
+
+    def __repr__(self):
+        """ Gets unique string representation of an output. """
+        return encode_as_str([self.sender, self.receiver, self.amount], sep="~")
+
+def _load_output(sender, receiver, amount):
+    return TransactionOutput(sender, receiver, amount)
+
+class LegacyTransactionOutput(persistent.Persistent):
+    """ An output as stored by older versions, each in its own database record.
+    Databases refer to this class as blockchain.transaction.TransactionOutput (see blockchain.storage.Database);
+    Blockchain.migrate replaces every instance with a :obj:`TransactionOutput`.
+    """
+
+    def __init__(self, sender, receiver, amount):
         self.sender = sender
         self.receiver = receiver
         self.amount = amount
 
+    def to_output(self):
+        """ Returns the equivalent compact :obj:`TransactionOutput`. """
+        return TransactionOutput(self.sender, self.receiver, self.amount)
+
     def __repr__(self):
-        """ Gets unique string representation of an output. """
         return encode_as_str([self.sender, self.receiver, self.amount], sep="~")
 
+# fields encoded by header(); assigning one drops the memoized encodings
+TRANSACTION_FIELDS = frozenset(["input_refs", "outputs"])
+
 class Transaction(persistent.Persistent):
 
     def __init__(self, input_refs, outputs):
@@ -33,6 +68,16 @@ class Transaction(persistent.Persistent):
         self.outputs = outputs
         self.hash = self.calculate_hash()
 
+    def __setattr__(self, name, value):
+        # derived values are memoized in volatile attributes (never stored); drop them when a field they encode changes
+        if name in TRANSACTION_FIELDS:
+            self._v_header = self._v_repr = self._v_leaf_hash = None
+            if name == "input_refs":
+                self._v_outpoints = None
+        elif name == "hash":
+            self._v_repr = self._v_leaf_hash = None
+        persistent.Persistent.__setattr__(self, name, value)
+
     def calculate_hash(self):
         """ Get the hash of the block header.
 
@@ -41,14 +86,49 @@ class Transaction(persistent.Persistent):
         """
         return sha256_2_string(str(self.header()))
 
+    def get_outpoints(self):
+        """ Get the parsed form of every input reference, parsing them only once per loaded transaction.
+
+        Returns:
+            (:obj:`list` of :obj:`OutPoint`): One outpoint per entry of self.input_refs.
+
+        Raises:
+            ValueError: If an input reference has a non-integer output index.
+        """
+        outpoints = getattr(self, "_v_outpoints", None) # volatile; never stored in the database
+        if outpoints is None:
+            outpoints = [OutPoint.parse(input_ref) for input_ref in self.input_refs]
+            self._v_outpoints = outpoints
+        return outpoints
+
     def is_valid(self):
         """ Checks if a transaction is well-formed, returning True iff a transaction obeys syntactic rules. """
         return len(self.input_refs) < 10 and len(self.outputs) < 10 and len(self.input_refs) > 0 and len(self.outputs) > 0
 
     def header(self):
-        """ Get string encoding of a transaction's header. """
-        return encode_as_str([";".join(self.input_refs), ";".join([str(out) for out in self.outputs])], sep="-")
+        """ Get string encoding of a transaction's header (memoized). """
+        header = getattr(self, "_v_header", None)
+        if header is None:
+            header = encode_as_str([";".join(self.input_refs), ";".join([str(out) for out in self.outputs])], sep="-")
+            self._v_header = header
+        return header
+
+    def leaf_hash(self):
+        """ Get the hash of this transaction's full encoding, its leaf in a block's Merkle tree (memoized).
+
+        Returns:
+            str: SHA256^2 hash of str(self).
+        """
+        leaf_hash = getattr(self, "_v_leaf_hash", None)
+        if leaf_hash is None:
+            leaf_hash = sha256_2_string(str(self))
+            self._v_leaf_hash = leaf_hash
+        return leaf_hash
 
     def __repr__(self):
-        """ Get unique string encoding of a transaction, including its hash (ID). """
-        return encode_as_str([self.hash, self.header()], sep="-")
+        """ Get unique string encoding of a transaction, including its hash (ID) (memoized). """
+        tx_repr = getattr(self, "_v_repr", None)
+        if tx_repr is None:
+            tx_repr = encode_as_str([self.hash, self.header()], sep="-")
+            self._v_repr = tx_repr
+        return tx_repr
@@ -0,0 +1,179 @@
+import persistent
+from BTrees.OOBTree import OOBTree
+from BTrees.IOBTree import IOBTree
+from blockchain.outpoint import hash_key, hash_hex
+
+def fork_path(chain, old_tip, new_tip):
+    """ Finds the blocks to disconnect and connect to move from one chain tip to another, using header records only.
+
+    Args:
+        chain (:obj:`Blockchain`): Chain holding both tips.
+        old_tip (bytes or str): Hash of the current tip, or None for an empty state.
+        new_tip (bytes or str): Hash of the target tip, or None.
+
+    Returns:
+        (:obj:`list` of :obj:`BlockHeader`, :obj:`list` of :obj:`BlockHeader`): Headers to disconnect, newest
+        first, and headers to connect, oldest first.
+    """
+    def parent(header):
+        return None if header.is_genesis else chain.headers[header.parent_hash]
+
+    old = chain.headers[old_tip] if old_tip is not None else None
+    new = chain.headers[new_tip] if new_tip is not None else None
+    disconnect, connect = [], []
+    while old is not None and (new is None or old.height > new.height):
+        disconnect.append(old)
+        old = parent(old)
+    while new is not None and (old is None or new.height > old.height):
+        connect.append(new)
+        new = parent(new)
+    while old is not None and old.hash != new.hash:
+        disconnect.append(old)
+        old = parent(old)
+        connect.append(new)
+        new = parent(new)
+    connect.reverse()
+    return disconnect, connect
+
+class UtxoIndex(persistent.Persistent):
+
+    def __init__(self):
+        """ Unspent outputs and balance of every user as of one chain tip (normally the heaviest), updated
+        incrementally as blocks are connected and disconnected, so per-user queries cost O(results).
+
+        Attributes:
+            tip (bytes): Hash key of the block whose state the index holds (None for an empty chain).
+            by_user (:obj:`OOBTree` of (str to :obj:`OOBTree`)): Maps each user to its unspent outputs,
+                as (transaction hash key, output index) -> amount.
+            balances (:obj:`OOBTree` of (str to int)): Maps each user to the sum of its unspent outputs.
+            undo (:obj:`OOBTree` of (bytes to tuple)): For every connected block, the outputs it spent as
+                (transaction hash key, output index, receiver, amount) tuples, so it can be disconnected
+                without looking anything up.
+            heights (:obj:`IOBTree` of (int to bytes)): Hash key of the connected block at each height, i.e. the
+                chain ending in tip, so whether a block is on it is one lookup (see Blockchain.is_on_best_chain).
+        """
+        self.tip = None
+        self.by_user = OOBTree()
+        self.balances = OOBTree()
+        self.undo = OOBTree()
+        self.heights = IOBTree()
+
+    def _add_output(self, tx_key, index, receiver, amount):
+        utxos = self.by_user.get(receiver)
+        if utxos is None:
+            utxos = self.by_user[receiver] = OOBTree()
+        utxos[(tx_key, index)] = amount
+        self.balances[receiver] = self.balances.get(receiver, 0) + amount
+
+    def _remove_output(self, tx_key, index, receiver):
+        """ Removes an unspent output if the index holds it; returns its amount, or None. """
+        utxos = self.by_user.get(receiver)
+        if utxos is None or (tx_key, index) not in utxos:
+            return None
+        amount = utxos.pop((tx_key, index))
+        self.balances[receiver] -= amount
+        return amount
+
+    def connect_block(self, chain, block):
+        """ Applies a block on top of the current tip: spends its inputs and adds its outputs. """
+        spent = []
+        for tx in block.transactions:
+            for outpoint in tx.get_outpoints():
+                if type(outpoint.tx_hash) is not bytes or outpoint.tx_hash not in chain.all_transactions:
+                    continue # not an output of a known transaction, so never indexed
+                outputs = chain.get_transaction(outpoint.tx_hash).outputs
+                if outpoint.index >= len(outputs):
+                    continue
+                receiver = outputs[outpoint.index].receiver
+                amount = self._remove_output(outpoint.tx_hash, outpoint.index, receiver)
+                if amount is not None:
+                    spent.append((outpoint.tx_hash, outpoint.index, receiver, amount))
+            tx_key = chain.intern_hash(tx.hash)
+            for index, output in enumerate(tx.outputs):
+                self._add_output(tx_key, index, output.receiver, output.amount)
+        block_key = chain.intern_hash(block.hash)
+        self.undo[block_key] = tuple(spent)
+        self.heights[block.height] = block_key
+        self.tip = block_key
+
+    def disconnect_block(self, chain, block):
+        """ Reverts the current tip block: removes its outputs and restores the outputs it spent. """
+        # restore first: outputs both created and spent inside the block are then removed with the rest
+        for tx_key, index, receiver, amount in reversed(self.undo.pop(hash_key(block.hash))):
+            self._add_output(tx_key, index, receiver, amount)
+        for tx in reversed(block.transactions):
+            tx_key = chain.intern_hash(tx.hash)
+            for index, output in enumerate(tx.outputs):
+                self._remove_output(tx_key, index, output.receiver)
+        del self.heights[block.height]
+        self.tip = None if block.is_genesis else chain.intern_hash(block.parent_hash)
+
+    def update(self, chain, tip_hash):
+        """ Moves the index to a new tip, disconnecting and connecting blocks across any reorganization.
+
+        Args:
+            chain (:obj:`Blockchain`): The chain.
+            tip_hash (str): Hash of the new tip (None for an empty chain).
+
+        Returns:
+            (int, int): Number of blocks disconnected and connected.
+        """
+        if self.tip == (hash_key(tip_hash) if tip_hash is not None else None):
+            return 0, 0
+        disconnect, connect = fork_path(chain, self.tip, tip_hash)
+        for header in disconnect:
+            self.disconnect_block(chain, chain.get_block(header.hash))
+        for header in connect:
+            self.connect_block(chain, chain.get_block(header.hash))
+        return len(disconnect), len(connect)
+
+    def build_heights(self, chain):
+        """ (Re)builds heights from the header records of the chain ending in tip (database migration). """
+        self.heights = IOBTree()
+        if self.tip is not None:
+            for block_hash in chain.get_chain_ending_with(self.tip):
+                self.heights[chain.headers[block_hash].height] = chain.intern_hash(block_hash)
+
+    def get_balance(self, user):
+        """ Returns the total amount of a user's unspent outputs at the index tip. """
+        return self.balances.get(user, 0)
+
+    def get_utxos(self, chain, user, tip_hash=None):
+        """ Returns a user's unspent outputs at the index tip, or at any other block of the chain.
+
+        For another block, the index tip's set is adjusted along the fork path for this user only, so the
+        cost is O(results + transactions between the two tips).
+
+        Args:
+            chain (:obj:`Blockchain`): The chain.
+            user (str): The user.
+            tip_hash (str, optional): Block to query at; defaults to the index tip.
+
+        Returns:
+            (:obj:`dict` of ((bytes, int) to int)): Maps (transaction hash key, output index) to amount.
+        """
+        utxos = dict(self.by_user.get(user, {}).items())
+        if tip_hash is None or hash_key(tip_hash) == self.tip:
+            return utxos
+        disconnect, connect = fork_path(chain, self.tip, tip_hash)
+        for header in disconnect:
+            for tx_key, index, receiver, amount in self.undo[hash_key(header.hash)]:
+                if receiver == user:
+                    utxos[(tx_key, index)] = amount
+            for tx in chain.get_block(header.hash).transactions:
+                tx_key = hash_key(tx.hash)
+                for index, output in enumerate(tx.outputs):
+                    utxos.pop((tx_key, index), None)
+        for header in connect:
+            for tx in chain.get_block(header.hash).transactions:
+                for outpoint in tx.get_outpoints():
+                    utxos.pop((outpoint.tx_hash, outpoint.index), None)
+                tx_key = hash_key(tx.hash)
+                for index, output in enumerate(tx.outputs):
+                    if output.receiver == user:
+                        utxos[(tx_key, index)] = output.amount
+        return utxos
+
+def utxo_refs(utxos):
+    """ Converts a get_utxos result to a list of (input_ref, amount) pairs, input_ref being "tx_hash:index". """
+    return [(hash_hex(tx_key) + ":" + str(index), amount) for (tx_key, index), amount in utxos.items()]
@@ -0,0 +1,102 @@
+import collections
+import threading
+import config
+
+class VerdictCache(object):
+
+    def __init__(self, max_entries):
+        """ Least-recently-used cache of validation verdicts, bounded by their number.
+        Safe to use from several threads validating at once.
+
+        Args:
+            max_entries (int): Maximum number of verdicts kept.
+
+        Attributes:
+            hits (int): Lookups answered from the cache.
+            misses (int): Lookups that found nothing, so the checks had to run.
+            evictions (int): Verdicts dropped to stay within budget.
+        """
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict() # key -> verdict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """ Returns the verdict cached under key, or None. """
+        with self.lock:
+            verdict = self.entries.get(key)
+            if verdict is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, key, verdict):
+        """ Caches a verdict (anything but None) under key, evicting the least recently used if over budget. """
+        with self.lock:
+            self.entries[key] = verdict
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """ Drops every cached verdict and resets the counters. """
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """ Returns hit/miss/eviction counters, the hit rate and current occupancy as a dict. """
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "verdicts": len(self.entries)}
+
+# verdicts of check_inputs by transaction leaf hash (which covers its whole encoding); they hold on any chain, so the
+# cache is shared by every chain in the process and a transaction included in sibling forks is only checked once
+tx_verdicts = VerdictCache(config.TX_VERDICT_CACHE_SIZE)
+
+# not a verdict: the original rules look up every input's output index in the transaction spent by each input, and
+# raise IndexError where one is out of range; Block.is_valid raises it at the same point (see blockchain.differential)
+OUT_OF_RANGE = "Input index out of range"
+
+def check_inputs(tx, outpoints, find_transaction):
+    """ Runs the checks of Block.is_valid that depend only on a transaction and the outputs it spends: every input
+    refers to an existing output, all inputs and outputs belong to the same user, and no money is created.
+
+    Args:
+        tx (:obj:`Transaction`): The transaction.
+        outpoints (:obj:`list` of :obj:`OutPoint`): Its parsed input references (tx.get_outpoints()).
+        find_transaction (function): Returns the transaction with a given hash key (from the chain or the block
+            being validated), or None.
+
+    Returns:
+        ((int, str), bool): The verdict, as the position of the first failing check (the index of the input it failed
+        on, or len(outpoints) for money creation, which is checked after all inputs) and its error message, or
+        (None, None) if all checks pass, or OUT_OF_RANGE as the message where the checks would raise; and whether the verdict may be cached (not if a spent transaction was
+        missing, since it may be added later).
+    """
+    senders = set(output.sender for output in tx.outputs)
+    spent = []
+    for index, outpoint in enumerate(outpoints):
+        target_transaction = find_transaction(outpoint.tx_hash)
+        if target_transaction is None:
+            return (index, "Required output not found"), False
+        if outpoint.index + 1 > len(target_transaction.outputs):
+            return (index, "Required output not found"), True
+        # the spent output was sent to the user sending every output, as were all other inputs
+        receiver = target_transaction.outputs[outpoint.index].receiver
+        if receiver not in senders or len(senders) > 1:
+            return (index, "User inconsistencies"), True
+        if any(other.index >= len(target_transaction.outputs) for other in outpoints):
+            return (index, OUT_OF_RANGE), True
+        if len(set(target_transaction.outputs[other.index].receiver for other in outpoints)) > 1:
+            return (index, "User inconsistencies"), True
+        spent.append(target_transaction.outputs[outpoint.index])
+    for output in spent:
+        if sum(sent.amount for sent in tx.outputs if sent.sender == output.receiver) > output.amount:
+            return (len(outpoints), "Creating money"), True
+    return (None, None), True
@@ -0,0 +1,308 @@
+import time
+import socket
+import select
+import asyncio
+import hashlib
+import collections
+import transaction
+import config
+import blockchain
+from concurrent.futures import ThreadPoolExecutor
+from blockchain.pow_block import PoWBlock
+from blockchain.protocol import read_message, write_message, send_message, recv_message
+
+# nonces tried between checks for a new job pushed by the server
+CHECK_INTERVAL = 4096
+
+def empty_template(chain):
+    """ Default block template: an empty PoW block on the heaviest tip (None for an empty chain). """
+    tip = chain.get_heaviest_chain_tip()
+    if tip is None:
+        return None
+    return PoWBlock(tip.height + 1, [], tip.hash, chain=chain)
+
+def search_nonces(unsealed_header, target, start, end):
+    """ Tries the nonces in [start, end) on an unsealed header, hashing like Block.calculate_hash
+    (SHA256^2 of the header with the nonce appended after a backtick).
+
+    Returns:
+        (int, int): The first nonce whose hash is at most target (None if there is none), and the number of nonces tried.
+    """
+    prefix = hashlib.sha256((unsealed_header + "`").encode("utf-8"))
+    sha256 = hashlib.sha256
+    for nonce in range(start, end):
+        first = prefix.copy()
+        first.update(str(nonce).encode("utf-8"))
+        if int.from_bytes(sha256(first.digest()).digest(), "big") <= target:
+            return nonce, nonce - start + 1
+    return None, end - start
+
+class Job(object):
+
+    def __init__(self, job_id, block):
+        """ A block template being mined; nonces are handed out from next_nonce on, so ranges never overlap.
+
+        Args:
+            job_id (int): Sequence number of the job.
+            block (:obj:`PoWBlock`): The unsealed template.
+        """
+        self.job_id = job_id
+        self.block = block
+        self.next_nonce = 0
+        self.solved = False # set once a solution is being added, so later ones are stale
+
+    def take_range(self, size):
+        """ Returns the next unassigned nonce range as (start, end). """
+        start = self.next_nonce
+        self.next_nonce += size
+        return start, self.next_nonce
+
+    def message(self, size):
+        """ Returns a job message carrying the next nonce range. """
+        start, end = self.take_range(size)
+        return {"type": "job", "job_id": self.job_id, "header": self.block.unsealed_header(),
+                "target": format(self.block.target, "x"), "start": start, "end": end}
+
+class WorkServer(object):
+
+    def __init__(self, chain=None, node=None, host=None, port=0, range_size=None, template=empty_template, save=False):
+        """ Hands out disjoint nonce ranges of one block template to many miner processes over TCP (see
+        run_miner), verifies the solutions they submit, and pushes a new job to every miner whenever the
+        heaviest tip changes, whether through a solution or a block from elsewhere (polled every
+        config.WORK_POLL_SECONDS). Messages use the framing of blockchain.protocol:
+
+            miner -> server: {"type": "getwork", "hashes": n}  (n nonces tried since the last message)
+            miner -> server: {"type": "submit", "job_id": id, "nonce": nonce, "hashes": n}
+            server -> miner: {"type": "job", "job_id": id, "header": unsealed header, "target": hex,
+                              "start": first nonce, "end": nonce after the last}
+            server -> miner: {"type": "result", "accepted": bool, "message": str}
+
+        Like Node, all chain access happens on a single worker thread (the node's, if there is one).
+
+        Args:
+            chain (:obj:`Blockchain`, optional): Chain to extend (defaults to the node's, or else the database chain,
+                opened by start on the worker thread so that commits, which ZODB ties to a thread, reach it).
+            node (:obj:`Node`, optional): Gossip node to submit solved blocks through, so peers hear of them.
+            host (str, optional): Interface to listen on (defaults to config.WORK_HOST).
+            port (int, optional): Port to listen on; 0 picks a free port.
+            range_size (int, optional): Nonces per range (defaults to config.WORK_RANGE_SIZE).
+            template (function, optional): Builds the block to mine from the chain, or returns None if there is none.
+            save (bool, optional): Whether solved blocks are committed to the database (without a node). The database
+                chain only follows blocks committed by other writers (through a storage server) when this is set,
+                since moving to their latest commit discards uncommitted blocks.
+
+        Attributes:
+            job (:obj:`Job`): The current job (None until the chain has a tip).
+            miners (:obj:`list` of :obj:`asyncio.StreamWriter`): Connected miners.
+            blocks_found (int): Solutions accepted.
+            rejected (int): Submissions that failed seal_is_valid or were rejected by the chain.
+            stale (int): Submissions for a job that had already been replaced.
+            hashes (int): Nonces the miners reported trying.
+        """
+        self.node = node
+        self.chain = chain if chain is not None else node.chain if node is not None else None
+        self.host = host if host is not None else config.WORK_HOST
+        self.port = port
+        self.range_size = range_size or config.WORK_RANGE_SIZE
+        self.template = template
+        self.save = save
+        self.job = None
+        self.jobs = 0
+        self.miners = []
+        self.handlers = []
+        self.blocks_found = self.rejected = self.stale = self.hashes = 0
+        self.reports = collections.deque() # (time, hashes) of recent work reports, for the hashrate
+        self.started = time.monotonic()
+        self.server = None
+        self.poller = None
+        self.opened = False # whether start opened the database chain
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self):
+        """ Builds the first job and starts listening; self.port holds the bound port afterwards. """
+        if self.chain is None:
+            self.chain = await self._call(blockchain.open_chain)
+            self.opened = True
+        self.started = time.monotonic()
+        await self.refresh()
+        self.server = await asyncio.start_server(self._accept, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.poller = asyncio.ensure_future(self._poll())
+
+    async def stop(self):
+        """ Closes the listening socket and every miner connection. """
+        if self.poller is not None:
+            self.poller.cancel()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for writer in list(self.miners):
+            writer.close()
+        # (closing a connection ends its handler, which may still be adding a block on the worker thread)
+        await asyncio.gather(*list(self.handlers), return_exceptions=True)
+        self.miners = []
+        self.handlers = []
+        self.executor.shutdown(wait=True)
+
+    async def _call(self, function, *args):
+        """ Runs a chain access on the worker thread. """
+        if self.node is not None:
+            return await self.node._call(function, *args) # (the node's chain is only used from its thread)
+        return await asyncio.get_event_loop().run_in_executor(self.executor, function, *args)
+
+    def _tip(self):
+        if self.opened and self.save:
+            # start a new transaction on this thread (which the connection belongs to), so the connection sees
+            # blocks committed by other writers since the last one
+            transaction.begin()
+        return self.chain.get_heaviest_chain_tip_hash()
+
+    async def refresh(self):
+        """ Replaces the job if the heaviest tip has moved past its parent, and pushes it to every miner.
+
+        Returns:
+            bool: True if there is a new job.
+        """
+        tip = await self._call(self._tip)
+        if tip is None or (self.job is not None and self.job.block.parent_hash == tip):
+            return False
+        block = await self._call(self.template, self.chain)
+        if block is None:
+            return False
+        self.jobs += 1
+        self.job = Job(self.jobs, block)
+        for writer in list(self.miners):
+            write_message(writer, self.job.message(self.range_size))
+        return True
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(config.WORK_POLL_SECONDS)
+            await self.refresh()
+
+    async def _accept(self, reader, writer):
+        self.miners.append(writer)
+        self.handlers.append(asyncio.current_task())
+        try:
+            while True:
+                message = await read_message(reader)
+                self.record_hashes(message.get("hashes", 0))
+                jobs = self.jobs
+                if message.get("type") == "submit":
+                    write_message(writer, await self.submit(message.get("job_id"), message.get("nonce")))
+                # (a job created meanwhile, e.g. after a solution, was already pushed to every miner)
+                if self.job is not None and self.jobs == jobs:
+                    write_message(writer, self.job.message(self.range_size))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            if writer in self.miners:
+                self.miners.remove(writer)
+            if asyncio.current_task() in self.handlers:
+                self.handlers.remove(asyncio.current_task())
+            writer.close()
+
+    async def submit(self, job_id, nonce):
+        """ Checks a solution for a job and, if it seals the template, adds the block to the chain (through the
+        node if there is one) and moves every miner to a new job.
+
+        Returns:
+            dict: The result message for the miner.
+        """
+        job = self.job
+        if job is None or job_id != job.job_id or job.solved:
+            self.stale += 1
+            return {"type": "result", "accepted": False, "message": "Stale job"}
+        if type(nonce) is not int or nonce < 0:
+            self.rejected += 1
+            return {"type": "result", "accepted": False, "message": "Invalid nonce"}
+        job.block.set_seal_data(nonce)
+        if not job.block.seal_is_valid():
+            self.rejected += 1
+            return {"type": "result", "accepted": False, "message": "Invalid seal"}
+        job.solved = True # (before yielding, so no other submission changes the seal while the block is added)
+        if self.node is not None:
+            accepted = await self.node.submit_block(job.block)
+        else:
+            accepted = await self._call(self.chain.add_block, job.block, self.save)
+        if not accepted:
+            self.rejected += 1
+            self.job = None # the template itself is invalid; build another
+            await self.refresh()
+            return {"type": "result", "accepted": False, "message": "Block rejected"}
+        self.blocks_found += 1
+        await self.refresh()
+        return {"type": "result", "accepted": True, "message": job.block.hash}
+
+    def record_hashes(self, hashes):
+        """ Counts nonces a miner reports having tried, for the hashrate. """
+        if hashes:
+            self.hashes += int(hashes)
+            self.reports.append((time.monotonic(), int(hashes)))
+
+    def hashrate(self, window=None):
+        """ Returns the aggregate hashrate of all miners (hashes per second) over the last window seconds
+        (defaults to config.WORK_HASHRATE_WINDOW, or the time since start if shorter), from the work they reported.
+        """
+        window = window or config.WORK_HASHRATE_WINDOW
+        now = time.monotonic()
+        while self.reports and self.reports[0][0] < now - window:
+            self.reports.popleft()
+        return sum(hashes for reported, hashes in self.reports) / max(min(window, now - self.started), 1e-3)
+
+    def stats(self):
+        """ Returns the counters, the number of connected miners and the hashrate as a dict. """
+        return {"miners": len(self.miners), "hashrate": self.hashrate(), "hashes": self.hashes, "jobs": self.jobs,
+                "blocks_found": self.blocks_found, "rejected": self.rejected, "stale": self.stale}
+
+def run_miner(host=None, port=None, max_blocks=None):
+    """ Mines for a WorkServer until it disconnects, or until max_blocks of this miner's solutions were accepted:
+    asks for work, searches each range it is given, and submits the first nonce that seals the job. Between
+    batches of CHECK_INTERVAL nonces it reads any message the server pushed, switching to the newest job.
+
+    Args:
+        host (str, optional): Server address (defaults to config.WORK_HOST).
+        port (int, optional): Server port (defaults to config.WORK_PORT).
+        max_blocks (int, optional): Number of accepted solutions after which to stop.
+
+    Returns:
+        int: Number of accepted solutions.
+    """
+    sock = socket.create_connection((host or config.WORK_HOST, port or config.WORK_PORT))
+    accepted = unreported = 0
+    job, submitted = None, False
+    try:
+        send_message(sock, {"type": "getwork"})
+        while max_blocks is None or accepted < max_blocks:
+            # read every waiting message (or wait until there is work and a submission was answered): results, and
+            # the newest job
+            while job is None or submitted or select.select([sock], [], [], 0)[0]:
+                message = recv_message(sock)
+                if message["type"] == "result":
+                    accepted += 1 if message["accepted"] else 0
+                    submitted = False
+                elif message["type"] == "job":
+                    job = message
+            if max_blocks is not None and accepted >= max_blocks:
+                break
+            target, start, end = int(job["target"], 16), job["start"], job["end"]
+            nonce = None
+            while start < end and nonce is None and not select.select([sock], [], [], 0)[0]:
+                nonce, hashes = search_nonces(job["header"], target, start, min(end, start + CHECK_INTERVAL))
+                unreported += hashes
+                start += hashes
+            if nonce is not None:
+                send_message(sock, {"type": "submit", "job_id": job["job_id"], "nonce": nonce, "hashes": unreported})
+                submitted = True
+            elif start >= end:
+                send_message(sock, {"type": "getwork", "hashes": unreported})
+            else:
+                job = dict(job, start=start) # interrupted by a message; resume unless it brings a new job
+                continue
+            unreported, job = 0, None # the server answers with a job
+    except ConnectionError:
+        pass
+    finally:
+        sock.close()
+    return accepted
@@ -1,6 +1,88 @@
 DB_PATH = "database/blockchain.db"
 
+# Storage: "file" opens DB_PATH directly, which locks it to one process; "zeo" connects to a local storage
+# server (python run_storage_server.py) serving DB_PATH, so one writer (miner, generator or node) and any
+# number of read-only explorer workers can share the chain. Explorer workers open the storage read-only.
+STORAGE = "file"
+ZEO_HOST = "127.0.0.1"
+ZEO_PORT = 8100
+ZEO_WAIT_TIMEOUT = 30 # seconds to wait for the storage server when connecting
+STORAGE_READ_ONLY = False
+
+# Compression of transaction and block records in the database (headers and indexes are never compressed):
+# None, "zlib" or "lzma", at COMPRESSION_LEVEL (0-9). COMPRESSION_DICTIONARY is the path of a zlib preset
+# dictionary (python benchmark_compression.py --train PATH); records written with it need it to be read.
+# Records are decoded by prefix, so changing these only affects new records. In "zeo" mode the clients
+# compress, so pack the database in "file" mode (the storage server cannot read compressed records, so packing
+# through it raises, and migrate_chain.py skips packing after a migration).
+COMPRESSION = None
+COMPRESSION_LEVEL = 6
+COMPRESSION_DICTIONARY = None
+
+# Memory budget for the chain layer: ZODB object cache per connection (objects / bytes, 0 = unlimited),
+# full blocks and transactions kept loaded by Blockchain.get_block / get_transaction before the least
+# recently used are ghosted, and how many of the newest heights to load when the database is opened
+CACHE_SIZE = 100000
+CACHE_SIZE_BYTES = 256 * 1024 * 1024
+MAX_LOADED_BLOCKS = 1000
+MAX_LOADED_TRANSACTIONS = 100000
+WARM_HEIGHTS = 10
+
+# Validation verdicts kept for reuse (see blockchain.verdicts): per transaction, shared by every block including it
+# (e.g. sibling forks), and per block, valid until the next block is added to the chain
+TX_VERDICT_CACHE_SIZE = 100000
+BLOCK_VERDICT_CACHE_SIZE = 10000
+# Fraction of blocks added to the chain that are also validated by the reference validator, logging any
+# disagreement with the optimized one (see blockchain.differential); 0 disables the check
+DIFFERENTIAL_SAMPLE_RATE = 0
+# Bloom filters in front of the "seen transaction" and "spent input" indexes (see Blockchain.get_filters), so
+# lookups of keys that are not there skip the index: sized BLOOM_HEADROOM times the index (at least
+# BLOOM_MIN_KEYS keys) for a BLOOM_ERROR_RATE false-positive rate. Off by default: the indexes are dicts loaded
+# with the chain, whose misses cost less than a filter check; worth enabling when index lookups hit storage.
+BLOOM_FILTERS = False
+BLOOM_ERROR_RATE = 0.01
+BLOOM_HEADROOM = 2
+BLOOM_MIN_KEYS = 1024
+
+# Pruning (see Blockchain.prune): every PRUNE_INTERVAL blocks, forks more than PRUNE_DEPTH blocks below the heaviest
+# tip move to the compressed cold archive at ARCHIVE_PATH and leave the indexes, as do the bodies of best-chain
+# blocks that deep with PRUNE_TRANSACTIONS; archived blocks stay readable. 0 disables pruning.
+PRUNE_DEPTH = 0
+PRUNE_INTERVAL = 100
+PRUNE_TRANSACTIONS = False
+ARCHIVE_PATH = "database/archive.dat"
+
 # DON'T CHANGE THESE; for problem (1b)
 # (encoded as hex)
 AUTHORITY_SK = "404a28d57118d33f7c59146f512b725b5f1336843ba1c8fe"
 AUTHORITY_PK = "356c54fc3e57666eef27547ecf0257f8a27540ff7c145a2bcd8921d6e536f0208cbf98e220048d1e17e69dd587049e72"
+
+# Explorer (see run_webapp.py): total size of rendered block fragments kept for reuse across requests
+FRAGMENT_CACHE_BYTES = 64 * 1024 * 1024
+# live updates (/events): how often to check the database for new blocks, and to ping idle clients
+EVENT_POLL_SECONDS = 1
+EVENT_KEEPALIVE_SECONDS = 15
+
+# Peer-to-peer gossip node (see run_node.py)
+NODE_HOST = "127.0.0.1"
+NODE_PORT = 8333
+# blocks received before their parent, and compact blocks waiting for transactions, kept per node (the oldest are
+# dropped beyond these counts or after this many seconds)
+NODE_MAX_ORPHANS = 256
+NODE_MAX_PARTIAL_BLOCKS = 64
+NODE_ORPHAN_SECONDS = 20 * 60
+# unconfirmed transactions kept per node (the oldest are dropped beyond this count)
+NODE_MAX_MEMPOOL = 5000
+# seconds to wait for a peer to answer a data request before asking another peer that announced the item
+NODE_REQUEST_SECONDS = 60
+
+# Mining work server (see run_work_server.py and run_miner.py): nonces handed to a miner per request, how often the
+# server checks for a new heaviest tip, and the window over which the miners' aggregate hashrate is measured
+WORK_HOST = "127.0.0.1"
+WORK_PORT = 8334
+WORK_RANGE_SIZE = 2 ** 18
+WORK_POLL_SECONDS = 1
+WORK_HASHRATE_WINDOW = 60
+
+# Columnar export for offline analytics (see export_columns.py)
+EXPORT_DIR = "database/columns"
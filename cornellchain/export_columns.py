@@ -0,0 +1,16 @@
+import sys
+import time
+import config
+import blockchain
+from blockchain.columnar import export_chain, ColumnarChain
+
+# usage: python export_columns.py [directory]  (rerun to append blocks added since the last export)
+if __name__ == '__main__':
+    directory = sys.argv[1] if len(sys.argv) > 1 else config.EXPORT_DIR
+    start = time.time()
+    exported = export_chain(blockchain.chain, directory)
+    columns = ColumnarChain(directory)
+    print("Exported", exported, "new blocks to", directory, "in", round(time.time() - start, 2), "s")
+    print(len(columns.blocks["hash"]), "blocks,", len(columns.txs["hash"]), "transactions,", len(columns.outputs["tx"]), "outputs")
+    tip = blockchain.chain.get_heaviest_chain_tip()
+    print("Fork statistics:", columns.fork_stats(tip.hash if tip is not None else None))
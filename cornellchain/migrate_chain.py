@@ -0,0 +1,8 @@
+import blockchain
+
+# usage: python migrate_chain.py  (upgrades a database stored by an older version in place, then packs it to drop
+# the records the upgrade orphaned; neither can be undone, so back the database up first. Other scripts refuse to
+# open such a database until this has run.)
+if __name__ == '__main__':
+    chain = blockchain.open_chain(migrate=True)
+    print("Database is up to date:", len(chain.headers), "blocks")
@@ -0,0 +1,16 @@
+import sys
+import config
+import transaction
+import blockchain
+
+# usage: python prune_chain.py [depth] [--transactions]  (archives stale forks, and with --transactions the bodies of
+# deep best-chain blocks, then packs the database so the space is returned to disk; see Blockchain.prune)
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if arg != "--transactions"]
+    depth = int(args[0]) if args else (config.PRUNE_DEPTH or 100)
+    chain = blockchain.chain
+    forks, bodies = chain.prune(depth, "--transactions" in sys.argv[1:] or config.PRUNE_TRANSACTIONS)
+    transaction.commit()
+    blockchain.db.pack()
+    print("Archived", forks, "fork blocks and", bodies, "best-chain block bodies more than", depth, "blocks deep")
+    print("Archive:", chain.get_archive().stats())
@@ -5,6 +5,31 @@ from tests.get_chain import GetChainTest
 from tests.validity import ValidityTest
 from tests.poa import PoATest
 from tests.merkle import MerkleRootTest
+from tests.node import NodeTest
+from tests.sync import SyncTest
+from tests.compact_block import CompactBlockTest
+from tests.headers import HeadersTest
+from tests.cache import CacheTest
+from tests.outpoint import OutPointTest
+from tests.transaction_output import TransactionOutputTest
+from tests.memo import MemoTest
+from tests.dense_index import DenseIndexTest
+from tests.columnar import ColumnarTest
+from tests.utxo_index import UtxoIndexTest
+from tests.search import SearchTest
+from tests.fragment_cache import FragmentCacheTest
+from tests.block_log import BlockLogTest
+from tests.storage_server import StorageServerTest
+from tests.chain_context import ChainContextTest
+from tests.startup import StartupTest
+from tests.verdicts import VerdictCacheTest
+from tests.stress import StressTest
+from tests.differential import DifferentialTest
+from tests.prune import PruneTest
+from tests.compression import CompressionTest
+from tests.bloom import BloomTest
+from tests.simulation import SimulationTest
+from tests.work_server import WorkServerTest
 
 # Test for (1a) - sha256_2_string
 suite = unittest.TestLoader().loadTestsFromTestCase(HashTest)
@@ -29,3 +54,103 @@ unittest.TextTestRunner(verbosity=2).run(suite)
 # Test for (1c) - calculate_merkle_root
 suite = unittest.TestLoader().loadTestsFromTestCase(MerkleRootTest)
 unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Gossip node
+suite = unittest.TestLoader().loadTestsFromTestCase(NodeTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Headers-first sync
+suite = unittest.TestLoader().loadTestsFromTestCase(SyncTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Compact block relay
+suite = unittest.TestLoader().loadTestsFromTestCase(CompactBlockTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Header-only chain walking
+suite = unittest.TestLoader().loadTestsFromTestCase(HeadersTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Bounded block/transaction cache
+suite = unittest.TestLoader().loadTestsFromTestCase(CacheTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Binary outpoint / hash indexes
+suite = unittest.TestLoader().loadTestsFromTestCase(OutPointTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Inline transaction outputs
+suite = unittest.TestLoader().loadTestsFromTestCase(TransactionOutputTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Memoized header and transaction encodings
+suite = unittest.TestLoader().loadTestsFromTestCase(MemoTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# NumPy block index
+suite = unittest.TestLoader().loadTestsFromTestCase(DenseIndexTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Columnar export
+suite = unittest.TestLoader().loadTestsFromTestCase(ColumnarTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Per-user UTXO index
+suite = unittest.TestLoader().loadTestsFromTestCase(UtxoIndexTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Hash prefix search
+suite = unittest.TestLoader().loadTestsFromTestCase(SearchTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Explorer fragment cache
+suite = unittest.TestLoader().loadTestsFromTestCase(FragmentCacheTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Block log for live updates
+suite = unittest.TestLoader().loadTestsFromTestCase(BlockLogTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Shared storage server mode
+suite = unittest.TestLoader().loadTestsFromTestCase(StorageServerTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Explicit chain context
+suite = unittest.TestLoader().loadTestsFromTestCase(ChainContextTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Startup: lazy database open, persisted index
+suite = unittest.TestLoader().loadTestsFromTestCase(StartupTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Validation verdict caches
+suite = unittest.TestLoader().loadTestsFromTestCase(VerdictCacheTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Worst-case validation cost
+suite = unittest.TestLoader().loadTestsFromTestCase(StressTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Differential validation against the reference validator
+suite = unittest.TestLoader().loadTestsFromTestCase(DifferentialTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Stale-fork pruning and the cold archive
+suite = unittest.TestLoader().loadTestsFromTestCase(PruneTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Compressed storage
+suite = unittest.TestLoader().loadTestsFromTestCase(CompressionTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Bloom-filter prefilters
+suite = unittest.TestLoader().loadTestsFromTestCase(BloomTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Discrete-event network simulation
+suite = unittest.TestLoader().loadTestsFromTestCase(SimulationTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
+
+# Mining work server
+suite = unittest.TestLoader().loadTestsFromTestCase(WorkServerTest)
+unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,24 @@
+import sys
+import random
+import logging
+import blockchain
+from blockchain.differential import DifferentialValidator, random_blocks
+from blockchain.stress import StressBlock
+
+# usage: python run_differential.py [blocks] [seed]  (validates random blocks with both the optimized and the
+# reference validator in memory; the database is not touched)
+if __name__ == '__main__':
+    logging.basicConfig()
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    validator = DifferentialValidator()
+    chain = blockchain.Blockchain()
+    for block in random_blocks(chain, random.Random(seed), count, StressBlock):
+        try:
+            validator.is_valid(block, chain)
+        except (IndexError, ValueError):
+            pass # raised alike by both, or logged as a mismatch
+    print("random blocks: %d checked, %d on the chain, %.1fx speedup" % (validator.checked, len(chain.blocks), validator.speedup()))
+    if validator.mismatches:
+        print("%d mismatches" % len(validator.mismatches))
+        exit(1)
@@ -0,0 +1,15 @@
+import sys
+import multiprocessing
+import config
+from blockchain.work_server import run_miner
+
+# usage: python run_miner.py [processes] [host] [port]  (mines for run_work_server.py, one process per core by default)
+if __name__ == '__main__':
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else multiprocessing.cpu_count()
+    host = sys.argv[2] if len(sys.argv) > 2 else config.WORK_HOST
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else config.WORK_PORT
+    workers = [multiprocessing.Process(target=run_miner, args=(host, port)) for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
@@ -0,0 +1,19 @@
+import sys
+import asyncio
+import config
+from blockchain.node import Node
+
+# usage: python run_node.py [port] [peer_port ...]  (peers are assumed to be on config.NODE_HOST)
+async def main(port, peer_ports):
+    node = Node(port=port, save=True)
+    await node.start()
+    print("Listening on", node.host, node.port)
+    for peer_port in peer_ports:
+        await node.connect(config.NODE_HOST, peer_port)
+        print("Connected to peer on port", peer_port)
+    while True:
+        await asyncio.sleep(3600)
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else config.NODE_PORT
+    asyncio.get_event_loop().run_until_complete(main(port, [int(p) for p in sys.argv[2:]]))
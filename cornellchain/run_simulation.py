@@ -0,0 +1,21 @@
+import sys
+import time
+from blockchain.simulation import Simulation
+
+# usage: python run_simulation.py [nodes] [hours] [interval] [latency] [seed]  (simulates a proof-of-work network
+# in memory, see blockchain.simulation; the database is not touched)
+if __name__ == '__main__':
+    nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 100
+    interval = float(sys.argv[3]) if len(sys.argv) > 3 else 600
+    latency = float(sys.argv[4]) if len(sys.argv) > 4 else 2
+    seed = int(sys.argv[5]) if len(sys.argv) > 5 else 0
+    start = time.perf_counter()
+    report = Simulation(nodes, interval=interval, latency=latency, seed=seed).run(hours)
+    print("%d nodes, %.0f node-hours simulated in %.1f s: %d blocks mined" % (nodes, report["node_hours"], time.perf_counter() - start, report["blocks"]))
+    print("orphan rate         %.2f%%" % (report["orphan_rate"] * 100))
+    for name in ("propagation_seconds", "finality_seconds"):
+        median, p90 = report[name]
+        print("%-19s %s" % (name.replace("_", " "), "n/a" if median is None else "median %.1f, p90 %.1f" % (median, p90)))
+    print("ingest              %.0f blocks/s, %.0f txs/s (validation %.2f ms per block)" % (
+        report["ingest_blocks_per_second"], report["ingest_txs_per_second"], report["validation_seconds"] * 1000))
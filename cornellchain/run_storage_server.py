@@ -0,0 +1,12 @@
+import config
+from ZEO import runzeo
+
+# usage: python run_storage_server.py  (serves config.DB_PATH on config.ZEO_HOST:ZEO_PORT until interrupted;
+# set config.STORAGE = "zeo" so the miner, nodes and explorer workers connect to it instead of opening the file)
+if __name__ == '__main__':
+    # create (or migrate) the chain before serving, so read-only explorer workers always find one
+    config.STORAGE = "file"
+    import blockchain
+    blockchain.open_chain()
+    blockchain.close_chain()
+    runzeo.main(["-a", "%s:%d" % (config.ZEO_HOST, config.ZEO_PORT), "-f", config.DB_PATH])
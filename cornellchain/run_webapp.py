@@ -1,4 +1,7 @@
+import sys
+
+# usage: python run_webapp.py [port]  (with config.STORAGE = "zeo", start as many workers on different ports as needed)
 if __name__ == '__main__':
     from webapp.app import app
-    app.run(port=5000, debug=True)
-
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    app.run(port=port, debug=True)
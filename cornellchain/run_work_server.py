@@ -0,0 +1,20 @@
+import sys
+import asyncio
+import config
+from blockchain.work_server import WorkServer
+
+# usage: python run_work_server.py [port]  (hands out work on the database chain to run_miner.py processes; solved
+# blocks are committed; the chain must have a genesis block, e.g. from add_random_pow_blockchain.py)
+async def main(port):
+    server = WorkServer(port=port, save=True)
+    await server.start()
+    print("Serving work on", server.host, server.port)
+    while True:
+        await asyncio.sleep(10)
+        stats = server.stats()
+        print("%d miners, %.0f H/s, %d blocks found, %d rejected, %d stale" % (
+            stats["miners"], stats["hashrate"], stats["blocks_found"], stats["rejected"], stats["stale"]))
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else config.WORK_PORT
+    asyncio.get_event_loop().run_until_complete(main(port))
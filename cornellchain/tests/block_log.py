@@ -0,0 +1,51 @@
+import unittest
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from webapp.app import app
+
+class BlockLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def add(self, block):
+        self.assertTrue(self.test_chain.add_block(block, save=False))
+        return block
+
+    def test_blocks_added_since(self):
+        self.assertEqual(self.test_chain.get_block_log_length(), 0)
+        genesis = self.add(TestBlock(0, [], "genesis", is_genesis=True))
+        first = self.add(TestBlock(1, [], genesis.hash))
+        seen = self.test_chain.get_block_log_length()
+        self.assertEqual(seen, 2)
+        second = self.add(TestBlock(2, [], first.hash))
+        fork = TestBlock(1, [], genesis.hash)
+        fork.timestamp += 1
+        fork.hash = fork.calculate_hash()
+        self.add(fork) # a lower height, but added later
+        self.assertFalse(self.test_chain.add_block(fork, save=False))
+        self.assertEqual(self.test_chain.get_blocks_added_since(seen), [(2, second.hash), (3, fork.hash)])
+        self.assertEqual(self.test_chain.get_blocks_added_since(4), [])
+        self.assertEqual([block_hash for sequence, block_hash in self.test_chain.get_blocks_added_since(0)],
+                         [genesis.hash, first.hash, second.hash, fork.hash])
+
+    def test_migrate_builds_log(self):
+        genesis = self.add(TestBlock(0, [], "genesis", is_genesis=True))
+        first = self.add(TestBlock(1, [], genesis.hash))
+        del self.test_chain.block_log
+        self.assertTrue(self.test_chain.migrate())
+        self.assertEqual(self.test_chain.get_blocks_added_since(0), [(0, genesis.hash), (1, first.hash)])
+
+    def test_events_position_validated(self):
+        client = app.test_client()
+        for query, headers in [("?since=abc", {}), ("?since=-1", {}), ("", {"Last-Event-ID": "x1"}), ("?since=\u0661", {})]:
+            self.assertEqual(client.get("/events" + query, headers=headers).status_code, 400)
+
+if __name__ == '__main__':
+    unittest.main()
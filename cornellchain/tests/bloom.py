@@ -0,0 +1,73 @@
+import os
+import unittest
+import config
+import blockchain
+from blockchain.bloom import BloomFilter
+from blockchain.context import using_chain
+from blockchain.stress import StressBlock
+from blockchain.transaction import Transaction, TransactionOutput
+
+class BloomTest(unittest.TestCase):
+
+    def setUp(self):
+        self.old_config = config.BLOOM_FILTERS, config.BLOOM_MIN_KEYS
+        config.BLOOM_FILTERS, config.BLOOM_MIN_KEYS = True, 4
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.funding = Transaction([], [TransactionOutput("Genesis", "Alice", 10), TransactionOutput("Genesis", "Alice", 10)])
+        self.genesis = self.add(StressBlock(0, [self.funding], "genesis", is_genesis=True))
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+        config.BLOOM_FILTERS, config.BLOOM_MIN_KEYS = self.old_config
+
+    def add(self, block):
+        self.assertTrue(self.test_chain.add_block(block, save=False), block.is_valid(self.test_chain)[1])
+        return block
+
+    def test_filter_error_rate(self):
+        bloom = BloomFilter(10000, 0.01)
+        keys = [os.urandom(32) for i in range(10000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(bloom.might_contain(key) for key in keys)) # no false negatives
+        absent = [key for key in (os.urandom(32) for i in range(10000)) if not bloom.might_contain(key)]
+        self.assertGreater(len(absent), 9700) # about 1% false positives
+        self.assertEqual(bloom.stats()["saved_lookups"], len(absent))
+        self.assertFalse(bloom.is_full())
+
+    def test_chain_lookups(self):
+        self.assertTrue(self.test_chain.has_seen_tx(self.funding.hash))
+        self.assertFalse(self.test_chain.has_seen_tx("ab" * 32))
+        self.assertFalse(self.test_chain.is_spent(self.funding.hash + ":0"))
+        # filters built before a block is added see its keys
+        payment = Transaction([self.funding.hash + ":0"], [TransactionOutput("Alice", "Bob", 10)])
+        self.add(StressBlock(1, [payment], self.genesis.hash))
+        self.assertTrue(self.test_chain.has_seen_tx(payment.hash))
+        self.assertTrue(self.test_chain.is_spent(self.funding.hash + ":0"))
+        self.assertFalse(self.test_chain.is_spent(self.funding.hash + ":1"))
+        before = self.test_chain.get_filter_stats()["transactions"]
+        self.assertFalse(self.test_chain.has_seen_tx("cd" * 32))
+        after = self.test_chain.get_filter_stats()["transactions"]
+        self.assertEqual(after["checks"], before["checks"] + 1)
+        self.assertEqual(after["saved_lookups"] + after["false_positives"], before["saved_lookups"] + before["false_positives"] + 1)
+        self.assertEqual(StressBlock(2, [payment], self.genesis.hash).is_valid(self.test_chain), (False, "Invalid height"))
+        self.assertEqual(StressBlock(1, [Transaction([self.funding.hash + ":0"], [TransactionOutput("Alice", "Carol", 10)])], self.genesis.hash).is_valid(self.test_chain),
+                         (True, "All checks passed")) # a fork may spend it again
+
+    def test_rebuilt_when_full(self):
+        first = self.test_chain.get_filters()["transactions"]
+        parent, ref = self.genesis, self.funding.hash + ":0"
+        for height in range(1, 6):
+            tx = Transaction([ref], [TransactionOutput("Alice", "Alice", 10)])
+            parent, ref = self.add(StressBlock(height, [tx], parent.hash)), tx.hash + ":0"
+        self.assertTrue(first.is_full())
+        rebuilt = self.test_chain.get_filters()["transactions"]
+        self.assertIsNot(rebuilt, first)
+        self.assertEqual(rebuilt.count, 6)
+        self.assertGreaterEqual(rebuilt.checks, first.checks) # counters carried over
+        self.assertTrue(self.test_chain.has_seen_tx(parent.transactions[0].hash))
+
+if __name__ == '__main__':
+    unittest.main()
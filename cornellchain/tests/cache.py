@@ -0,0 +1,80 @@
+import unittest
+import ZODB
+import transaction
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.cache import BlockCache
+from blockchain.transaction import Transaction, TransactionOutput
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.hashes = []
+        parent_hash, is_genesis = "genesis", True
+        for height in range(30):
+            txs = [Transaction(["input:" + str(height)], [TransactionOutput("Alice", "Bob", i)]) for i in range(10)]
+            block = TestBlock(height, txs, parent_hash, is_genesis=is_genesis)
+            self.assertTrue(self.test_chain.add_block(block, save=False))
+            self.hashes.append(block.hash)
+            parent_hash, is_genesis = block.hash, False
+
+        # store the chain and reopen it with nothing loaded
+        self.db = ZODB.DB(None)
+        connection = self.db.open()
+        connection.root.blockchain = self.test_chain
+        transaction.commit()
+        connection.close()
+        self.connection = self.db.open()
+        self.connection.cacheMinimize()
+        self.chain = self.connection.root.blockchain
+        self.context.__exit__(None, None, None)
+        self.context = using_chain(self.chain)
+        self.context.__enter__()
+
+    def tearDown(self):
+        self.connection.close()
+        self.db.close()
+        self.context.__exit__(None, None, None)
+
+    def loaded(self):
+        """ Returns the hashes of blocks whose state is currently in memory. """
+        return [block_hash for block_hash in self.hashes if self.chain.blocks[block_hash]._p_changed is not None]
+
+    def test_block_budget(self):
+        self.chain._v_cache = BlockCache(max_blocks=5, max_transactions=1000)
+        for block_hash in self.hashes:
+            self.assertEqual(self.chain.get_block(block_hash).hash, block_hash)
+        self.assertEqual(self.loaded(), self.hashes[-5:])
+        stats = self.chain.get_cache().stats()
+        self.assertEqual((stats["misses"], stats["evictions"], stats["loaded_blocks"]), (30, 25, 5))
+
+        # evicted blocks load again transparently; recent ones are hits
+        self.assertEqual(len(self.chain.get_block(self.hashes[0]).transactions), 10)
+        self.chain.get_block(self.hashes[-1])
+        stats = self.chain.get_cache().stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 31))
+
+    def test_transaction_budget(self):
+        self.chain._v_cache = BlockCache(max_blocks=100, max_transactions=35)
+        for block_hash in self.hashes:
+            block = self.chain.get_block(block_hash)
+        self.assertEqual(len(self.loaded()), 3)
+        evicted = self.chain.blocks[self.hashes[0]]
+        self.assertIsNone(evicted._p_changed)
+        for tx_hash in list(self.chain.all_transactions)[:20]:
+            self.chain.get_transaction(tx_hash)
+        self.assertLessEqual(self.chain.get_cache().stats()["loaded_transactions"], 35)
+
+    def test_warm_cache(self):
+        self.chain._v_cache = BlockCache(max_blocks=100, max_transactions=1000)
+        self.assertEqual(self.chain.warm_cache(4), 4)
+        self.assertEqual(self.loaded(), self.hashes[-4:])
+        self.chain.get_block(self.hashes[-1])
+        self.assertEqual(self.chain.get_cache().stats()["hits"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import threading
+import blockchain
+from blockchain import context
+from blockchain.context import current_chain, using_chain
+from blockchain.pow_block import PoWBlock
+from blockchain.transaction import Transaction, TransactionOutput
+
+class UnsealedBlock(PoWBlock):
+    """ A PoW block whose seal is not checked, so chains can be built without mining. """
+
+    def seal_is_valid(self):
+        return True
+
+class ChainContextTest(unittest.TestCase):
+
+    def build_chain(self, user, target_bits, length):
+        """ Builds a chain whose genesis pays user, with blocks carrying the given target; returns the chain and its tip. """
+        chain = blockchain.Blockchain()
+        genesis = UnsealedBlock(0, [Transaction([], [TransactionOutput("Genesis", user, 100)])], "genesis", is_genesis=True, chain=chain)
+        genesis.target = 2 ** target_bits
+        genesis.hash = genesis.calculate_hash()
+        self.assertTrue(chain.add_block(genesis, save=False))
+        tip = genesis
+        for i in range(length):
+            tip = UnsealedBlock(tip.height + 1, [], tip.hash, chain=chain)
+            self.assertTrue(chain.add_block(tip, save=False))
+        return chain, genesis, tip
+
+    def test_explicit_chain(self):
+        opened = dict(blockchain.opened)
+        alice_chain, alice_genesis, alice_tip = self.build_chain("Alice", 240, 3)
+        bob_chain, bob_genesis, bob_tip = self.build_chain("Bob", 250, 3)
+        self.assertEqual(blockchain.opened, opened) # the global chain was never used (or opened)
+        self.assertEqual(alice_tip.target, 2 ** 240) # targets were looked up in the chain passed in
+        self.assertEqual(bob_tip.target, 2 ** 250)
+
+        spend = Transaction([alice_genesis.transactions[0].hash + ":0"], [TransactionOutput("Alice", "Bob", 100)])
+        block = UnsealedBlock(alice_tip.height + 1, [spend], alice_tip.hash, chain=alice_chain)
+        self.assertEqual(block.is_valid(alice_chain), (True, "All checks passed"))
+        self.assertEqual(block.is_valid(bob_chain), (False, "Nonexistent parent"))
+        with using_chain(bob_chain):
+            self.assertIs(current_chain(), bob_chain)
+            self.assertEqual(block.is_valid(), (False, "Nonexistent parent"))
+            with using_chain(alice_chain):
+                self.assertEqual(block.is_valid()[0], True)
+            self.assertIs(current_chain(alice_chain), alice_chain)
+        self.assertIsNone(context._local.chain) # back to the global default, which is not opened here
+        self.assertFalse(bob_chain.add_block(block, save=False)) # add_block validates against its own chain
+        self.assertTrue(alice_chain.add_block(block, save=False))
+
+    def test_parallel_validation(self):
+        chains = [self.build_chain(user, 250, 20) for user in ["Alice", "Bob", "Carol", "Dave"]]
+        results = {}
+        def validate(index):
+            chain, genesis, tip = chains[index]
+            other_chain = chains[(index + 1) % len(chains)][0]
+            with using_chain(chain): # each thread has its own current chain
+                outcomes = set()
+                for i in range(200):
+                    block = UnsealedBlock(tip.height + 1, [], tip.hash)
+                    outcomes.add((block.is_valid(), block.is_valid(other_chain), block.target))
+                    for block_hash in chain.get_chain_ending_with(tip.hash):
+                        chain.get_block(block_hash) # reads go through the chain's block cache
+            results[index] = outcomes
+        threads = [threading.Thread(target=validate, args=(index,)) for index in range(len(chains))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for index in range(len(chains)):
+            self.assertEqual(results[index], {((True, "All checks passed"), (False, "Nonexistent parent"), 2 ** 250)})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import os
+import json
+import unittest
+import shutil
+import tempfile
+import numpy as np
+import config
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.columnar import ColumnarChain, ColumnarExporter, export_chain, append_column, column_path
+from blockchain.transaction import Transaction, TransactionOutput
+
+class ColumnarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.directory = tempfile.mkdtemp()
+        self.users = ["Alice", "Bob", "Carol"]
+        self.blocks = []
+        self.extend(TestBlock(0, [Transaction([], [TransactionOutput("Genesis", "Alice", 100)])], "genesis", is_genesis=True))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        self.context.__exit__(None, None, None)
+
+    def extend(self, block):
+        self.assertTrue(self.test_chain.add_block(block, save=False))
+        self.blocks.append(block)
+        return block
+
+    def grow(self, parent, length, tag):
+        """ Adds length blocks on top of parent, each paying one output per user, and returns the last. """
+        for i in range(length):
+            outputs = [TransactionOutput("Alice", user, i + 1) for user in self.users]
+            txs = [Transaction([self.blocks[0].transactions[0].hash + ":0", tag + ":" + str(i)], outputs)]
+            parent = self.extend(TestBlock(parent.height + 1, txs, parent.hash))
+        return parent
+
+    def test_export_and_queries(self):
+        tip = self.grow(self.blocks[0], 10, "main")
+        self.grow(self.blocks[3], 2, "fork")
+        self.assertEqual(export_chain(self.test_chain, self.directory), 13)
+        columns = ColumnarChain(self.directory)
+        self.assertEqual(len(columns.blocks["hash"]), 13)
+        self.assertEqual(len(columns.outputs["tx"]), 1 + 12 * 3)
+        self.assertEqual(set(columns.block_hashes(np.arange(13))), set(block.hash for block in self.blocks))
+        self.assertEqual(columns.volume_per_user()["Bob"], sum(range(1, 11)) + sum(range(1, 3)))
+        self.assertEqual(columns.volume_per_user("sender")["Alice"], 3 * (sum(range(1, 11)) + sum(range(1, 3))))
+        self.assertEqual(len(columns.outputs_of("Carol")), 12)
+        self.assertEqual(columns.fork_stats(tip.hash), {"blocks": 13, "heights": 11, "forked_heights": 2, "stale_blocks": 2})
+        self.assertEqual(columns.best_chain().tolist(), columns.best_chain(tip.hash).tolist())
+        self.assertEqual(columns.weights().dtype, np.int64)
+
+        # rows link up: inputs and outputs point at their transaction, transactions at their block
+        tx_rows = columns.txs["input_start"][1]
+        self.assertEqual(columns.inputs["ref_tx"][tx_rows].tobytes(), bytes.fromhex(self.blocks[0].transactions[0].hash))
+        label = columns.inputs["ref_label"][tx_rows + 1]
+        self.assertEqual(columns.strings[label], "main")
+        self.assertEqual(columns.blocks["parent"][columns.txs["block"][1]], 0)
+
+    def test_incremental_append(self):
+        tip = self.grow(self.blocks[0], 5, "main")
+        self.assertEqual(export_chain(self.test_chain, self.directory), 6)
+        self.assertEqual(export_chain(self.test_chain, self.directory), 0)
+        tip = self.grow(tip, 5, "more")
+        self.grow(self.blocks[2], 1, "late fork") # a new block at an already exported height
+        self.assertEqual(export_chain(self.test_chain, self.directory, batch_size=4), 6)
+        columns = ColumnarChain(self.directory)
+        self.assertEqual(sorted(columns.block_hashes(np.arange(len(columns.blocks["hash"])))), sorted(block.hash for block in self.blocks))
+        self.assertEqual(columns.blocks_per_height().tolist(), [1, 1, 1, 2] + [1] * 7)
+
+    def test_blocks_at_pruned_heights(self):
+        old_path = config.ARCHIVE_PATH
+        config.ARCHIVE_PATH = os.path.join(self.directory, "archive.dat")
+        try:
+            self.grow(self.blocks[0], 10, "main")
+            stale = self.grow(self.blocks[1], 1, "stale")
+            self.assertEqual(export_chain(self.test_chain, os.path.join(self.directory, "export")), 12)
+            unexported = self.grow(self.blocks[2], 1, "unexported")
+            self.assertEqual(self.test_chain.prune(3, False), (2, 0))
+            self.assertNotIn(stale.hash, self.test_chain.headers)
+            # a new block at the pruned height leaves the block count there unchanged
+            replacement = self.grow(self.blocks[1], 1, "replacement")
+            self.assertEqual(export_chain(self.test_chain, os.path.join(self.directory, "export")), 2)
+        finally:
+            config.ARCHIVE_PATH = old_path
+        columns = ColumnarChain(os.path.join(self.directory, "export"))
+        exported = columns.block_hashes(np.arange(len(columns.blocks["hash"])))
+        self.assertEqual(exported[-2:], [unexported.hash, replacement.hash]) # (the first read from the archive)
+        self.assertEqual(len(exported), 14)
+
+    def test_interrupted_export_is_discarded(self):
+        self.grow(self.blocks[0], 3, "main")
+        export_chain(self.test_chain, self.directory)
+        self.grow(self.blocks[-1], 2, "more")
+        # an export that died after writing one column, before committing its row counts
+        exporter = ColumnarExporter(self.directory)
+        exporter.add_block(self.blocks[-2], bytes.fromhex(self.blocks[-2].hash))
+        append_column(column_path(self.directory, "outputs", "amount"), "<i8", exporter.rows["outputs"], exporter.pending["outputs"]["amount"])
+        self.assertEqual(len(ColumnarChain(self.directory).blocks["hash"]), 4)
+        self.assertEqual(export_chain(self.test_chain, self.directory), 2)
+        columns = ColumnarChain(self.directory)
+        self.assertEqual(len(columns.outputs["amount"]), len(columns.outputs["tx"]))
+
+    def heavy_block(self, parent, weight):
+        """ Adds a block on top of parent whose target gives it the given weight. """
+        block = TestBlock(parent.height + 1, [], parent.hash)
+        block.target = 2 ** 256 // weight
+        block.set_seal_data(len(self.blocks)) # (so siblings of equal weight differ)
+        self.assertEqual(block.get_weight(), weight)
+        return self.extend(block)
+
+    def test_exact_weights_and_amounts(self):
+        # pairs of forks whose total weights are equal as floats; the second of each is heavier by 1
+        for weight, dtype in [(2 ** 60, np.int64), (2 ** 64, object)]:
+            self.heavy_block(self.blocks[0], weight)
+            heavy = self.heavy_block(self.heavy_block(self.blocks[0], weight), 1)
+            directory = os.path.join(self.directory, str(weight))
+            export_chain(self.test_chain, directory)
+            columns = ColumnarChain(directory)
+            self.assertEqual(columns.weights().dtype, dtype)
+            self.assertEqual(columns.weights().tolist()[-3:], [weight, weight, 1])
+            self.assertEqual(columns.block_hashes(np.flatnonzero(columns.best_chain())), [self.blocks[0].hash, self.blocks[-2].hash, heavy.hash])
+        self.assertEqual(columns.outputs["amount"].dtype, np.int64)
+        self.assertEqual(columns.volume_per_user(), {"Alice": 100})
+
+    def test_old_format_refused(self):
+        export_chain(self.test_chain, self.directory)
+        with open(os.path.join(self.directory, "meta.json")) as f:
+            meta = json.load(f)
+        del meta["format"]
+        with open(os.path.join(self.directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        self.assertRaises(ValueError, ColumnarChain, self.directory)
+        self.assertRaises(ValueError, export_chain, self.test_chain, self.directory)
+
+if __name__ == '__main__':
+    unittest.main()
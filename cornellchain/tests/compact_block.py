@@ -0,0 +1,111 @@
+import unittest
+import asyncio
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.transaction import Transaction, TransactionOutput
+from blockchain.compact_block import CompactBlock, reconstruct, RECENT_FORK_DEPTH
+from blockchain.node import Node
+from tests.node import wait_until
+
+class CompactBlockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.genesis = TestBlock(0, [Transaction([], [TransactionOutput("Genesis", "Alice", 100)])], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(self.genesis, save=False))
+        self.txs = [Transaction([self.genesis.transactions[0].hash + ":0"], [TransactionOutput("Alice", "Bob", i)]) for i in range(20)]
+        self.block = TestBlock(1, self.txs, self.genesis.hash)
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def encode(self, peer_has):
+        """ Sends the block through the wire encoding, predicting the receiver has peer_has. """
+        return CompactBlock.from_dict(CompactBlock.from_block(self.block, peer_has).to_dict())
+
+    def test_reconstruct_from_mempool(self):
+        compact = self.encode(set(tx.hash for tx in self.txs[1:]))
+        self.assertEqual(len(compact.prefilled), 1)
+        mempool = {tx.hash: tx for tx in self.txs[1:]}
+        partial = reconstruct(compact, blockchain.Blockchain(), mempool)
+        self.assertEqual(partial.missing_indexes(), [])
+        self.assertEqual(partial.to_block().hash, self.block.hash)
+
+    def test_reconstruct_from_chain_index(self):
+        compact = self.encode(set(tx.hash for tx in self.txs))
+        # transactions already confirmed on a recent sibling fork are found in its block
+        sibling = TestBlock(1, self.txs[:10], self.genesis.hash)
+        self.assertTrue(self.test_chain.add_block(sibling, save=False))
+        partial = reconstruct(compact, self.test_chain, {tx.hash: tx for tx in self.txs[10:]})
+        self.assertEqual(partial.to_block().hash, self.block.hash)
+
+    def test_old_transactions_not_searched(self):
+        parent = self.block
+        self.assertTrue(self.test_chain.add_block(parent, save=False))
+        for height in range(2, RECENT_FORK_DEPTH + 3):
+            parent = TestBlock(height, [], parent.hash)
+            self.assertTrue(self.test_chain.add_block(parent, save=False))
+        # transactions confirmed deeper than the recent forks are left for getblocktxn
+        self.block = TestBlock(parent.height + 1, self.txs[:3], parent.hash)
+        partial = reconstruct(self.encode(set(tx.hash for tx in self.txs)), self.test_chain)
+        self.assertEqual(partial.missing_indexes(), [0, 1, 2])
+
+    def test_missing_transactions_round_trip(self):
+        compact = self.encode(set(tx.hash for tx in self.txs))
+        partial = reconstruct(compact, self.test_chain, {tx.hash: tx for tx in self.txs[5:]})
+        missing = partial.missing_indexes()
+        self.assertEqual(missing, [0, 1, 2, 3, 4])
+        self.assertRaises(ValueError, partial.to_block)
+        partial.fill(missing, [self.txs[index] for index in missing])
+        self.assertEqual(partial.to_block().hash, self.block.hash)
+
+    def test_prefilled_index_out_of_range(self):
+        for index in [-1, len(self.txs), "0"]:
+            compact = self.encode(set(tx.hash for tx in self.txs[1:]))
+            compact.prefilled = {index: compact.prefilled[0]}
+            self.assertRaises(ValueError, reconstruct, compact, self.test_chain)
+        partial = reconstruct(self.encode(set(tx.hash for tx in self.txs)), self.test_chain)
+        self.assertRaises(ValueError, partial.fill, [-1], [self.txs[-1]])
+        self.assertEqual(partial.missing_indexes(), list(range(len(self.txs))))
+
+    def test_wrong_transactions_fail_merkle(self):
+        compact = self.encode(set(tx.hash for tx in self.txs))
+        partial = reconstruct(compact, self.test_chain, {tx.hash: tx for tx in self.txs[1:]})
+        partial.fill([0], [self.txs[1]])
+        self.assertRaises(ValueError, partial.to_block)
+
+    def test_node_relay(self):
+        async def scenario():
+            sender, receiver = Node(self.test_chain), Node(blockchain.Blockchain())
+            receiver.chain.add_block(self.genesis, save=False)
+            await sender.start()
+            await receiver.start()
+            await receiver.connect("127.0.0.1", sender.port)
+            await wait_until(lambda: len(sender.peers) == 1)
+            for tx in self.txs:
+                await sender.submit_tx(tx)
+            await wait_until(lambda: len(receiver.mempool) == len(self.txs))
+
+            # every transaction is already known: no round trip needed
+            self.assertTrue(await sender.submit_block(self.block))
+            await wait_until(lambda: self.block.hash in receiver.chain.blocks)
+            self.assertEqual(receiver.compact_stats, {"reconstructed": 1, "round_trips": 0, "failed": 0})
+
+            # the receiver lost some transactions the sender thinks it has: they are fetched in one round trip
+            block2 = TestBlock(2, [Transaction([tx.hash + ":0"], [TransactionOutput("Bob", "Carol", 0)]) for tx in self.txs[:4]], self.block.hash)
+            for tx in block2.transactions:
+                await sender.submit_tx(tx)
+            await wait_until(lambda: all(tx.hash in receiver.mempool for tx in block2.transactions))
+            del receiver.mempool[block2.transactions[0].hash]
+            self.assertTrue(await sender.submit_block(block2))
+            await wait_until(lambda: block2.hash in receiver.chain.blocks)
+            self.assertEqual(receiver.compact_stats, {"reconstructed": 1, "round_trips": 1, "failed": 0})
+            await sender.stop()
+            await receiver.stop()
+        asyncio.run(scenario())
+
+if __name__ == '__main__':
+    unittest.main()
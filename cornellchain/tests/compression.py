@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+import transaction
+import ZODB, ZODB.FileStorage
+from blockchain.serialization import register_block_type
+from blockchain.storage import CompressedStorage, Database, train_dictionary
+from blockchain.stress import StressBlock
+from blockchain.transaction import Transaction, TransactionOutput
+
+# only registered block types are compressed
+register_block_type(StressBlock)
+
+class CompressionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "test.db")
+        self.tx = Transaction([], [TransactionOutput("Genesis", "Alice", 10), TransactionOutput("Genesis", "Bob", 10)])
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def open(self, codec, dictionary=None):
+        storage = CompressedStorage(ZODB.FileStorage.FileStorage(self.path), codec, 6, dictionary)
+        db = Database(storage)
+        return storage, db, db.open()
+
+    def store_block(self, codec, dictionary=None):
+        storage, db, connection = self.open(codec, dictionary)
+        # (a persistent object can only be stored in one database)
+        tx = Transaction([], [TransactionOutput("Genesis", "Alice", 10), TransactionOutput("Genesis", "Bob", 10)])
+        connection.root.block = StressBlock(0, [tx], "genesis", is_genesis=True)
+        connection.root.name = "not compressed"
+        transaction.commit()
+        db.close()
+        return storage
+
+    def test_codecs_round_trip(self):
+        dictionary = train_dictionary([b"blockchain.transaction Transaction Genesis Alice Bob"] * 3)
+        for codec, dictionary in [("zlib", None), ("zlib", dictionary), ("lzma", None)]:
+            storage = self.store_block(codec, dictionary)
+            # (records that would not shrink, like small transactions under lzma, are stored as they are)
+            compressed = storage.stats()["compressed_records"]
+            self.assertGreater(compressed, 0, codec)
+            storage, db, connection = self.open(codec, dictionary)
+            block = connection.root.block
+            self.assertEqual(block.transactions[0].hash, self.tx.hash)
+            self.assertEqual(connection.root.name, "not compressed")
+            self.assertEqual(block.transactions[0].outputs[1].receiver, "Bob")
+            self.assertEqual(storage.stats()["decoded_records"], compressed)
+            db.close()
+            os.remove(self.path)
+
+    def test_transactions_decoded_on_access(self):
+        self.store_block("zlib")
+        storage, db, connection = self.open("zlib")
+        block = connection.root.block
+        self.assertEqual(block.height, 0)
+        self.assertEqual(storage.stats()["decoded_records"], 1) # the block, not its transaction
+        self.assertEqual(block.transactions[0].hash, self.tx.hash)
+        self.assertEqual(storage.stats()["decoded_records"], 2)
+        db.close()
+
+    def test_readable_without_compression(self):
+        self.store_block("lzma")
+        storage, db, connection = self.open(None)
+        self.assertEqual(connection.root.block.transactions[0].hash, self.tx.hash)
+        connection.root.other = Transaction([], [TransactionOutput("Genesis", "Carol", 5)])
+        transaction.commit()
+        self.assertEqual(storage.stats()["compressed_records"], 0)
+        db.close()
+
+    def test_pack_follows_compressed_references(self):
+        self.store_block("zlib")
+        storage, db, connection = self.open("zlib")
+        connection.root.name = "changed"
+        transaction.commit()
+        db.pack()
+        connection.cacheMinimize()
+        self.assertEqual(connection.root.block.transactions[0].hash, self.tx.hash)
+        db.close()
+
+    def test_dictionary_required(self):
+        dictionary = train_dictionary([b"Alice Bob Carol Dave"] * 3)
+        self.store_block("zlib", dictionary)
+        storage, db, connection = self.open("zlib")
+        with self.assertRaises(ValueError):
+            connection.root.block.height
+        db.close()
+
+if __name__ == '__main__':
+    unittest.main()
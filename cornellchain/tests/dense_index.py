@@ -0,0 +1,104 @@
+import unittest
+import random
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.dense_index import DenseIndex, path_sums
+from blockchain.transaction import Transaction, TransactionOutput
+
+class HeavyBlock(TestBlock):
+    """ Always-valid block whose weight does not fit in 64 bits. """
+
+    def get_weight(self):
+        return 2 ** 100
+
+class DenseIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def build_tree(self, num_blocks, block_class=TestBlock, blocks=None):
+        """ Adds a random block tree (every block extends a random recent block) to the test chain, or grows the given one. """
+        rng = random.Random(num_blocks)
+        if blocks is None:
+            blocks = [block_class(0, [], "genesis", is_genesis=True)]
+            self.assertTrue(self.test_chain.add_block(blocks[0], save=False))
+        for i in range(len(blocks), num_blocks):
+            parent = blocks[max(0, len(blocks) - 1 - int(rng.expovariate(0.5)))]
+            txs = [Transaction(["input:" + str(i)], [TransactionOutput("Alice", "Bob", j)]) for j in range(i % 4)]
+            block = block_class(parent.height + 1, txs, parent.hash)
+            block.timestamp += i # distinct headers even for empty siblings
+            block.hash = block.calculate_hash()
+            self.assertTrue(self.test_chain.add_block(block, save=False))
+            blocks.append(block)
+        return blocks
+
+    def naive_weights(self):
+        weights = {}
+        for height in self.test_chain.get_heights_with_blocks():
+            for block_hash in self.test_chain.get_blockhashes_at_height(height):
+                header = self.test_chain.headers[block_hash]
+                weights[block_hash] = header.get_weight() + (0 if header.is_genesis else weights[header.parent_hash])
+        return weights
+
+    def rows(self, dense):
+        """ Maps each block hash to its row, with the parent id replaced by the parent hash. """
+        columns = dense.columns()
+        rows = {}
+        for block_id, block_hash in enumerate(dense.hashes(range(len(dense)))):
+            row = {name: column[block_id] for name, column in columns.items()}
+            row["parent"] = None if row["parent"] < 0 else dense.hashes([row["parent"]])[0]
+            rows[block_hash] = row
+        return rows
+
+    def test_matches_naive_queries(self):
+        blocks = self.build_tree(200)
+        dense = DenseIndex.from_chain(self.test_chain)
+        self.assertEqual(len(dense), 200)
+        self.assertEqual(self.test_chain.get_all_block_weights(), self.naive_weights())
+        self.assertEqual(path_sums(dense.weight[:len(dense)], dense.parent[:len(dense)]).tolist(), dense.cumulative_weights().tolist())
+
+        parents = set(block.parent_hash for block in blocks)
+        self.assertEqual(set(dense.hashes(dense.tips())), set(block.hash for block in blocks if block.hash not in parents))
+        self.assertEqual(dense.blocks_per_height().tolist(), [len(self.test_chain.chain[h]) for h in self.test_chain.get_heights_with_blocks()])
+        self.assertEqual(int(dense.tx_count[:len(dense)].sum()), sum(len(block.transactions) for block in blocks))
+
+        best = set(self.test_chain.get_chain_ending_with(self.test_chain.get_heaviest_chain_tip().hash))
+        self.assertEqual(set(dense.hashes(dense.best_chain_mask().nonzero()[0])), best)
+        for tip, depth in dense.fork_depths().items():
+            fork = self.test_chain.get_chain_ending_with(dense.hashes([tip])[0])
+            self.assertEqual(depth, len([block_hash for block_hash in fork if block_hash not in best]))
+
+    def test_incremental_matches_rebuild(self):
+        blocks = self.build_tree(10)
+        incremental = self.test_chain.get_dense_index()
+        self.build_tree(3000, blocks=blocks) # grows the arrays past their initial capacity
+        self.assertIs(self.test_chain.get_dense_index(), incremental)
+        rebuilt = DenseIndex.from_chain(self.test_chain)
+        self.assertEqual(self.rows(incremental), self.rows(rebuilt)) # ids may differ, rows per block may not
+        self.assertEqual(incremental.heaviest_tip(), incremental.ids[rebuilt.hashes([rebuilt.heaviest_tip()])[0]])
+
+    def test_heaviest_tip_tie_break(self):
+        genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(genesis, save=False))
+        first = TestBlock(1, [], genesis.hash)
+        self.assertTrue(self.test_chain.add_block(first, save=False))
+        second = TestBlock(1, [Transaction(["input:0"], [TransactionOutput("Alice", "Bob", 1)])], genesis.hash)
+        self.assertTrue(self.test_chain.add_block(second, save=False))
+        self.assertEqual(self.test_chain.get_heaviest_chain_tip().hash, second.hash) # like the dict scan: newest at the lowest height
+        self.test_chain._v_dense = None
+        self.assertEqual(self.test_chain.get_heaviest_chain_tip().hash, second.hash)
+
+    def test_large_weights_stay_exact(self):
+        self.build_tree(50, block_class=HeavyBlock)
+        dense = self.test_chain.get_dense_index()
+        self.assertEqual(dense.weight.dtype, object)
+        self.assertEqual(self.test_chain.get_all_block_weights(), self.naive_weights())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import random
+import unittest
+import blockchain
+from blockchain.context import using_chain
+from blockchain.differential import DifferentialValidator, random_blocks
+from blockchain.stress import StressBlock
+from blockchain.transaction import Transaction, TransactionOutput
+
+class DifferentialTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def test_random_blocks_agree(self):
+        validator = DifferentialValidator()
+        accepted = 0
+        for block in random_blocks(self.test_chain, random.Random(1), 300, StressBlock):
+            try:
+                accepted += validator.is_valid(block, self.test_chain)[0]
+            except IndexError:
+                pass
+        self.assertEqual(validator.mismatches, [])
+        self.assertEqual(validator.checked, 301)
+        self.assertEqual(len(self.test_chain.blocks), accepted)
+        # the generator forks as well as extending the tip
+        self.assertGreater(len(self.test_chain.blocks), self.test_chain.get_heaviest_chain_tip().height + 10)
+
+    def test_mismatch_logged(self):
+        genesis = StressBlock(0, [Transaction([], [TransactionOutput("Genesis", "Alice", 10)])], "genesis", is_genesis=True)
+        validator = DifferentialValidator(reference=lambda block, chain: (False, "Rejected by reference"))
+        with self.assertLogs("blockchain.differential", "WARNING") as logs:
+            self.assertEqual(validator.is_valid(genesis, self.test_chain), (True, "All checks passed"))
+        self.assertIn(genesis.hash, logs.output[0])
+        self.assertEqual(validator.mismatches, [(genesis.hash, (True, "All checks passed"), (False, "Rejected by reference"))])
+
+    def test_raising_block_rejected(self):
+        funding = Transaction([], [TransactionOutput("Genesis", "Alice", 10)])
+        genesis = StressBlock(0, [funding], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(genesis, save=False))
+        # the rules raise on a later input past the end of the first input's transaction; the chain rejects the block
+        tx = Transaction([funding.hash + ":0", funding.hash + ":5"], [TransactionOutput("Alice", "Bob", 10)])
+        block = StressBlock(1, [tx], genesis.hash)
+        self.assertRaises(IndexError, block.is_valid, self.test_chain)
+        with self.assertLogs("blockchain.chain", "INFO") as logs:
+            self.assertFalse(self.test_chain.add_block(block, save=False))
+        self.assertIn(block.hash, logs.output[0])
+        self.assertNotIn(block.hash, self.test_chain.headers)
+
+    def test_sampling(self):
+        genesis = StressBlock(0, [], "genesis", is_genesis=True)
+        validator = DifferentialValidator(0, reference=lambda block, chain: self.fail("reference called"))
+        self.assertTrue(validator.is_valid(genesis, self.test_chain)[0])
+        self.assertEqual(validator.stats()["checked"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
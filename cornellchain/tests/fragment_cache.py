@@ -0,0 +1,51 @@
+import unittest
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from webapp.fragment_cache import FragmentCache
+from webapp.app import app, render_block
+
+class FragmentCacheTest(unittest.TestCase):
+
+    def test_renders_once(self):
+        cache = FragmentCache(1000)
+        renders = []
+        def render():
+            renders.append(1)
+            return "<b>block</b>"
+        self.assertEqual(cache.get(("a", 1, True), render), "<b>block</b>")
+        self.assertEqual(cache.get(("a", 1, True), render), "<b>block</b>")
+        self.assertEqual(len(renders), 1)
+        cache.get(("a", 1, False), render) # best chain membership changed: a different fragment
+        self.assertEqual(len(renders), 2)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 2, "evictions": 0, "fragments": 2, "size": 24})
+
+    def test_evicts_least_recently_used(self):
+        cache = FragmentCache(30)
+        for key in ["a", "b", "c"]:
+            cache.get(key, lambda: "x" * 10)
+        cache.get("a", lambda: "changed")
+        cache.get("d", lambda: "y" * 10) # over budget: "b" is the coldest
+        self.assertEqual(list(cache.entries), ["c", "a", "d"])
+        self.assertEqual(cache.size, 30)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.get("huge", lambda: "z" * 31), "z" * 31) # larger than the budget: served, not kept
+        self.assertNotIn("huge", cache.entries)
+        cache.clear()
+        self.assertEqual((len(cache.entries), cache.size), (0, 0))
+
+    def test_validity_checked_outside_cache(self):
+        chain = blockchain.Blockchain()
+        with using_chain(chain), app.app_context():
+            genesis = TestBlock(0, [], "genesis", is_genesis=True)
+            self.assertTrue(chain.add_block(genesis, save=False))
+            self.assertIn("(True, &#39;TEST BLOCK&#39;)", render_block(chain, genesis.hash, True))
+            # the chain changed under the cached fragment
+            genesis.is_valid = lambda chain=None: (False, "Invalid genesis")
+            html = render_block(chain, genesis.hash, True)
+            self.assertIn("(False, &#39;Invalid genesis&#39;)", html)
+            self.assertNotIn("TEST BLOCK", html)
+            self.assertNotIn("<!-- valid -->", html)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import ZODB
+import transaction
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.transaction import Transaction, TransactionOutput
+
+class HeadersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.blocks = []
+        parent_hash, is_genesis = "genesis", True
+        for height in range(20):
+            txs = [Transaction(["input:" + str(height)], [TransactionOutput("Alice", "Bob", i)]) for i in range(10)]
+            block = TestBlock(height, txs, parent_hash, is_genesis=is_genesis)
+            self.assertTrue(self.test_chain.add_block(block, save=False))
+            self.blocks.append(block)
+            parent_hash, is_genesis = block.hash, False
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def test_header_matches_block(self):
+        for block in self.blocks:
+            header = self.test_chain.headers[block.hash]
+            self.assertEqual(header.hash, block.hash)
+            self.assertEqual(header.header(), block.header())
+            self.assertEqual(header.get_weight(), block.get_weight())
+            self.assertEqual(header.seal_is_valid(), block.seal_is_valid())
+
+    def test_chain_walks_do_not_load_blocks(self):
+        tip = self.blocks[-1]
+        full_blocks = self.test_chain.blocks
+        weights = self.test_chain.get_all_block_weights()
+        self.test_chain.blocks = {tip.hash: tip} # only the tip may be looked up in full
+        try:
+            self.assertEqual(self.test_chain.get_chain_ending_with(tip.hash), [block.hash for block in reversed(self.blocks)])
+            self.assertEqual(self.test_chain.get_all_block_weights(), weights)
+            self.assertEqual(self.test_chain.get_heaviest_chain_tip(), tip)
+            self.assertEqual(TestBlock(20, [], tip.hash).target, tip.target)
+        finally:
+            self.test_chain.blocks = full_blocks
+
+    def test_blocks_stay_ghosts_in_database(self):
+        tip_hash = self.blocks[-1].hash # read before our own block objects become ghosts too
+        db = ZODB.DB(None)
+        connection = db.open()
+        connection.root.blockchain = self.test_chain
+        transaction.commit()
+        connection.close()
+
+        connection = db.open()
+        connection.cacheMinimize() # the pooled connection would otherwise keep everything loaded
+        chain = connection.root.blockchain
+        self.assertEqual(len(chain.get_chain_ending_with(tip_hash)), 20)
+        chain.get_all_block_weights()
+        self.assertTrue(all(block._p_changed is None for block in chain.blocks.values())) # still unloaded ghosts
+        self.assertEqual(chain.get_heaviest_chain_tip().hash, tip_hash)
+        self.assertEqual(sum(block._p_changed is not None for block in chain.blocks.values()), 1)
+        connection.close()
+        db.close()
+
+    def test_total_weights_stored(self):
+        weights = self.test_chain.get_all_block_weights()
+        for block in self.blocks:
+            self.assertEqual(self.test_chain.headers[block.hash].total_weight, weights[block.hash])
+            self.assertEqual(self.test_chain.get_total_weight(block.hash), weights[block.hash])
+        # chains stored before total weights were kept sum them up until migrated
+        for header in self.test_chain.headers.values():
+            del header.total_weight
+        del self.test_chain.total_weights_stored
+        self.assertEqual(self.test_chain.get_total_weight(self.blocks[-1].hash), weights[self.blocks[-1].hash])
+        self.assertTrue(self.test_chain.migrate())
+        self.assertEqual({block.hash: self.test_chain.headers[block.hash].total_weight for block in self.blocks}, weights)
+
+    def test_build_headers_migration(self):
+        del self.test_chain.headers
+        self.assertEqual(self.test_chain.build_headers(), 20)
+        self.assertEqual(self.test_chain.build_headers(), 0)
+        self.assertEqual(len(self.test_chain.get_chain_ending_with(self.blocks[-1].hash)), 20)
+
+if __name__ == '__main__':
+    unittest.main()
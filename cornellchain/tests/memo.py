@@ -0,0 +1,51 @@
+import unittest
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.header import BlockHeader
+from blockchain.util import sha256_2_string, encode_as_str
+from blockchain.transaction import Transaction, TransactionOutput
+
+class MemoTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.tx = Transaction(["input:0"], [TransactionOutput("Alice", "Bob", 1), TransactionOutput("Alice", "Alice", 1)])
+        self.block = TestBlock(0, [self.tx], "genesis", is_genesis=True)
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def test_transaction_memo(self):
+        self.assertIs(self.tx.header(), self.tx.header())
+        self.assertIs(repr(self.tx), repr(self.tx))
+        self.assertEqual(self.tx.leaf_hash(), sha256_2_string(encode_as_str([self.tx.hash, self.tx.header()], sep="-")))
+        old_hash = self.tx.hash
+        self.tx.outputs = [TransactionOutput("Alice", "Carol", 1)]
+        self.tx.hash = self.tx.calculate_hash()
+        self.assertNotEqual(self.tx.hash, old_hash)
+        self.assertIn("Carol", repr(self.tx))
+        self.assertEqual(self.tx.leaf_hash(), sha256_2_string(str(self.tx)))
+
+    def test_block_header_memo(self):
+        unsealed = self.block.unsealed_header()
+        self.assertIs(self.block.header(), self.block.header())
+        self.block.set_seal_data(7)
+        self.assertIs(self.block.unsealed_header(), unsealed) # the seal is not part of the unsealed header
+        self.assertTrue(self.block.header().endswith("`7"))
+        self.block.timestamp += 1
+        self.assertNotEqual(self.block.unsealed_header(), unsealed)
+        self.assertEqual(self.block.header(), encode_as_str([self.block.unsealed_header(), 7], sep="`"))
+        header = BlockHeader.from_block(self.block)
+        self.assertEqual(header.header(), self.block.header())
+
+    def test_memo_not_persisted(self):
+        self.block.header()
+        repr(self.tx)
+        self.assertFalse(any(name.startswith("_v_") for name in self.block.__getstate__()))
+        self.assertFalse(any(name.startswith("_v_") for name in self.tx.__getstate__()))
+
+if __name__ == '__main__':
+    unittest.main()
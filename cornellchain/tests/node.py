@@ -0,0 +1,202 @@
+import unittest
+import asyncio
+import config
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.transaction import Transaction, TransactionOutput
+from blockchain.serialization import block_to_dict, block_from_dict
+from blockchain.protocol import write_message
+from blockchain.node import Node, Peer
+
+async def wait_until(predicate, timeout=5):
+    """ Polls predicate until it holds, failing the test after timeout seconds. """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("Timed out waiting for condition")
+        await asyncio.sleep(.01)
+
+class NodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def make_chain(self, length):
+        """ Builds a linear chain of always-valid blocks in self.test_chain. """
+        tx = Transaction([], [TransactionOutput("Alice", "Bob", 1), TransactionOutput("Alice", "Alice", 1)])
+        block = TestBlock(0, [tx], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(block, save=False))
+        blocks = [block]
+        for height in range(1, length):
+            block = TestBlock(height, [], block.hash)
+            self.assertTrue(self.test_chain.add_block(block, save=False))
+            blocks.append(block)
+        return blocks
+
+    def test_serialization_roundtrip(self):
+        genesis = self.make_chain(1)[0]
+        decoded = block_from_dict(block_to_dict(genesis))
+        self.assertEqual(type(decoded), TestBlock)
+        self.assertEqual(decoded.hash, genesis.hash)
+        self.assertEqual(decoded.header(), genesis.header())
+        self.assertEqual([tx.hash for tx in decoded.transactions], [tx.hash for tx in genesis.transactions])
+
+    def test_block_and_tx_gossip(self):
+        async def scenario():
+            nodes = [Node(blockchain.Blockchain()) for i in range(3)]
+            for node in nodes:
+                await node.start()
+            # line topology: 0 - 1 - 2
+            await nodes[1].connect("127.0.0.1", nodes[0].port)
+            await nodes[2].connect("127.0.0.1", nodes[1].port)
+            await wait_until(lambda: all(len(node.peers) >= 1 for node in nodes) and len(nodes[1].peers) == 2)
+
+            genesis = TestBlock(0, [], "genesis", is_genesis=True)
+            self.assertTrue(await nodes[0].submit_block(genesis))
+            await wait_until(lambda: genesis.hash in nodes[2].chain.blocks)
+
+            tx = Transaction(["coinbase:0"], [TransactionOutput("Alice", "Bob", 1)])
+            self.assertTrue(await nodes[2].submit_tx(tx))
+            await wait_until(lambda: tx.hash in nodes[0].mempool)
+
+            # a block confirming the tx clears it from every mempool
+            block = TestBlock(1, [tx], genesis.hash, chain=nodes[0].chain)
+            self.assertTrue(await nodes[0].submit_block(block))
+            await wait_until(lambda: block.hash in nodes[2].chain.blocks)
+            self.assertNotIn(tx.hash, nodes[2].mempool)
+            self.assertIn(tx.hash, nodes[2].chain.all_transactions)
+
+            for node in nodes:
+                await node.stop()
+        asyncio.run(scenario())
+
+    def test_late_joiner_catches_up(self):
+        blocks = self.make_chain(40)
+
+        async def scenario():
+            source = Node(self.test_chain)
+            joiner = Node(blockchain.Blockchain(), max_in_flight=4)
+            await source.start()
+            await joiner.start()
+            await joiner.connect("127.0.0.1", source.port)
+            await wait_until(lambda: len(joiner.chain.blocks) == len(blocks))
+            tip = joiner.chain.get_heaviest_chain_tip()
+            self.assertEqual(tip.hash, blocks[-1].hash)
+            self.assertEqual(joiner.chain.get_chain_ending_with(tip.hash), [block.hash for block in reversed(blocks)])
+            self.assertEqual(joiner.orphans, {})
+            await source.stop()
+            await joiner.stop()
+        asyncio.run(scenario())
+
+    def test_orphan_parents_are_fetched(self):
+        blocks = self.make_chain(5)
+
+        async def scenario():
+            receiver = Node(blockchain.Blockchain())
+            source = Node(blockchain.Blockchain())
+            source.chain.add_block(blocks[0], save=False)
+            await source.start()
+            await receiver.start()
+            await receiver.connect("127.0.0.1", source.port)
+            await wait_until(lambda: blocks[0].hash in receiver.chain.blocks)
+            # the newest block is announced on its own; its ancestors never are
+            for block in blocks[1:-1]:
+                source.chain.add_block(block, save=False)
+            self.assertTrue(await source.submit_block(blocks[-1]))
+            await wait_until(lambda: blocks[-1].hash in receiver.chain.blocks)
+            self.assertEqual(len(receiver.chain.blocks), 5)
+            self.assertEqual(receiver.orphans, {})
+            await source.stop()
+            await receiver.stop()
+        asyncio.run(scenario())
+
+    def test_protocol_error_disconnects(self):
+        async def scenario():
+            node = Node(blockchain.Blockchain(), max_in_flight=1)
+            await node.start()
+            reader, writer = await asyncio.open_connection("127.0.0.1", node.port)
+            await wait_until(lambda: len(node.peers) == 1)
+            # one block is requested at once, the others wait in the pipeline
+            write_message(writer, {"type": "inv", "items": [["block", "a" * 64], ["block", "b" * 64], ["block", "c" * 64]]})
+            await wait_until(lambda: len(node.requested) == 3)
+            with self.assertLogs("blockchain.node", "WARNING") as logs:
+                write_message(writer, {"type": "block"}) # no block
+                await wait_until(lambda: not node.peers)
+            self.assertIn("KeyError", logs.output[0])
+            # nothing stays requested from the dropped peer, so others are asked
+            self.assertEqual(node.requested, set())
+            writer.close()
+            await node.stop()
+        asyncio.run(scenario())
+
+    def test_orphans_bounded(self):
+        orphans = self.make_chain(6)[1:] # none of their parents is on the receiving node's chain
+        old_limit = config.NODE_MAX_ORPHANS
+        config.NODE_MAX_ORPHANS = 3
+        try:
+            async def scenario():
+                node = Node(blockchain.Blockchain())
+                peer = Peer(None, None)
+                for orphan in orphans + orphans[-1:]:
+                    await node._receive_block(peer, orphan)
+                node.executor.shutdown()
+                return node
+            node = asyncio.run(scenario())
+        finally:
+            config.NODE_MAX_ORPHANS = old_limit
+        # the oldest are dropped; a duplicate is kept once
+        self.assertEqual(list(node.orphan_hashes), [orphan.hash for orphan in orphans[2:]])
+        self.assertEqual(node.orphans, {orphan.parent_hash: [orphan] for orphan in orphans[2:]})
+        self.assertEqual(node._missing([("block", orphans[0].hash), ("block", orphans[4].hash)]), [("block", orphans[0].hash)])
+
+    def test_mempool_bounded(self):
+        txs = [Transaction(["coinbase:0"], [TransactionOutput("Alice", "Bob", amount)]) for amount in range(1, 6)]
+        old_limit = config.NODE_MAX_MEMPOOL
+        config.NODE_MAX_MEMPOOL = 3
+        try:
+            node = Node(blockchain.Blockchain())
+            for tx in txs:
+                self.assertTrue(node._accept_tx(tx))
+            node.executor.shutdown()
+        finally:
+            config.NODE_MAX_MEMPOOL = old_limit
+        # the oldest are dropped, and would be fetched again if announced
+        self.assertEqual(list(node.mempool), [tx.hash for tx in txs[2:]])
+        self.assertEqual(node._missing([("tx", txs[0].hash), ("tx", txs[4].hash)]), [("tx", txs[0].hash)])
+
+    def test_unanswered_request_goes_to_another_peer(self):
+        genesis = self.make_chain(1)[0]
+        old_timeout = config.NODE_REQUEST_SECONDS
+        config.NODE_REQUEST_SECONDS = .2
+        try:
+            async def scenario():
+                source = Node(self.test_chain)
+                receiver = Node(blockchain.Blockchain())
+                await source.start()
+                await receiver.start()
+                # a peer that announces the block but never sends it
+                reader, writer = await asyncio.open_connection("127.0.0.1", receiver.port)
+                await wait_until(lambda: len(receiver.peers) == 1)
+                write_message(writer, {"type": "inv", "items": [["block", genesis.hash]]})
+                staller = receiver.peers[0]
+                await wait_until(lambda: staller.in_flight)
+                await receiver.connect("127.0.0.1", source.port)
+                await wait_until(lambda: genesis.hash in receiver.chain.blocks)
+                self.assertEqual(len(staller.in_flight), 0)
+                self.assertEqual(receiver.requested, set())
+                writer.close()
+                await source.stop()
+                await receiver.stop()
+            asyncio.run(scenario())
+        finally:
+            config.NODE_REQUEST_SECONDS = old_timeout
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import pickle
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.pow_block import PoWBlock
+from blockchain.transaction import Transaction, TransactionOutput
+from blockchain import outpoint
+from blockchain.outpoint import OutPoint, HashIndex, hash_key, hash_hex
+
+class OutPointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 1), TransactionOutput("Alice", "Alice", 1)])
+        self.tx2 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Bob", 1)])
+        self.genesis = TestBlock(0, [self.tx1], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(self.genesis, save=False))
+        self.block = TestBlock(1, [self.tx2], self.genesis.hash)
+        self.assertTrue(self.test_chain.add_block(self.block, save=False))
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def test_outpoint(self):
+        outpoint = OutPoint.parse(self.tx1.hash + ":1")
+        self.assertEqual(outpoint.tx_hash, bytes.fromhex(self.tx1.hash))
+        self.assertEqual(outpoint.index, 1)
+        self.assertEqual(str(outpoint), self.tx1.hash + ":1")
+        self.assertEqual(outpoint, OutPoint(bytes.fromhex(self.tx1.hash), 1))
+        self.assertNotEqual(outpoint, OutPoint(bytes.fromhex(self.tx1.hash), 0))
+        self.assertEqual(len(set([outpoint, OutPoint.parse(self.tx1.hash + ":1")])), 1)
+        self.assertEqual(pickle.loads(pickle.dumps(outpoint)), outpoint)
+        self.assertFalse(hasattr(outpoint, "__dict__"))
+        # references that are not real hashes keep their string form
+        self.assertEqual(OutPoint.parse("fakehash:2").tx_hash, "fakehash")
+        self.assertRaises(ValueError, OutPoint.parse, "fakehash:x")
+
+    def test_keys_interned_per_chain(self):
+        block_key = self.test_chain.intern_hash(self.block.hash)
+        self.assertIs(self.test_chain.intern_hash(bytes.fromhex(self.block.hash)), block_key)
+        self.assertIs(next(key for key in self.test_chain.blocks if key == block_key), block_key)
+        # another chain has a table of its own, which goes away with it
+        other = blockchain.Blockchain()
+        self.assertIsNot(other.intern_hash(self.block.hash), block_key)
+        self.assertEqual(len(other._v_interned), 1)
+        self.assertFalse(hasattr(outpoint, "_interned"))
+
+    def test_hash_keys(self):
+        self.assertEqual(hash_hex(hash_key(self.tx1.hash)), self.tx1.hash)
+        self.assertEqual(hash_key("genesis"), "genesis")
+        index = HashIndex()
+        index[self.tx1.hash] = 1
+        self.assertIn(self.tx1.hash, index)
+        self.assertIn(bytes.fromhex(self.tx1.hash), index)
+        self.assertEqual(index.get(self.tx1.hash), 1)
+        self.assertEqual(index.hex_keys(), [self.tx1.hash])
+        self.assertEqual(pickle.loads(pickle.dumps(index)), index)
+
+    def test_chain_indexes(self):
+        chain = self.test_chain
+        block_key = next(key for key in chain.blocks if chain.blocks[key] is self.block)
+        self.assertEqual(len(block_key), 32)
+        # hex lookups still work everywhere, and outputs are indexed by OutPoint
+        self.assertIs(chain.blocks[self.block.hash], self.block)
+        self.assertIs(chain.all_transactions[self.tx2.hash], self.tx2)
+        self.assertEqual(chain.blocks_spending_input[self.tx1.hash + ":1"], [block_key])
+        self.assertIn(OutPoint.parse(self.tx1.hash + ":1"), chain.blocks_spending_input)
+        self.assertEqual(chain.get_blockhashes_at_height(1), [self.block.hash])
+        # one shared key object per hash across indexes
+        self.assertIs(chain.blocks_containing_tx[self.tx2.hash][0], block_key)
+        self.assertIs(chain.chain[1][0], block_key)
+        self.assertIs(chain.blocks_spending_input[self.tx1.hash + ":1"][0], block_key)
+
+    def test_migrate_hex_keyed_chain(self):
+        chain = self.test_chain
+        expected_spends = {str(outpoint): [hash_hex(key) for key in keys] for outpoint, keys in chain.blocks_spending_input.items()}
+        # rebuild the indexes the way older versions stored them
+        chain.chain = {height: [hash_hex(key) for key in keys] for height, keys in chain.chain.items()}
+        chain.blocks = {hash_hex(key): block for key, block in chain.blocks.items()}
+        chain.blocks_spending_input = {ref: hashes for ref, hashes in expected_spends.items()}
+        chain.blocks_containing_tx = {hash_hex(key): [hash_hex(block_key) for block_key in keys] for key, keys in chain.blocks_containing_tx.items()}
+        chain.all_transactions = {hash_hex(key): tx for key, tx in chain.all_transactions.items()}
+        del chain.headers
+
+        self.assertTrue(chain.migrate())
+        self.assertFalse(chain.migrate())
+        self.assertIsInstance(chain.blocks, HashIndex)
+        self.assertEqual({str(outpoint): [hash_hex(key) for key in keys] for outpoint, keys in chain.blocks_spending_input.items()}, expected_spends)
+        self.assertEqual(chain.get_chain_ending_with(self.block.hash), [self.block.hash, self.genesis.hash])
+        tx3 = Transaction([self.tx1.hash + ":1"], [TransactionOutput("Alice", "Carol", 1)])
+        double_spend = PoWBlock(2, [tx3], self.block.hash)
+        double_spend.mine()
+        self.assertEqual(double_spend.is_valid(), (False, "Double-spent input"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import config
+import blockchain
+from blockchain.context import using_chain
+from blockchain.serialization import register_block_type
+from blockchain.stress import StressBlock
+from blockchain.transaction import Transaction, TransactionOutput
+
+# archived blocks are decoded by class name
+register_block_type(StressBlock)
+
+class PruneTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.old_config = config.ARCHIVE_PATH, config.PRUNE_DEPTH, config.PRUNE_INTERVAL
+        config.ARCHIVE_PATH = os.path.join(self.directory, "archive.dat")
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.funding = Transaction([], [TransactionOutput("Genesis", "Alice", 10), TransactionOutput("Genesis", "Alice", 10)])
+        self.genesis = self.add(StressBlock(0, [self.funding], "genesis", is_genesis=True))
+        # best chain: Alice pays Bob at height 1, then empty blocks up to height 10
+        self.payment = Transaction([self.funding.hash + ":0"], [TransactionOutput("Alice", "Bob", 4), TransactionOutput("Alice", "Alice", 6)])
+        self.best = [self.genesis, self.add(StressBlock(1, [self.payment], self.genesis.hash))]
+        for height in range(2, 11):
+            self.best.append(self.add(StressBlock(height, [], self.best[-1].hash)))
+        # a stale fork spending the other funding output at heights 1 and 2, and a live one at height 9
+        self.fork_tx = Transaction([self.funding.hash + ":1"], [TransactionOutput("Alice", "Carol", 10)])
+        self.stale = [self.add(StressBlock(1, [self.fork_tx], self.genesis.hash))]
+        self.stale.append(self.add(StressBlock(2, [], self.stale[0].hash)))
+        change = Transaction([self.payment.hash + ":1"], [TransactionOutput("Alice", "Alice", 6)])
+        self.live = self.add(StressBlock(9, [change], self.best[8].hash))
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+        config.ARCHIVE_PATH, config.PRUNE_DEPTH, config.PRUNE_INTERVAL = self.old_config
+        shutil.rmtree(self.directory)
+
+    def add(self, block):
+        self.assertTrue(self.test_chain.add_block(block, save=False), block.is_valid(self.test_chain)[1])
+        return block
+
+    def test_stale_forks_archived(self):
+        self.assertEqual(self.test_chain.prune(5, False), (2, 0))
+        for block in self.stale:
+            self.assertNotIn(block.hash, self.test_chain.headers)
+            self.assertNotIn(block.hash, self.test_chain.get_blockhashes_at_height(block.height))
+            self.assertEqual(self.test_chain.get_block(block.hash).hash, block.hash) # read back from the archive
+        self.assertNotIn(self.fork_tx.hash, self.test_chain.all_transactions)
+        self.assertNotIn(self.funding.hash + ":1", self.test_chain.blocks_spending_input)
+        self.assertEqual(self.test_chain.search_hashes(self.fork_tx.hash), [])
+        self.assertEqual(self.test_chain.get_transaction(self.fork_tx.hash).hash, self.fork_tx.hash)
+        self.assertIn(self.live.hash, self.test_chain.blocks)
+        self.assertEqual(self.test_chain.get_heaviest_chain_tip().hash, self.best[-1].hash)
+        self.assertEqual(self.test_chain.get_archive().stats()["blocks"], 2)
+
+        # the stale fork's output is spendable again, and its blocks can be added back
+        self.add(StressBlock(11, [self.fork_tx], self.best[-1].hash))
+        self.add(StressBlock(1, [Transaction([self.funding.hash + ":1"], [TransactionOutput("Alice", "Dave", 10)])], self.genesis.hash))
+        self.assertEqual(self.test_chain.prune(5, False), (1, 0))
+
+    def test_events_replayed_after_prune(self):
+        from webapp.app import app, chain_events
+        self.test_chain.prune(5, False)
+        with app.app_context():
+            messages, next_event, tip = chain_events(self.test_chain, 0, None)
+        self.assertEqual(next_event, self.test_chain.get_block_log_length())
+        self.assertEqual(tip, self.best[-1].hash)
+        events = [json.loads(message.split("data: ")[1]) for message in messages]
+        self.assertEqual([event["hash"] for event in events[:-1]], [block.hash for block in self.best + [self.live]])
+        self.assertEqual([event["best"] for event in events[:-1]], [True] * len(self.best) + [False])
+        self.assertEqual(events[-1]["hash"], tip) # then the tip
+
+    def test_deep_bodies_pruned(self):
+        self.assertEqual(self.test_chain.prune(5, True), (2, 6))
+        self.assertEqual(self.test_chain.prune(5, True), (0, 0)) # heights already covered
+        deep = self.best[1]
+        self.assertNotIn(deep.hash, self.test_chain.blocks)
+        self.assertIn(deep.hash, self.test_chain.headers)
+        self.assertEqual([tx.hash for tx in self.test_chain.get_block(deep.hash).transactions], [self.payment.hash])
+        # both transactions still have unspent outputs, so they stay
+        self.assertIn(self.funding.hash, self.test_chain.all_transactions)
+        self.assertIn(self.payment.hash, self.test_chain.all_transactions)
+        self.assertEqual(self.test_chain.get_balance("Bob"), 4)
+        replay = Transaction([self.funding.hash + ":0"], [TransactionOutput("Alice", "Alice", 10)])
+        self.assertEqual(StressBlock(11, [replay], self.best[-1].hash).is_valid(self.test_chain), (False, "Double-spent input"))
+
+    def test_spent_transactions_leave_index(self):
+        # Bob spends the payment at height 2 of a new branch that becomes the best chain
+        spend = Transaction([self.payment.hash + ":0"], [TransactionOutput("Bob", "Carol", 4)])
+        branch = [self.add(StressBlock(2, [spend], self.best[1].hash))]
+        for height in range(3, 18):
+            branch.append(self.add(StressBlock(height, [], branch[-1].hash)))
+        self.assertEqual(self.test_chain.prune(5, True), (12, 13))
+        self.assertNotIn(self.best[2].hash, self.test_chain.headers) # now on a stale fork
+        self.assertNotIn(branch[0].hash, self.test_chain.blocks)
+        self.assertIn(self.payment.hash, self.test_chain.all_transactions) # Alice's change is unspent
+        self.assertIn(spend.hash, self.test_chain.all_transactions)
+
+        payout = Transaction([spend.hash + ":0"], [TransactionOutput("Carol", "Dave", 4)])
+        self.add(StressBlock(18, [payout], branch[-1].hash))
+        for height in range(19, 25):
+            self.add(StressBlock(height, [], self.test_chain.get_heaviest_chain_tip_hash()))
+        self.test_chain.prune(5, True)
+        # every output of spend is spent now, so it is only in the archive
+        self.assertNotIn(spend.hash, self.test_chain.all_transactions)
+        self.assertEqual(self.test_chain.get_transaction(spend.hash).hash, spend.hash)
+        again = Transaction([spend.hash + ":0"], [TransactionOutput("Carol", "Carol", 4)])
+        self.assertEqual(StressBlock(25, [again], self.test_chain.get_heaviest_chain_tip_hash()).is_valid(self.test_chain),
+                         (False, "Required output not found"))
+
+    def test_add_block_prunes(self):
+        config.PRUNE_DEPTH, config.PRUNE_INTERVAL = 5, 1
+        self.add(StressBlock(11, [], self.best[-1].hash))
+        self.assertNotIn(self.stale[0].hash, self.test_chain.headers)
+        self.assertIn(self.stale[0].hash, self.test_chain.get_archive())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.transaction import Transaction, TransactionOutput
+
+class SearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        parent = TestBlock(0, [Transaction([], [TransactionOutput("Genesis", "Alice", 100)])], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(parent, save=False))
+        self.hashes = {parent.hash: "block", parent.transactions[0].hash: "tx"}
+        for i in range(1, 300):
+            txs = [Transaction(["input:" + str(i)], [TransactionOutput("Alice", "Bob", j)]) for j in range(3)]
+            parent = TestBlock(i, txs, parent.hash)
+            self.assertTrue(self.test_chain.add_block(parent, save=False))
+            self.hashes[parent.hash] = "block"
+            self.hashes.update((tx.hash, "tx") for tx in txs)
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def naive_search(self, prefix):
+        return [(self.hashes[item_hash], item_hash) for item_hash in sorted(self.hashes) if item_hash.startswith(prefix.lower())]
+
+    def test_prefix_search(self):
+        self.assertEqual(len(self.test_chain.hash_index), len(self.hashes))
+        for prefix in ["", "a", "0f", "B7", "c3a", "ff", "1234"]:
+            self.assertEqual(self.test_chain.search_hashes(prefix, limit=len(self.hashes)), self.naive_search(prefix), prefix)
+        some_hash = sorted(self.hashes)[100]
+        self.assertEqual(self.test_chain.search_hashes(some_hash), [(self.hashes[some_hash], some_hash)])
+        self.assertEqual(self.test_chain.search_hashes(some_hash[:6].upper())[0][1][:6], some_hash[:6])
+        self.assertEqual(len(self.test_chain.search_hashes("", limit=5)), 5)
+        self.assertEqual(self.test_chain.search_hashes("xyz"), [])
+        self.assertEqual(self.test_chain.search_hashes(some_hash + "0"), [])
+
+    def test_lookups(self):
+        for block_hash in self.test_chain.get_chain_ending_with(self.test_chain.get_heaviest_chain_tip().hash):
+            for tx in self.test_chain.get_block(block_hash).transactions:
+                self.assertEqual(self.test_chain.get_blocks_containing_tx(tx.hash), [block_hash])
+        tip = self.test_chain.get_heaviest_chain_tip()
+        self.assertEqual(self.test_chain.get_total_weight(tip.hash), self.test_chain.get_all_block_weights()[tip.hash])
+        self.assertEqual(self.test_chain.get_blocks_containing_tx("00" * 32), [])
+
+    def test_migrate_builds_index(self):
+        expected = self.test_chain.search_hashes("", limit=len(self.hashes))
+        del self.test_chain.hash_index
+        self.assertTrue(self.test_chain.migrate())
+        self.assertEqual(self.test_chain.search_hashes("", limit=len(self.hashes)), expected)
+        self.assertFalse(self.test_chain.migrate())
+
+if __name__ == '__main__':
+    unittest.main()
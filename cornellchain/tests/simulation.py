@@ -0,0 +1,39 @@
+import unittest
+from blockchain.simulation import Simulation
+
+# report entries that depend only on the seed (the others are wall-clock measurements)
+SIMULATED = ["node_hours", "blocks", "orphan_rate", "finality_seconds", "propagation_seconds"]
+
+class SimulationTest(unittest.TestCase):
+
+    def test_instant_network_has_no_orphans(self):
+        simulation = Simulation(8, interval=60, latency=0, validation_scale=0, seed=1)
+        report = simulation.run(2)
+        self.assertGreater(report["blocks"], 60)
+        self.assertEqual(report["orphan_rate"], 0.0)
+        self.assertEqual(report["propagation_seconds"], (0.0, 0.0))
+        # every node validated every block, and all agree on the tip
+        self.assertEqual(len(set(node.tip for node in simulation.nodes)), 1)
+        self.assertTrue(all(len(node.accepted) == report["blocks"] for node in simulation.nodes))
+        self.assertGreater(report["ingest_txs_per_second"], 0)
+
+    def test_slow_network_forks(self):
+        report = Simulation(8, interval=10, latency=5, seed=1).run(0.5)
+        self.assertGreater(report["orphan_rate"], 0.1)
+        median, p90 = report["propagation_seconds"]
+        self.assertGreater(median, 5)
+        self.assertGreaterEqual(report["finality_seconds"][0], 6 * 10 / 2) # six confirmations take a while
+
+    def test_reproducible(self):
+        first, second = [Simulation(6, interval=30, validation_scale=0, seed=3).run(1) for i in range(2)]
+        self.assertEqual([first[name] for name in SIMULATED], [second[name] for name in SIMULATED])
+        self.assertNotEqual(Simulation(6, interval=30, validation_scale=0, seed=4).run(1)["blocks"], first["blocks"])
+
+    def test_non_mining_nodes(self):
+        simulation = Simulation(shares=[1, 0, 0, 0], interval=60, latency=1, seed=2)
+        simulation.run(1)
+        self.assertEqual(simulation.miners, simulation.nodes[:1])
+        self.assertEqual(simulation.report()["orphan_rate"], 0.0) # a single miner never forks itself
+
+if __name__ == '__main__':
+    unittest.main()
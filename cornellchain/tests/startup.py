@@ -0,0 +1,90 @@
+import os
+import importlib
+import shutil
+import tempfile
+import unittest
+import transaction
+import config
+import blockchain
+from blockchain.test_block import TestBlock
+from blockchain.transaction import Transaction, TransactionOutput
+from benchmark_startup import time_statement
+
+class StartupTest(unittest.TestCase):
+
+    def setUp(self):
+        self.old_opened = dict(blockchain.opened) # set aside, so the tests can open and close their own
+        blockchain.opened.clear()
+        self.directory = tempfile.mkdtemp()
+        self.old_path = config.DB_PATH
+        config.DB_PATH = os.path.join(self.directory, "blockchain.db")
+
+    def tearDown(self):
+        blockchain.close_chain()
+        blockchain.opened.update(self.old_opened) # restore original chain
+        config.DB_PATH = self.old_path
+        shutil.rmtree(self.directory)
+
+    def add_blocks(self, chain, count):
+        parent = chain.get_heaviest_chain_tip()
+        for i in range(count):
+            if parent is None:
+                block = TestBlock(0, [Transaction([], [TransactionOutput("Genesis", "Alice", 10)])], "genesis", is_genesis=True)
+            else:
+                block = TestBlock(parent.height + 1, [Transaction([], [TransactionOutput("Genesis", "Alice", i)])], parent.hash)
+            self.assertTrue(chain.add_block(block))
+            parent = block
+
+    def test_import_has_no_side_effects(self):
+        elapsed, imported = time_statement("import blockchain, blockchain.util\nassert not blockchain.opened", repeat=1)
+        for module in ("ZODB", "BTrees", "numpy", "ecdsa"):
+            self.assertNotIn(module, imported)
+        self.assertLess(elapsed, 1) # ~10ms; opening the database used to make this ~250ms
+
+    def test_open_is_lazy(self):
+        self.assertEqual(blockchain.opened, {})
+        self.assertFalse(os.path.exists(config.DB_PATH))
+        chain = blockchain.chain # first use opens (and creates) the database
+        self.assertIs(blockchain.open_chain(), chain)
+        importlib.import_module("blockchain.chain") # binds the submodule to the package's chain attribute, which must keep the chain
+        self.assertIs(blockchain.chain, chain)
+        self.assertTrue(os.path.exists(config.DB_PATH))
+        with self.assertRaises(AttributeError):
+            blockchain.no_such_attribute
+
+    def test_index_saved_and_validated(self):
+        self.add_blocks(blockchain.open_chain(), 3)
+        blockchain.close_chain()
+        self.assertTrue(os.path.exists(config.DB_PATH + ".index"))
+        with open(config.DB_PATH + ".index", "rb") as index_file:
+            saved_index = index_file.read()
+
+        # commits after the index was saved, then no clean close (as if the process were killed):
+        # the stale index is kept and extended by scanning only the newer records
+        chain = blockchain.open_chain()
+        self.add_blocks(chain, 2)
+        blockchain.close_chain()
+        with open(config.DB_PATH + ".index", "wb") as index_file:
+            index_file.write(saved_index)
+        self.assertEqual(len(blockchain.open_chain().blocks), 5)
+        self.assertEqual(blockchain.chain.get_heaviest_chain_tip().height, 4)
+
+    def test_old_database_refused(self):
+        chain = blockchain.open_chain()
+        self.add_blocks(chain, 3)
+        del chain.hash_index # as stored by an older version
+        transaction.commit()
+        blockchain.close_chain()
+        size = os.path.getsize(config.DB_PATH)
+
+        with self.assertRaises(ValueError) as context:
+            blockchain.open_chain()
+        self.assertIn("hash search index", str(context.exception))
+        self.assertEqual(blockchain.opened, {})
+        self.assertEqual(os.path.getsize(config.DB_PATH), size) # nothing written
+        self.assertEqual(blockchain.open_chain(migrate=True).search_hashes(chain.get_heaviest_chain_tip_hash()[:8])[0][0], "block")
+        blockchain.close_chain()
+        self.assertEqual(blockchain.open_chain().pending_migrations(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import time
+import tempfile
+import unittest
+import transaction
+import ZEO
+from ZODB.POSException import ReadOnlyError
+import config
+import blockchain
+from blockchain.storage import Database, open_storage
+from blockchain.test_block import TestBlock
+
+class StorageServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.address, self.stop = ZEO.server(path=os.path.join(self.directory, "blockchain.db"))
+        self.old_config = config.STORAGE, config.ZEO_HOST, config.ZEO_PORT, config.COMPRESSION
+        config.STORAGE = "zeo"
+        config.ZEO_HOST, config.ZEO_PORT = self.address
+
+    def tearDown(self):
+        config.STORAGE, config.ZEO_HOST, config.ZEO_PORT, config.COMPRESSION = self.old_config
+        self.stop()
+        shutil.rmtree(self.directory)
+
+    def test_reader_sees_writer_commits(self):
+        writer_manager, reader_manager = transaction.TransactionManager(), transaction.TransactionManager()
+        writer_db = Database(open_storage())
+        writer = writer_db.open(writer_manager)
+        writer.root.blockchain = blockchain.Blockchain()
+        writer_manager.commit()
+        reader_db = Database(open_storage(read_only=True))
+        reader = reader_db.open(reader_manager)
+        self.assertEqual(len(reader.root.blockchain.blocks), 0)
+
+        chain = writer.root.blockchain
+        genesis = TestBlock(0, [], "genesis", is_genesis=True)
+        self.assertTrue(chain.add_block(genesis, save=False))
+        writer_manager.commit()
+
+        self.assertEqual(len(reader.root.blockchain.blocks), 0) # still reading the old snapshot
+        deadline = time.time() + 5 # the server pushes the commit's invalidations to other clients asynchronously
+        while reader_db.lastTransaction() != writer_db.lastTransaction() and time.time() < deadline:
+            time.sleep(.01)
+        reader_manager.begin()
+        self.assertEqual(reader.root.blockchain.get_blocks_added_since(0), [(0, genesis.hash)])
+        reader.root.blockchain.chain = {}
+        self.assertRaises(ReadOnlyError, reader_manager.commit) # workers cannot write
+        reader_manager.abort()
+        for db in [reader_db, writer_db]:
+            db.close()
+
+    def test_no_pack_through_server_with_compression(self):
+        db = Database(open_storage())
+        connection = db.open()
+        connection.root.blockchain = blockchain.Blockchain()
+        del connection.root.blockchain.hash_index # as stored by an older version
+        transaction.commit()
+        db.close()
+
+        config.COMPRESSION = "zlib"
+        db = Database(open_storage())
+        self.assertRaises(ValueError, db.pack)
+        db.close()
+        old_opened = dict(blockchain.opened)
+        blockchain.opened.clear()
+        try:
+            with self.assertLogs("blockchain", "WARNING") as logs:
+                chain = blockchain.open_chain(migrate=True) # migrates, but leaves packing to "file" mode
+            self.assertTrue(hasattr(chain, "hash_index"))
+            self.assertIn("Not packing", logs.output[0])
+        finally:
+            blockchain.close_chain()
+            blockchain.opened.update(old_opened)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import gc
+import time
+import unittest
+import blockchain
+from blockchain.context import using_chain
+from blockchain.stress import worst_case_blocks, time_validation, MAX_TXS
+
+DEPTH = 500
+
+# doubling the block or the chain below it may at most multiply validation time by this: linear rules give about
+# 2 (inputs) or 1 (depth, a small share of the time), a quadratic one 4
+MAX_RATIO = 3
+
+# a ratio is measured again this many times before failing: load on the machine can slow one measurement, but a
+# quadratic rule exceeds MAX_RATIO every time
+ATTEMPTS = 3
+
+EXPECTED = {"wide": (True, "All checks passed"), "dependency chain": (True, "All checks passed"),
+            "late double spend": (False, "Double-spent input"), "deep replay": (False, "Double-spent input")}
+
+def build(depth, num_txs):
+    """ Returns a new chain depth blocks deep and the worst-case blocks of num_txs transactions extending it. """
+    chain = blockchain.Blockchain()
+    with using_chain(chain):
+        return chain, worst_case_blocks(chain, depth, num_txs)
+
+def best_times(setups, repeat=7):
+    """ Validates the worst-case blocks of each (chain, cases) setup repeat times, alternating between the setups so
+    that changes in machine load affect them alike (and timing CPU time, so other processes do not count).
+
+    Returns:
+        (:obj:`list` of :obj:`dict`): For each setup, the fastest validation time and the verdict of each case, by name.
+    """
+    results = [{} for setup in setups]
+    gc.collect()
+    gc.disable() # (a collection that happens to land in one measurement would swamp it)
+    try:
+        for i in range(repeat):
+            for (chain, cases), result in zip(setups, results):
+                with using_chain(chain):
+                    for name, block, inputs in cases:
+                        elapsed, verdict = time_validation(chain, block, time.process_time)
+                        result[name] = min(elapsed, result.get(name, (elapsed,))[0]), verdict
+    finally:
+        gc.enable()
+    return results
+
+class StressTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.full = build(DEPTH, MAX_TXS)
+
+    def test_worst_case_verdicts(self):
+        for name, block, inputs in self.full[1]:
+            self.assertEqual(len(block.transactions), MAX_TXS, name)
+        for name, (elapsed, verdict) in best_times([self.full], 1)[0].items():
+            self.assertEqual(verdict, EXPECTED[name], name)
+
+    def assertScales(self, bigger, smaller):
+        """ Asserts that validating each case on the bigger setup takes less than MAX_RATIO times as long as on the
+        smaller one, and that both give the expected verdict. """
+        failing = list(EXPECTED)
+        for attempt in range(ATTEMPTS):
+            large, small = best_times([bigger, smaller])
+            for name in EXPECTED:
+                self.assertEqual((large[name][1], small[name][1]), (EXPECTED[name], EXPECTED[name]), name)
+            failing = [name for name in failing if large[name][0] >= MAX_RATIO * small[name][0]]
+            if not failing:
+                return
+        self.fail("Validation time grows faster than linearly: " + ", ".join(failing))
+
+    def test_linear_in_inputs(self):
+        self.assertScales(self.full, build(DEPTH, MAX_TXS // 2))
+
+    def test_linear_in_depth(self):
+        self.assertScales(build(2 * DEPTH, MAX_TXS), self.full)
+
+if __name__ == '__main__':
+    unittest.main()
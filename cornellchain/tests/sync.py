@@ -0,0 +1,147 @@
+import unittest
+import asyncio
+import threading
+import blockchain
+from blockchain.test_block import TestBlock
+from blockchain.transaction import Transaction, TransactionOutput
+from blockchain.header import BlockHeader
+from blockchain.node import Node
+from blockchain.sync import HeadersFirstSync, LocalBlockSource, SocketBlockSource, chain_locator
+
+class SyncTest(unittest.TestCase):
+
+    def build(self, chain, length, parent=None, mine=True, miner="Alice"):
+        """ Mines length blocks into chain on top of parent (or a new genesis block). """
+        blocks = []
+        if parent is None:
+            tx = Transaction([], [TransactionOutput("Genesis", miner, 100)])
+            parent = TestBlock(0, [tx], "genesis", is_genesis=True, chain=chain)
+            parent.mine()
+            self.assertTrue(chain.add_block(parent, save=False))
+            blocks.append(parent)
+        for i in range(length - len(blocks)):
+            tx = Transaction([miner + ":" + str(i)], [TransactionOutput(miner, miner, i)])
+            block = TestBlock(parent.height + 1, [tx], parent.hash, chain=chain)
+            if mine:
+                block.mine()
+            while not mine and block.seal_is_valid():
+                block.set_seal_data(block.seal_data + 1)
+            self.assertTrue(chain.add_block(block, save=False))
+            blocks.append(block)
+            parent = block
+        return blocks
+
+    def test_header_roundtrip_and_seal(self):
+        blocks = self.build(blockchain.Blockchain(), 3)
+        for block in blocks:
+            header = BlockHeader.from_block(block)
+            self.assertEqual(header.hash, block.hash)
+            self.assertEqual(header.header(), block.header())
+            self.assertTrue(header.seal_is_valid())
+            self.assertEqual(header.get_weight(), block.get_weight())
+        header.seal_data += 1
+        header.hash = header.calculate_hash()
+        self.assertNotEqual(header.hash, blocks[-1].hash)
+
+    def test_locator(self):
+        chain = blockchain.Blockchain()
+        blocks = self.build(chain, 40)
+        locator = chain_locator(chain)
+        self.assertEqual(locator[:10], [block.hash for block in reversed(blocks[-10:])])
+        self.assertEqual(locator[-1], blocks[0].hash)
+        self.assertLess(len(locator), 20)
+
+    def test_sync_from_local_sources(self):
+        source_chain = blockchain.Blockchain()
+        blocks = self.build(source_chain, 50)
+        local = blockchain.Blockchain()
+        local.add_block(blocks[0], save=False)
+        sources = [LocalBlockSource(source_chain) for i in range(3)]
+        syncer = HeadersFirstSync(local, sources, window=7, windows_ahead=3)
+        self.assertEqual(syncer.sync(), 49)
+        self.assertEqual(local.get_heaviest_chain_tip().hash, blocks[-1].hash)
+        self.assertEqual(syncer.sync(), 0) # already up to date
+
+    def test_headers_in_several_rounds(self):
+        long_chain = blockchain.Blockchain()
+        blocks = self.build(long_chain, 50)
+        fork_chain = blockchain.Blockchain()
+        fork_chain.add_block(blocks[0], save=False)
+        fork = self.build(fork_chain, 20, parent=blocks[0], miner="Bob")
+        local = blockchain.Blockchain()
+        local.add_block(blocks[0], save=False)
+        # the long chain comes 10 headers at a time, so its first answer is lighter than the fork
+        sources = [LocalBlockSource(long_chain, limit=10), LocalBlockSource(fork_chain)]
+        syncer = HeadersFirstSync(local, sources)
+        headers, best_sources = syncer.best_header_chain()
+        self.assertEqual([header.hash for header in headers], [block.hash for block in blocks[1:]])
+        self.assertEqual(best_sources, [sources[0]])
+        self.assertEqual(syncer.sync(), 49)
+        self.assertEqual(local.get_heaviest_chain_tip().hash, blocks[-1].hash)
+        self.assertNotIn(fork[-1].hash, local.headers)
+
+    def test_target_checked(self):
+        blocks = self.build(blockchain.Blockchain(), 3)
+        local = blockchain.Blockchain()
+        local.add_block(blocks[0], save=False)
+        syncer = HeadersFirstSync(local, [])
+        headers = [BlockHeader.from_block(block) for block in blocks[1:]]
+        # the starting weight is the parent's stored total, not a walk over its ancestors
+        local.get_chain_ending_with = lambda block_hash: self.fail("Walked the local chain")
+        self.assertEqual(syncer.validate_headers(headers), (True, "All checks passed", sum(block.get_weight() for block in blocks)))
+        # an easier target than the parent's, which the seal meets
+        headers[1].target = 2 ** 256
+        headers[1].hash = headers[1].calculate_hash()
+        self.assertTrue(headers[1].seal_is_valid())
+        self.assertEqual(syncer.validate_headers(headers)[:2], (False, "Invalid target"))
+
+    def test_picks_heaviest_valid_header_chain(self):
+        short_chain = blockchain.Blockchain()
+        common = self.build(short_chain, 5)
+        long_chain = blockchain.Blockchain()
+        evil_chain = blockchain.Blockchain()
+        for block in common:
+            long_chain.add_block(block, save=False)
+            evil_chain.add_block(block, save=False)
+        self.build(short_chain, 3, parent=common[-1], miner="Bob")
+        long_blocks = self.build(long_chain, 6, parent=common[-1], miner="Carol")
+        self.build(evil_chain, 20, parent=common[-1], mine=False, miner="Dave") # accepted by the always-valid TestBlock, but unsealed
+
+        local = blockchain.Blockchain()
+        for block in common[:2]:
+            local.add_block(block, save=False)
+        sources = [LocalBlockSource(chain) for chain in [short_chain, evil_chain, long_chain]]
+        syncer = HeadersFirstSync(local, sources)
+        headers, best_sources = syncer.best_header_chain()
+        self.assertEqual(headers[-1].hash, long_blocks[-1].hash)
+        self.assertEqual(best_sources, [sources[2]])
+        valid, message, weight = syncer.validate_headers([BlockHeader.from_block(block) for block in evil_chain.blocks.values() if not block.is_genesis])
+        self.assertEqual((valid, message), (False, "Invalid seal"))
+        syncer.sync()
+        self.assertEqual(local.get_heaviest_chain_tip().hash, long_blocks[-1].hash)
+
+    def test_sync_over_localhost_sockets(self):
+        source_chain = blockchain.Blockchain()
+        blocks = self.build(source_chain, 30)
+        loop = asyncio.new_event_loop()
+        nodes = [Node(source_chain) for i in range(2)]
+        for node in nodes:
+            loop.run_until_complete(node.start())
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        try:
+            local = blockchain.Blockchain()
+            sources = [SocketBlockSource("127.0.0.1", node.port) for node in nodes]
+            self.assertEqual(HeadersFirstSync(local, sources, window=4).sync(), 30)
+            self.assertEqual(local.get_heaviest_chain_tip().hash, blocks[-1].hash)
+            for source in sources:
+                source.close()
+        finally:
+            for node in nodes:
+                asyncio.run_coroutine_threadsafe(node.stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+import sys
+import pickle
+import transaction
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.transaction import Transaction, TransactionOutput, LegacyTransactionOutput
+from blockchain.storage import Database
+
+class TransactionOutputTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def test_output_api(self):
+        output = TransactionOutput("Alice", "Bob", 5)
+        self.assertEqual((output.sender, output.receiver, output.amount), ("Alice", "Bob", 5))
+        self.assertEqual(repr(output), repr(LegacyTransactionOutput("Alice", "Bob", 5)))
+        self.assertEqual(pickle.loads(pickle.dumps(output)), output)
+        self.assertIs(type(pickle.loads(pickle.dumps(output))), TransactionOutput)
+        self.assertFalse(hasattr(output, "__dict__"))
+        with self.assertRaises(AttributeError):
+            output.amount = 6
+
+    def test_migrate_legacy_outputs(self):
+        # write the chain the way older versions did: one record per output, under the TransactionOutput name
+        module = sys.modules[TransactionOutput.__module__] # (blockchain.transaction is the transaction package here)
+        module.TransactionOutput = LegacyTransactionOutput
+        LegacyTransactionOutput.__name__ = LegacyTransactionOutput.__qualname__ = "TransactionOutput"
+        try:
+            parent_hash, is_genesis, hashes = "genesis", True, []
+            for height in range(5):
+                txs = [Transaction(["input:" + str(height)], [LegacyTransactionOutput("Alice", "Bob", i), LegacyTransactionOutput("Alice", "Alice", 1)]) for i in range(4)]
+                block = TestBlock(height, txs, parent_hash, is_genesis=is_genesis)
+                self.assertTrue(self.test_chain.add_block(block, save=False))
+                hashes.append([tx.hash for tx in txs])
+                parent_hash, is_genesis = block.hash, False
+            del self.test_chain.inline_outputs
+            db = Database(None)
+            connection = db.open()
+            connection.root.blockchain = self.test_chain
+            transaction.commit()
+            connection.close()
+        finally:
+            module.TransactionOutput = TransactionOutput
+            LegacyTransactionOutput.__name__ = LegacyTransactionOutput.__qualname__ = "LegacyTransactionOutput"
+
+        records = len(db.storage)
+        connection = db.open()
+        connection.cacheMinimize()
+        chain = connection.root.blockchain
+        self.assertIsInstance(chain.all_transactions[hashes[0][0]].outputs[0], LegacyTransactionOutput)
+        self.assertTrue(chain.migrate())
+        self.assertFalse(chain.migrate())
+        transaction.commit()
+        db.pack()
+        self.assertEqual(records - len(db.storage), 5 * 4 * 2)
+
+        connection.cacheMinimize()
+        for tx_hashes in hashes:
+            for tx_hash in tx_hashes:
+                tx = chain.get_transaction(tx_hash)
+                self.assertTrue(all(type(output) is TransactionOutput for output in tx.outputs))
+                self.assertEqual(tx.calculate_hash(), tx_hash)
+        connection.close()
+        db.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import random
+import blockchain
+from blockchain.context import using_chain
+from blockchain.test_block import TestBlock
+from blockchain.utxo_index import UtxoIndex
+from blockchain.outpoint import hash_hex
+from blockchain.transaction import Transaction, TransactionOutput
+
+USERS = ["Alice", "Bob", "Carol"]
+
+class UtxoIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.rng = random.Random(0)
+        genesis_tx = Transaction([], [TransactionOutput("Genesis", user, 1000) for user in USERS])
+        self.genesis = TestBlock(0, [genesis_tx], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(self.genesis, save=False))
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def naive_utxos(self, tip_hash, user):
+        """ Scans every transaction on the chain ending in tip_hash for the user's unspent outputs. """
+        spent, outputs = set(), {}
+        for block_hash in reversed(self.test_chain.get_chain_ending_with(tip_hash)):
+            for tx in self.test_chain.blocks[block_hash].transactions:
+                spent.update(tx.input_refs)
+                for index, output in enumerate(tx.outputs):
+                    if output.receiver == user:
+                        outputs[tx.hash + ":" + str(index)] = output.amount
+        return sorted((input_ref, amount) for input_ref, amount in outputs.items() if input_ref not in spent)
+
+    def grow(self, parent, length):
+        """ Extends parent by length blocks of random payments, spending outputs in-block too; returns the last block. """
+        for i in range(length):
+            utxos = {user: self.test_chain.get_user_utxos(user, parent.hash) for user in USERS}
+            txs = []
+            for j in range(self.rng.randint(1, 6)):
+                sender, receiver = self.rng.choice(USERS), self.rng.choice(USERS)
+                if not utxos[sender]:
+                    continue
+                input_ref, amount = utxos[sender].pop(self.rng.randrange(len(utxos[sender])))
+                sent = self.rng.randint(0, amount)
+                tx = Transaction([input_ref], [TransactionOutput(sender, receiver, sent), TransactionOutput(sender, sender, amount - sent)])
+                txs.append(tx)
+                utxos[receiver].append((tx.hash + ":0", sent))
+                utxos[sender].append((tx.hash + ":1", amount - sent))
+            block = TestBlock(parent.height + 1, txs, parent.hash)
+            self.assertTrue(self.test_chain.add_block(block, save=False))
+            parent = block
+        return parent
+
+    def check(self, tip_hash=None):
+        for user in USERS:
+            expected = self.naive_utxos(tip_hash or self.test_chain.get_heaviest_chain_tip().hash, user)
+            self.assertEqual(sorted(self.test_chain.get_user_utxos(user, tip_hash)), expected)
+            if tip_hash is None:
+                self.assertEqual(self.test_chain.get_balance(user), sum(amount for input_ref, amount in expected))
+
+    def test_follows_best_chain(self):
+        tip = self.grow(self.genesis, 10)
+        self.check()
+        self.assertEqual(sum(self.test_chain.get_balance(user) for user in USERS), 3000)
+
+    def test_reorganization(self):
+        common = self.grow(self.genesis, 4)
+        short = self.grow(common, 3)
+        self.assertEqual(self.test_chain.utxos.tip, bytes.fromhex(short.hash))
+        long = self.grow(common, 5) # overtakes the short branch: 3 blocks disconnected, 5 connected
+        self.assertEqual(self.test_chain.utxos.tip, bytes.fromhex(long.hash))
+        self.check()
+        self.check(short.hash) # queries at a losing tip are answered from the fork path
+        self.assertEqual(len(self.test_chain.utxos.undo), 10)
+        # the stored best-chain marker follows the reorganization
+        chain = self.test_chain
+        self.assertEqual(chain.get_indexed_tip_hash(), long.hash)
+        best = chain.get_chain_ending_with(long.hash)
+        self.assertEqual([hash_hex(key) for key in reversed(chain.utxos.heights.values())], best)
+        self.assertTrue(all(chain.is_on_best_chain(block_hash) for block_hash in best))
+        self.assertFalse(any(chain.is_on_best_chain(block_hash) for block_hash in chain.get_chain_ending_with(short.hash)[:3]))
+        self.assertFalse(chain.is_on_best_chain("00" * 32))
+
+    def test_rebuild_matches_incremental(self):
+        common = self.grow(self.genesis, 3)
+        self.grow(common, 2)
+        self.grow(common, 4)
+        rebuilt = UtxoIndex()
+        self.assertEqual(rebuilt.update(self.test_chain, self.test_chain.get_heaviest_chain_tip_hash()), (0, 8))
+        for user in USERS:
+            self.assertEqual(dict(rebuilt.by_user[user].items()), dict(self.test_chain.utxos.by_user[user].items()))
+            self.assertEqual(rebuilt.get_balance(user), self.test_chain.get_balance(user))
+        heights = dict(self.test_chain.utxos.heights.items())
+        del self.test_chain.utxos.heights
+        self.assertTrue(self.test_chain.migrate())
+        self.assertEqual(dict(self.test_chain.utxos.heights.items()), heights)
+        del self.test_chain.utxos
+        self.assertTrue(self.test_chain.migrate())
+        self.check()
+
+if __name__ == '__main__':
+    unittest.main()
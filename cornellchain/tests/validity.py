@@ -3,6 +3,7 @@ import blockchain
 import time
 from blockchain.util import sha256_2_string
 from blockchain.pow_block import PoWBlock
+from blockchain.context import using_chain
 from blockchain.transaction import Transaction, TransactionOutput
 
 class TestBlock(PoWBlock):
@@ -30,11 +31,12 @@ class ValidityTest(unittest.TestCase):
 
     def setUp(self):
         self.test_chain = blockchain.Blockchain()
-        self.old_chain = blockchain.chain # PoW chains need to look up difficulty in the db, so shadow the global DB blockchain w our test chain
-        blockchain.chain = self.test_chain
+        # PoW blocks look up difficulty in the current chain, so make our test chain current in this thread
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
 
     def tearDown(self):
-        blockchain.chain = self.old_chain # restore original chain
+        self.context.__exit__(None, None, None)
 
     def test_rejects_invalid_merkle(self):
         tx1 = Transaction([], [TransactionOutput("Alice", "Bob", 1), TransactionOutput("Alice", "Alice", 1)])
@@ -0,0 +1,88 @@
+import unittest
+import blockchain
+from blockchain.pow_block import PoWBlock
+from blockchain.context import using_chain
+from blockchain.transaction import Transaction, TransactionOutput
+from blockchain.verdicts import VerdictCache, tx_verdicts
+
+class UnsealedBlock(PoWBlock):
+    """ PoW block that need not be mined, so validation runs every other rule. """
+
+    def seal_is_valid(self):
+        return True
+
+    def calculate_appropriate_target(self):
+        return int(2 ** 256)
+
+class VerdictCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        self.funding = Transaction([], [TransactionOutput("Genesis", "Alice", 10), TransactionOutput("Genesis", "Bob", 10)])
+        self.genesis = UnsealedBlock(0, [self.funding], "genesis", is_genesis=True)
+        self.assertTrue(self.test_chain.add_block(self.genesis))
+        self.test_chain.get_block_verdicts().clear()
+        tx_verdicts.clear()
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+
+    def payment(self, amount):
+        return Transaction([self.funding.hash + ":0"], [TransactionOutput("Alice", "Bob", amount), TransactionOutput("Alice", "Alice", 10 - amount)])
+
+    def test_siblings_share_transaction_verdicts(self):
+        shared = self.payment(4)
+        bob = Transaction([self.funding.hash + ":1"], [TransactionOutput("Bob", "Carol", 5), TransactionOutput("Bob", "Bob", 5)])
+        first = UnsealedBlock(1, [shared], self.genesis.hash)
+        second = UnsealedBlock(1, [shared, bob], self.genesis.hash)
+        self.assertTrue(first.is_valid()[0])
+        self.assertTrue(second.is_valid()[0])
+        stats = self.test_chain.get_validation_stats()
+        self.assertEqual((stats["transactions"]["hits"], stats["transactions"]["misses"]), (1, 2))
+        self.assertEqual(stats["transactions"]["hit_rate"], 1 / 3)
+        self.assertEqual(stats["blocks"]["misses"], 2)
+
+    def test_cached_failures_keep_their_messages(self):
+        greedy = Transaction([self.funding.hash + ":0"], [TransactionOutput("Alice", "Bob", 8), TransactionOutput("Alice", "Alice", 8)])
+        for extra in [[], [Transaction([self.funding.hash + ":1"], [TransactionOutput("Bob", "Bob", 10)])]]:
+            block = UnsealedBlock(1, [greedy] + extra, self.genesis.hash)
+            self.assertEqual(block.is_valid(), (False, "Creating money"))
+        self.assertEqual(tx_verdicts.stats()["hits"], 1)
+
+        # context-dependent checks on earlier inputs still come first
+        self.assertTrue(self.test_chain.add_block(UnsealedBlock(1, [self.payment(4)], self.genesis.hash)))
+        tip = self.test_chain.get_heaviest_chain_tip()
+        self.assertEqual(UnsealedBlock(2, [greedy], tip.hash).is_valid(), (False, "Double-spent input"))
+
+    def test_missing_inputs_are_not_cached(self):
+        pending = Transaction([self.funding.hash + ":1"], [TransactionOutput("Bob", "Carol", 3), TransactionOutput("Bob", "Bob", 7)])
+        spend = Transaction([pending.hash + ":0"], [TransactionOutput("Carol", "Dave", 3)])
+        self.assertEqual(UnsealedBlock(1, [spend], self.genesis.hash).is_valid(), (False, "Required output not found"))
+        self.assertEqual(tx_verdicts.stats()["verdicts"], 0) # the spent transaction may still arrive
+        self.assertTrue(self.test_chain.add_block(UnsealedBlock(1, [pending], self.genesis.hash)))
+        tip = self.test_chain.get_heaviest_chain_tip()
+        self.assertTrue(UnsealedBlock(2, [spend], tip.hash).is_valid()[0])
+
+    def test_block_verdicts_last_until_next_block(self):
+        block = UnsealedBlock(1, [self.payment(4)], self.genesis.hash)
+        self.assertTrue(block.is_valid()[0])
+        self.assertTrue(block.is_valid()[0])
+        verdicts = self.test_chain.get_block_verdicts()
+        self.assertEqual((verdicts.hits, verdicts.misses), (1, 1))
+        sibling = UnsealedBlock(1, [self.payment(5)], self.genesis.hash)
+        self.assertTrue(self.test_chain.add_block(sibling))
+        self.assertTrue(block.is_valid()[0]) # the chain changed, so the block is checked again
+        self.assertEqual(verdicts.misses, 3)
+
+    def test_bounded(self):
+        cache = VerdictCache(2)
+        for key in range(3):
+            cache.put(key, (True, "All checks passed"))
+        self.assertIsNone(cache.get(0)) # least recently used, evicted
+        self.assertEqual(cache.get(2), (True, "All checks passed"))
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "evictions": 1, "hit_rate": 0.5, "verdicts": 2})
+
+if __name__ == '__main__':
+    unittest.main()
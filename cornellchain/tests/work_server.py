@@ -0,0 +1,106 @@
+import socket
+import asyncio
+import unittest
+import blockchain
+from blockchain.context import using_chain
+from blockchain.pow_block import PoWBlock
+from blockchain.protocol import send_message, recv_message
+from blockchain.transaction import Transaction, TransactionOutput
+from blockchain.node import Node
+from blockchain.work_server import WorkServer, run_miner, search_nonces
+
+class WorkServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.test_chain = blockchain.Blockchain()
+        self.context = using_chain(self.test_chain)
+        self.context.__enter__()
+        # PoW genesis target is 2^248, so a block takes about 256 hashes
+        genesis = PoWBlock(0, [Transaction([], [TransactionOutput("Genesis", "Alice", 1)])], "genesis", is_genesis=True)
+        genesis.mine()
+        self.assertTrue(self.test_chain.add_block(genesis, save=False))
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.context.__exit__(None, None, None)
+
+    def test_search_nonces(self):
+        block = PoWBlock(1, [], self.test_chain.get_heaviest_chain_tip_hash())
+        nonce, tried = search_nonces(block.unsealed_header(), block.target, 0, 100000)
+        self.assertEqual(tried, nonce + 1)
+        block.set_seal_data(nonce)
+        self.assertTrue(block.seal_is_valid())
+        for earlier in range(nonce):
+            block.set_seal_data(earlier)
+            self.assertFalse(block.seal_is_valid())
+
+    def test_miners_extend_chain(self):
+        async def scenario():
+            server = WorkServer(self.test_chain, range_size=64)
+            await server.start()
+            miners = [self.loop.run_in_executor(None, run_miner, "127.0.0.1", server.port, 3) for i in range(3)]
+            found = await asyncio.gather(*miners)
+            stats = server.stats()
+            await server.stop()
+            return found, stats
+        found, stats = self.loop.run_until_complete(scenario())
+        self.assertEqual(sum(found), 9)
+        self.assertEqual(stats["blocks_found"], 9)
+        self.assertEqual(self.test_chain.get_heaviest_chain_tip().height, 9)
+        self.assertGreater(stats["hashes"], 0)
+        self.assertGreater(stats["hashrate"], 0)
+        self.assertGreaterEqual(stats["jobs"], 10) # a new job for every new tip
+
+    def test_mining_through_node(self):
+        async def scenario():
+            node = Node(self.test_chain)
+            server = WorkServer(node=node, range_size=64)
+            await server.start()
+            found = await self.loop.run_in_executor(None, run_miner, "127.0.0.1", server.port, 2)
+            await server.stop()
+            await node.stop()
+            return found
+        self.assertEqual(self.loop.run_until_complete(scenario()), 2)
+        self.assertEqual(self.test_chain.get_heaviest_chain_tip().height, 2)
+
+    def test_ranges_and_submissions(self):
+        async def scenario():
+            server = WorkServer(self.test_chain, range_size=1000)
+            await server.start()
+
+            def client():
+                sock = socket.create_connection(("127.0.0.1", server.port))
+                send_message(sock, {"type": "getwork"})
+                first = recv_message(sock)
+                send_message(sock, {"type": "getwork", "hashes": 1000})
+                second = recv_message(sock)
+                target = int(second["target"], 16)
+                invalid = next(nonce for nonce in range(100000) if search_nonces(second["header"], target, nonce, nonce + 1)[0] is None)
+                send_message(sock, {"type": "submit", "job_id": second["job_id"], "nonce": invalid})
+                results = [recv_message(sock), recv_message(sock)] # result, then a new range
+                nonce = search_nonces(second["header"], target, 0, 100000)[0]
+                send_message(sock, {"type": "submit", "job_id": second["job_id"], "nonce": nonce})
+                messages = [recv_message(sock) for i in range(2)] # pushed job, result (and no second job)
+                send_message(sock, {"type": "submit", "job_id": second["job_id"], "nonce": nonce})
+                messages.append(recv_message(sock))
+                sock.close()
+                return first, second, results, messages
+            outcome = await self.loop.run_in_executor(None, client)
+            stats = server.stats()
+            await server.stop()
+            return outcome, stats
+        (first, second, results, messages), stats = self.loop.run_until_complete(scenario())
+        self.assertEqual((first["start"], first["end"], second["start"], second["end"]), (0, 1000, 1000, 2000))
+        self.assertEqual(results[0]["accepted"], False)
+        self.assertEqual(results[1]["type"], "job")
+        self.assertEqual([message["type"] for message in messages], ["job", "result", "result"])
+        result = [message for message in messages if message["type"] == "result"]
+        self.assertEqual([message["accepted"] for message in result], [True, False])
+        self.assertEqual(result[1]["message"], "Stale job")
+        self.assertEqual(result[0]["message"], self.test_chain.get_heaviest_chain_tip_hash())
+        self.assertTrue(all(message["job_id"] == second["job_id"] + 1 for message in messages if message["type"] == "job"))
+        self.assertEqual((stats["blocks_found"], stats["stale"], stats["hashes"]), (1, 1, 1000))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,26 @@
+import os
 import config
+if config.STORAGE == "zeo":
+    config.STORAGE_READ_ONLY = True # explorer workers only read; the one writer shares the storage server with them
 import ZODB, ZODB.FileStorage
 import transaction
-import importlib
-from flask import Flask, render_template
+import json
+import threading
+import time
+from flask import Flask, Response, render_template, jsonify, request, redirect, abort, make_response, stream_with_context
+from markupsafe import Markup, escape
+from blockchain.utxo_index import fork_path
+from webapp.fragment_cache import FragmentCache
 app = Flask(__name__)
 
+# rendered blocks, reused across requests (blocks never change once added)
+fragments = FragmentCache(config.FRAGMENT_CACHE_BYTES)
+# stands in a cached fragment for the block's validity, which depends on the rest of the chain (see render_block)
+VALID_MARKER = Markup("<!-- valid -->")
+
+# requests share the one global database connection (see read_chain), so only one thread may use it at a time
+chain_lock = threading.RLock()
+
 def get_all_blockhashes(chain):
     block_hashes = []
     for height in chain.get_heights_with_blocks():
@@ -14,22 +30,75 @@ def get_all_blockhashes(chain):
     return block_hashes
 
 def get_best_chain_blockhashes(chain):
-    return chain.get_chain_ending_with(chain.get_heaviest_chain_tip().hash)
+    tip_hash = chain.get_indexed_tip_hash()
+    return chain.get_chain_ending_with(tip_hash) if tip_hash is not None else []
 
-def render_chain(block_hashes_function):
+def storage_etag():
+    """ Names the committed state of the database: with a storage server, the id of the last transaction it
+    told us about; with a FileStorage, which only ever appends (or packs), the file's size and modification time.
+    """
+    if config.STORAGE == "zeo":
+        import blockchain
+        return blockchain.db.lastTransaction().hex()
+    stat = os.stat(config.DB_PATH)
+    return "%x-%x" % (stat.st_size, stat.st_mtime_ns)
+
+def read_chain(view_function):
+    """ Returns view_function(chain) for the latest committed chain.
+
+    With a storage server, the database stays open across requests, so the object cache (and the chain's volatile
+    indexes) are kept, and each request starts a new transaction: that moves to the latest snapshot, invalidating
+    the objects the writer changed since. A FileStorage is locked to one process and does not notice commits by
+    others, so in "file" mode it is opened for each request and closed again afterwards, leaving it to other
+    processes in between.
+    """
     import blockchain
-    blockchain.connection.close()
-    blockchain.db.close()
-    importlib.reload(blockchain)
-    chain = blockchain.chain
+    with chain_lock:
+        if config.STORAGE == "zeo":
+            blockchain.connection.transaction_manager.begin() # (the read-only connection has its own, see blockchain.open_chain)
+            if hasattr(blockchain.connection.root, "blockchain"):
+                blockchain.chain = blockchain.connection.root.blockchain # the writer may have created it since we connected
+            return view_function(blockchain.chain)
+        blockchain.close_chain()
+        try:
+            return view_function(blockchain.open_chain())
+        finally:
+            blockchain.close_chain()
 
-    block_hashes = block_hashes_function(chain)
+def with_chain(view_function):
+    """ Returns the response of view_function(chain) for the latest chain.
 
-    weights=chain.get_all_block_weights()
-    output = render_template('chain.html', block_hashes=block_hashes, chain=chain, weights=weights)
-    blockchain.connection.close()
-    blockchain.db.close()
-    return output
+    Every view depends only on the URL and the chain, so responses carry an ETag naming the database state,
+    and a request whose If-None-Match still matches it is answered 304 without reading the chain.
+    """
+    etag = storage_etag()
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(read_chain(view_function))
+    response.set_etag(etag)
+    return response
+
+def render_block(chain, block_hash, on_best, show_transactions=False):
+    """ Returns the HTML of one block from the fragment cache. Best chain membership is part of the key, since a
+    reorganization changes it. The block's validity can change whenever blocks are added or pruned, so it is left
+    out of the cached fragment and checked on every call (Block.is_valid keeps verdicts while they hold).
+    """
+    block = chain.get_block(block_hash)
+    def render():
+        return render_template('_block.html', block=block, total_weight=chain.get_total_weight(block_hash),
+                               on_best=on_best, show_transactions=show_transactions, valid=VALID_MARKER)
+    fragment = fragments.get((block_hash, on_best, show_transactions), render)
+    return fragment.replace(VALID_MARKER, escape(str(block.is_valid(chain))), 1)
+
+def render_chain(block_hashes_function):
+    def render(chain):
+        block_hashes = block_hashes_function(chain)
+        return render_template('chain.html', fragments=[render_block(chain, block_hash, chain.is_on_best_chain(block_hash))
+                                                        for block_hash in block_hashes],
+                               view=block_hashes_function.__name__, next_event=chain.get_block_log_length(),
+                               tip=chain.get_indexed_tip_hash())
+    return with_chain(render)
 
 @app.route('/')
 def full_chain_view():
@@ -38,3 +107,122 @@ def full_chain_view():
 @app.route('/best')
 def best_chain_view():
     return render_chain(get_best_chain_blockhashes)
+
+@app.route('/user/<name>')
+def user_view(name):
+    return with_chain(lambda chain: render_template('user.html', name=name, balance=chain.get_balance(name),
+                                                    utxos=chain.get_user_utxos(name)))
+
+@app.route('/api/user/<name>/utxos')
+def user_utxos_api(name):
+    def utxos(chain):
+        return jsonify(user=name, balance=chain.get_balance(name),
+                       utxos=[{"input_ref": input_ref, "amount": amount} for input_ref, amount in chain.get_user_utxos(name)])
+    return with_chain(utxos)
+
+def render_blocks(chain, block_hashes, description):
+    """ Renders just the given blocks, with their transactions shown; best chain membership comes from the stored
+    marker (see Blockchain.is_on_best_chain), so the cost does not grow with the chain.
+    """
+    return render_template('block.html', description=description,
+                           fragments=[render_block(chain, block_hash, chain.is_on_best_chain(block_hash), True)
+                                      for block_hash in block_hashes])
+
+@app.route('/block/<block_hash>')
+def block_view(block_hash):
+    def render(chain):
+        if block_hash not in chain.headers:
+            abort(404)
+        return render_blocks(chain, [block_hash], "with hash " + block_hash)
+    return with_chain(render)
+
+@app.route('/height/<int:height>')
+def height_view(height):
+    def render(chain):
+        block_hashes = chain.get_blockhashes_at_height(height) if height in chain.chain else []
+        return render_blocks(chain, block_hashes, "at height " + str(height))
+    return with_chain(render)
+
+@app.route('/tx/<tx_hash>')
+def tx_view(tx_hash):
+    def render(chain):
+        try:
+            tx = chain.get_transaction(tx_hash) # (pruned transactions are read from the archive)
+        except KeyError:
+            abort(404)
+        spending = [chain.blocks_spending_input.get(tx.hash + ":" + str(index), []) for index in range(len(tx.outputs))]
+        return render_template('tx.html', tx=tx, chain=chain, block_hashes=chain.get_blocks_containing_tx(tx_hash), spending=spending)
+    return with_chain(render)
+
+SEARCH_LIMIT = 50
+
+@app.route('/search')
+def search_view():
+    prefix = request.args.get('q', '').strip()
+    def render(chain):
+        results = chain.search_hashes(prefix, SEARCH_LIMIT) if prefix else []
+        if len(results) == 1:
+            kind, result_hash = results[0]
+            return redirect('/' + kind + '/' + result_hash)
+        return render_template('search.html', prefix=prefix, results=results, limit=SEARCH_LIMIT)
+    return with_chain(render)
+
+def sse_message(event, data, event_id=None):
+    """ Encodes one server-sent event (data as JSON). """
+    message = "event: " + event + "\n" + "data: " + json.dumps(data) + "\n\n"
+    return message if event_id is None else "id: " + str(event_id) + "\n" + message
+
+def chain_events(chain, next_event, tip):
+    """ Collects the events a client that has seen the first next_event blocks and the given tip is missing.
+
+    Returns:
+        (:obj:`list` of str, int, str): The encoded events, and the new next_event and tip.
+    """
+    messages = []
+    new_tip = chain.get_indexed_tip_hash()
+    added = chain.get_blocks_added_since(next_event)
+    if added:
+        for sequence, block_hash in added:
+            if block_hash not in chain.headers:
+                continue # a stale fork block since pruned (block_log keeps its history)
+            header = chain.headers[block_hash]
+            on_best = chain.is_on_best_chain(block_hash)
+            html = render_block(chain, block_hash, on_best)
+            messages.append(sse_message("block", {"hash": block_hash, "height": header.height, "best": on_best,
+                                                  "html": html}, sequence + 1))
+        next_event = added[-1][0] + 1
+    if new_tip != tip:
+        disconnected, connected = fork_path(chain, tip, new_tip) if tip is not None and tip in chain.headers else ([], [])
+        messages.append(sse_message("tip", {"hash": new_tip, "height": chain.headers[new_tip].height,
+                                            "disconnected": [header.hash for header in disconnected],
+                                            "connected": [header.hash for header in connected]}))
+    return messages, next_event, new_tip
+
+@app.route('/events')
+def events_stream():
+    """ Server-sent events: a "block" event (with the block's rendered HTML) for every block added after the
+    client's position in the chain's block log, and a "tip" event whenever the heaviest tip changes.
+    The chain is only read again when the storage changes (see storage_etag); reconnecting clients resume from Last-Event-ID.
+    A position that is not a non-negative integer is answered 400.
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since', '0')
+    if not (since.isascii() and since.isdigit()):
+        abort(400)
+    next_event = int(since)
+    tip = request.args.get('tip')
+    def stream():
+        position, current_tip, state, idle = next_event, tip, None, 0.0
+        while True:
+            current = storage_etag()
+            if current != state:
+                state = current
+                messages, position, current_tip = read_chain(lambda chain: chain_events(chain, position, current_tip))
+                for message in messages:
+                    yield message
+                idle = 0.0
+            elif idle >= config.EVENT_KEEPALIVE_SECONDS:
+                yield ": keep-alive\n\n" # lets the server notice clients that went away
+                idle = 0.0
+            time.sleep(config.EVENT_POLL_SECONDS)
+            idle += config.EVENT_POLL_SECONDS
+    return Response(stream_with_context(stream()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
@@ -0,0 +1,61 @@
+import collections
+
+class FragmentCache(object):
+
+    def __init__(self, max_bytes):
+        """ Least-recently-used cache of rendered HTML fragments, bounded by their total size.
+
+        Args:
+            max_bytes (int): Maximum total length of the cached fragments.
+
+        Attributes:
+            size (int): Total length of the cached fragments.
+            hits (int): Lookups answered from the cache.
+            misses (int): Lookups that had to render.
+            evictions (int): Fragments dropped to stay within budget.
+        """
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict() # key -> fragment
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, render):
+        """ Returns the fragment cached under key, or renders, caches and returns it.
+
+        Args:
+            key: Hashable description of everything the fragment depends on.
+            render (function): Called without arguments to render the fragment (a str) on a miss.
+
+        Returns:
+            str: The fragment.
+        """
+        fragment = self.entries.get(key)
+        if fragment is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+        self.misses += 1
+        fragment = render()
+        if len(fragment) <= self.max_bytes:
+            self.entries[key] = fragment
+            self.size += len(fragment)
+            self._evict()
+        return fragment
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            key, fragment = self.entries.popitem(last=False)
+            self.size -= len(fragment)
+            self.evictions += 1
+
+    def clear(self):
+        """ Drops every cached fragment. """
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self):
+        """ Returns hit/miss/eviction counters and current occupancy as a dict. """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "fragments": len(self.entries), "size": self.size}